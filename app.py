@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, redirect, url_for, session, send_from_directory
+from flask import Flask, request, jsonify, redirect, url_for, session, send_from_directory, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from datetime import datetime, timedelta
@@ -9,9 +9,10 @@ from authlib.integrations.flask_client import OAuth
 import json
 import requests
 import uuid
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, update
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm.attributes import set_committed_value
 import numpy as np
 from flask_session import Session
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
@@ -21,14 +22,30 @@ from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
 import time
 import ipaddress
+import threading
+from types import SimpleNamespace
 from functools import wraps
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 
 # Import models
+from migrations import run_migrations
 from models import db, User, ChatMessage, TrainingData, UserProfile, UserPreferences, ChatSession, Feedback, ChatSummary, UserAnalytics
 
 # Import NLP module
 from nlp_module import EmotionAnalyzer, ResponseGenerator
+from fallback_engine import FallbackEngine
+from training_store import TrainingStore, DEFAULT_DATA_PATH as DEFAULT_TRAINING_DATA_PATH
+from retrieval import pack_embedding
+from intent_model import IntentClassifier, DEFAULT_MODEL_PATH as DEFAULT_INTENT_MODEL_PATH
+from chat_pipeline import ChatPipeline
+from job_queue import JobQueue
+from session_summarizer import SessionSummarizer
+from enrichment import enrich_turns
+from session_stats import STAT_FIELDS, KeywordSketch, record_message, rebuild_stats, reset_stats, session_card, session_mood
+from session_cache import SessionCache, session_row
+from pagination import encode_cursor, decode_cursor, decode_sync_cursor, keyset_page, page_size, sync_cursor
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 
 # Configure logging
 logging.basicConfig(
@@ -53,7 +70,9 @@ app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
 app.config['SESSION_TYPE'] = 'filesystem'
 app.config['SESSION_PERMANENT'] = False
-app.config['SESSION_FILE_DIR'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flask_session')
+app.config['SESSION_FILE_DIR'] = os.getenv(
+    'SESSION_FILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flask_session')
+)
 Session(app)
 
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'super-secret-key')
@@ -91,6 +110,10 @@ try:
     db.init_app(app)
     with app.app_context():
         db.create_all()
+        try:
+            run_migrations(db.engine, db.metadata)
+        except Exception as e:
+            logger.error(f"Database migration failed: {str(e)}")
         USE_DATABASE = True
         logger.info("Database initialized successfully")
 except Exception as e:
@@ -126,16 +149,108 @@ client = None
 emotion_analyzer = None
 response_generator = None
 
+def load_training_rows():
+    """TrainingData rows for the training store (empty without a database)"""
+    if not USE_DATABASE:
+        return []
+    try:
+        with app.app_context():
+            return TrainingData.query.all()
+    except Exception as e:
+        logger.error(f"Failed to load training examples: {str(e)}")
+        return []
+
+def training_rows_version():
+    """Cheap fingerprint of the training_data table; a change triggers a reload"""
+    if not USE_DATABASE:
+        return None
+    with app.app_context():
+        # max(updated_at) catches edited rows and a deleted row replaced by a new one
+        return tuple(db.session.query(
+            func.count(TrainingData.id), func.max(TrainingData.id), func.max(TrainingData.updated_at)
+        ).one())
+
+def save_training_embeddings(computed):
+    """Persist embeddings the training store had to compute as packed float32 blobs"""
+    with app.app_context():
+        for row, embedding in computed:
+            # Caching an embedding is not an edit: keep updated_at so the fingerprint (and the store) stays put
+            db.session.execute(
+                update(TrainingData).where(TrainingData.id == row.id).values(
+                    embedding_vector=pack_embedding(embedding), embedding=None, updated_at=TrainingData.updated_at
+                )
+            )
+        db.session.commit()
+
+# Keyword tables and RAG examples: compiled snapshots, reloaded when the file or table changes
+training_store = TrainingStore(
+    os.getenv('TRAINING_DATA_PATH', DEFAULT_TRAINING_DATA_PATH),
+    load_rows=load_training_rows,
+    rows_version=training_rows_version,
+    save_embeddings=save_training_embeddings,
+    retrieval_backend=os.getenv('RAG_RETRIEVAL', 'vector'),
+    minhash_permutations=int(os.getenv('MINHASH_PERMUTATIONS', '64')),
+    minhash_bands=int(os.getenv('MINHASH_BANDS', '16')),
+    embedding_snapshot_dir=os.getenv('EMBEDDING_SNAPSHOT_DIR', app.instance_path)
+)
+training_store.start_watching(float(os.getenv('TRAINING_RELOAD_INTERVAL', '30')))
+
+# Local replies when GROQ is unavailable; rendered per profile and cached
+fallback_engine = FallbackEngine(lambda text: training_store.snapshot.lexicon.match(text))
+
+# Local intent model; GROQ is only asked when its confidence is below the threshold
+INTENT_MODEL_PATH = os.getenv('INTENT_MODEL_PATH', DEFAULT_INTENT_MODEL_PATH)
+INTENT_MODEL_THRESHOLD = float(os.getenv('INTENT_MODEL_THRESHOLD', '0.6'))
+intent_model = None
+try:
+    if os.path.exists(INTENT_MODEL_PATH):
+        intent_model = IntentClassifier.load(INTENT_MODEL_PATH)
+        logger.info(f"Loaded local intent model from {INTENT_MODEL_PATH}")
+except Exception as e:
+    logger.error(f"Failed to load local intent model: {str(e)}")
+
+# Shared pool for the concurrent stages of a chat turn
+CHAT_PIPELINE_WORKERS = int(os.getenv('CHAT_PIPELINE_WORKERS', '8'))
+pipeline_executor = ThreadPoolExecutor(max_workers=CHAT_PIPELINE_WORKERS, thread_name_prefix='chat-pipeline')
+# GROQ-bound stages get their own pool so a slow upstream cannot starve the profile/history stages
+LLM_PIPELINE_WORKERS = int(os.getenv('LLM_PIPELINE_WORKERS', str(CHAT_PIPELINE_WORKERS)))
+llm_executor = ThreadPoolExecutor(max_workers=LLM_PIPELINE_WORKERS, thread_name_prefix='chat-llm')
+# Latency budget for a chat turn; past it the user gets the local fallback (0 disables)
+CHAT_DEADLINE_SECONDS = float(os.getenv('CHAT_DEADLINE_SECONDS', '15'))
+
 # Initialize Groq client with better error handling
 try:
     if GROQ_API_KEY:
-        from groq import Groq
-        client = Groq(api_key=GROQ_API_KEY)
+        from llm_client import ResilientGroq
+        client = ResilientGroq(
+            api_key=GROQ_API_KEY,
+            base_url=os.getenv('GROQ_BASE_URL'),
+            connect_timeout=float(os.getenv('GROQ_CONNECT_TIMEOUT', '3')),
+            read_timeout=float(os.getenv('GROQ_READ_TIMEOUT', '30')),
+            # Pipeline workers plus request threads can call GROQ at the same time
+            max_connections=int(os.getenv('GROQ_MAX_CONNECTIONS', str(2 * CHAT_PIPELINE_WORKERS))),
+            max_retries=int(os.getenv('GROQ_MAX_RETRIES', '2')),
+            failure_threshold=int(os.getenv('GROQ_BREAKER_THRESHOLD', '5')),
+            reset_timeout=float(os.getenv('GROQ_BREAKER_RESET', '30'))
+        )
         logger.info("Successfully initialized Groq client")
         
         # Initialize NLP components
-        emotion_analyzer = EmotionAnalyzer(client)
-        response_generator = ResponseGenerator(client, emotion_analyzer)
+        emotion_analyzer = EmotionAnalyzer(
+            client,
+            intent_cache_size=int(os.getenv('INTENT_CACHE_SIZE', '2048')),
+            intent_cache_ttl=float(os.getenv('INTENT_CACHE_TTL', '3600')),
+            intent_model=intent_model,
+            intent_model_threshold=INTENT_MODEL_THRESHOLD,
+            intent_log_path=os.getenv('INTENT_LOG_PATH'),
+            training_store=training_store
+        )
+        response_generator = ResponseGenerator(
+            client,
+            emotion_analyzer,
+            history_token_budget=int(os.getenv('PROMPT_HISTORY_TOKENS', '800')),
+            fallback_engine=fallback_engine
+        )
         logger.info("Successfully initialized NLP components")
     else:
         logger.warning("GROQ_API_KEY not set, using fallback responses")
@@ -143,6 +258,37 @@ except Exception as e:
     logger.error(f"Failed to initialize Groq client: {str(e)}")
     client = None
 
+# End-of-session summaries are written by durable background jobs so end_session never waits on GROQ
+session_summarizer = SessionSummarizer(
+    client,
+    chunk_tokens=int(os.getenv('SUMMARY_CHUNK_TOKENS', '3000'))
+) if client else None
+# Worker threads bound how many jobs (and background GROQ calls) run at once in this process (0 disables)
+job_queue = JobQueue(
+    app,
+    db,
+    workers=int(os.getenv('JOB_WORKERS', '2')),
+    poll_interval=float(os.getenv('JOB_POLL_INTERVAL', '2')),
+    lease_seconds=float(os.getenv('JOB_LEASE_SECONDS', '600')),
+    retry_base=float(os.getenv('JOB_RETRY_SECONDS', '30'))
+)
+
+# Messages loaded per turn for prompt context; older ones are covered by the rolling summary
+HISTORY_WINDOW_MESSAGES = int(os.getenv('HISTORY_WINDOW_MESSAGES', '20'))
+# Active sessions and their latest messages, so consecutive turns on this process skip those reads
+session_cache = SessionCache(
+    max_sessions=int(os.getenv('SESSION_CACHE_SIZE', '1024')),
+    window=HISTORY_WINDOW_MESSAGES,
+    check_interval=float(os.getenv('SESSION_CACHE_CHECK_SECONDS', '30'))
+)
+# Rolling session summary, refreshed in the background every N exchanges (0 disables)
+ROLLING_SUMMARY_TURNS = int(os.getenv('ROLLING_SUMMARY_TURNS', '6'))
+# Longest a write may take from stamping a message or session change to committing it;
+# ``since`` deltas return the changes of this window again so none commit behind a cursor
+SYNC_OVERLAP_SECONDS = float(os.getenv('SYNC_OVERLAP_SECONDS', '60'))
+rolling_summary_in_flight = set()
+rolling_summary_lock = threading.Lock()
+
 def hash_password(password):
     """Hash password with salt"""
     salt = secrets.token_hex(16)
@@ -200,30 +346,27 @@ def get_user_data(user_id):
             return user
     return None
 
-def get_conversation_history(user_id, session_id=None):
-    """Get conversation history"""
+def get_conversation_history(user_id, session_id=None, limit=None):
+    """The latest ``limit`` messages (default HISTORY_WINDOW_MESSAGES) of the session, oldest first"""
+    limit = limit or HISTORY_WINDOW_MESSAGES
     if USE_DATABASE:
         try:
             with app.app_context():
-                if session_id:
-                    db_messages = ChatMessage.query.filter_by(
-                        session_id=session_id
-                    ).order_by(ChatMessage.timestamp.asc()).all()
-                else:
-                    active_session = ChatSession.query.filter_by(
+                if not session_id:
+                    session_id = db.session.query(ChatSession.session_id).filter_by(
                         user_id=user_id, status='active'
-                    ).first()
-                    if active_session:
-                        db_messages = ChatMessage.query.filter_by(
-                            session_id=active_session.session_id
-                        ).order_by(ChatMessage.timestamp.asc()).all()
-                    else:
+                    ).limit(1).scalar()
+                    if not session_id:
                         return []
-                return [msg.to_dict() for msg in db_messages]
+                # Newest first through the (session_id, timestamp) index, so the cost does not grow with the session
+                db_messages = ChatMessage.query.filter_by(
+                    session_id=session_id
+                ).order_by(ChatMessage.timestamp.desc()).limit(limit).all()
+                # Stored emotion vectors ride along for trajectory analysis (not part of to_dict)
+                return [dict(msg.to_dict(), emotion_vector=msg.emotion_vector) for msg in reversed(db_messages)]
         except Exception as e:
             logger.error(f"Database error getting conversation history: {str(e)}")
-            return [msg for msg in messages if msg.get('user_id') == user_id]
-    return [msg for msg in messages if msg.get('user_id') == user_id]
+    return [msg for msg in messages if msg.get('user_id') == user_id][-limit:]
 
 def store_message(message_data):
     """Store message in database or memory"""
@@ -231,8 +374,12 @@ def store_message(message_data):
         try:
             with app.app_context():
                 new_message = ChatMessage(**message_data)
+                chat_session = ChatSession.query.get(new_message.session_id)
+                if chat_session:
+                    record_session_messages(chat_session, [new_message])
                 db.session.add(new_message)
                 db.session.commit()
+                session_cache.invalidate(new_message.user_id)
                 return new_message.to_dict()
         except Exception as e:
             logger.error(f"Database error storing message: {str(e)}")
@@ -242,8 +389,339 @@ def store_message(message_data):
         messages.append(message_data)
         return message_data
 
-def get_ai_response(message_text, user_data, conversation_history=[]):
-    """Enhanced AI response generation with better fallbacks"""
+def format_conversation_history(conversation_history):
+    """
+    Pair stored messages (oldest first) into the user/bot exchanges used by the NLP module.
+    Pairs go by sender, so a missing reply or a window starting mid-exchange leaves a
+    one-sided exchange instead of shifting every later pair.
+    """
+    formatted_history = []
+    for message in conversation_history:
+        text = message.get('message_text', '')
+        if message.get('sender') == 'user':
+            formatted_history.append({
+                'user': text,
+                'user_emotion_vector': message.get('emotion_vector')
+            })
+        elif formatted_history and 'user' in formatted_history[-1] and 'bot' not in formatted_history[-1]:
+            formatted_history[-1]['bot'] = text
+        else:
+            formatted_history.append({'bot': text})
+    return formatted_history
+
+def schedule_rolling_summary(session_id, user_data, message_count, summarized_count):
+    """Refresh the session's rolling summary in the background once enough new exchanges have accumulated"""
+    if not (USE_DATABASE and response_generator) or ROLLING_SUMMARY_TURNS <= 0:
+        return
+    if message_count - (summarized_count or 0) < 2 * ROLLING_SUMMARY_TURNS:
+        return
+    with rolling_summary_lock:
+        if session_id in rolling_summary_in_flight:
+            return
+        rolling_summary_in_flight.add(session_id)
+    name = user_data.get('screen_name', user_data.get('name', 'friend'))
+    llm_executor.submit(update_rolling_summary, session_id, name)
+
+def update_rolling_summary(session_id, name):
+    """Fold the messages not yet covered by the session's rolling summary into it"""
+    try:
+        with app.app_context():
+            chat_session = ChatSession.query.get(session_id)
+            if not chat_session:
+                return
+            covered = chat_session.summary_message_count or 0
+            new_messages = ChatMessage.query.filter_by(
+                session_id=session_id
+            ).order_by(ChatMessage.timestamp.asc()).offset(covered).all()
+            exchanges = format_conversation_history([msg.to_dict() for msg in new_messages])
+            if not exchanges:
+                return
+            
+            chat_session.rolling_summary = response_generator.update_conversation_summary(
+                chat_session.rolling_summary, exchanges, name
+            )
+            chat_session.summary_message_count = covered + len(new_messages)
+            db.session.commit()
+            session_cache.invalidate(chat_session.user_id)
+            logger.info(f"Updated rolling summary for session {session_id} ({chat_session.summary_message_count} messages)")
+    except Exception as e:
+        logger.error(f"Error updating rolling summary: {str(e)}")
+    finally:
+        with rolling_summary_lock:
+            rolling_summary_in_flight.discard(session_id)
+
+def ensure_session_stats(chat_session):
+    """Backfill running statistics for a session created before they were tracked (one scan, once)"""
+    if chat_session.message_count is None:
+        rebuild_stats(chat_session, ChatMessage.query.filter_by(
+            session_id=chat_session.session_id
+        ).order_by(ChatMessage.timestamp.asc()).all())
+
+def record_session_messages(chat_session, new_messages, attempts=5):
+    """
+    Fold a turn's new messages into the session's running statistics without losing concurrent writes.
+    The row is read FOR UPDATE and written back by an UPDATE that only applies while message_count is
+    what was read; when another writer got in between, the row is read again and the messages folded
+    into that. ``chat_session`` gets the written values. False if the session row does not exist.
+    """
+    session_id = chat_session.session_id
+    columns = [getattr(ChatSession, field) for field in STAT_FIELDS]
+    for _ in range(attempts):
+        row = db.session.query(*columns).filter_by(session_id=session_id).with_for_update().first()
+        if row is None:
+            return False
+        stats = SimpleNamespace(**row._asdict())
+        read_count = stats.message_count
+        if read_count is None:
+            # Session from before statistics were kept: count its stored messages once
+            rebuild_stats(stats, ChatMessage.query.filter_by(
+                session_id=session_id
+            ).order_by(ChatMessage.timestamp.asc()).all())
+        for message in new_messages:
+            record_message(stats, message)
+        unchanged = ChatSession.message_count.is_(None) if read_count is None else ChatSession.message_count == read_count
+        updated = ChatSession.query.filter(ChatSession.session_id == session_id, unchanged).update(
+            {field: getattr(stats, field) for field in STAT_FIELDS}, synchronize_session=False
+        )
+        if updated == 1:
+            for field in STAT_FIELDS:
+                set_committed_value(chat_session, field, getattr(stats, field))
+            return True
+    raise RuntimeError(f"Statistics of session {session_id} kept changing under {attempts} attempts")
+
+def create_basic_summary(session_obj):
+    """ChatSummary from the session's running statistics (two message lookups by id, no scan)"""
+    ensure_session_stats(session_obj)
+    first_message = ChatMessage.query.get(session_obj.first_user_message_id) if session_obj.first_user_message_id else None
+    last_message = ChatMessage.query.get(session_obj.last_user_message_id) if session_obj.last_user_message_id else None
+    if first_message and last_message and first_message.message_id != last_message.message_id:
+        summary_text = f"{first_message.message_text} ... {last_message.message_text}"
+    elif first_message:
+        summary_text = first_message.message_text
+    else:
+        summary_text = "No user messages."
+    ended_at = session_obj.ended_at or datetime.utcnow()
+    summary_obj = ChatSummary()
+    summary_obj.session_id = session_obj.session_id
+    summary_obj.user_id = session_obj.user_id
+    summary_obj.title = session_obj.title or (first_message.message_text[:60] if first_message else f"Session {session_obj.session_id[:8]}")
+    summary_obj.summary = summary_text
+    summary_obj.mood = session_mood(session_obj)
+    summary_obj.tags = json.dumps(KeywordSketch.loads(session_obj.keyword_sketch).top())
+    summary_obj.date = ended_at.strftime('%Y-%m-%d')
+    db.session.add(summary_obj)
+    return summary_obj
+
+def summarize_session_job(payload):
+    """Background job: fill a completed session's ChatSummary with GROQ's analysis"""
+    session_id = payload['session_id']
+    session_obj = ChatSession.query.get(session_id)
+    if not session_obj:
+        return
+    summary_obj = ChatSummary.query.filter_by(session_id=session_id).first()
+    if summary_obj and summary_obj.analysis_data:
+        return
+    if not summary_obj:
+        # Basic summary first so the session card has one even if GROQ never succeeds
+        summary_obj = create_basic_summary(session_obj)
+        db.session.commit()
+    
+    if not (session_summarizer and session_obj.first_user_message_id):
+        return
+    messages = ChatMessage.query.filter_by(session_id=session_id).order_by(ChatMessage.timestamp.asc()).all()
+    profile = UserProfile.query.filter_by(user_id=session_obj.user_id).first()
+    name = (profile.screen_name if profile else None) or 'friend'
+    analysis = session_summarizer.summarize([m.to_dict() for m in messages], name)
+    
+    summary_obj.title = session_obj.title or analysis['title'] or summary_obj.title
+    summary_obj.summary = analysis['summary'] or summary_obj.summary
+    summary_obj.mood = analysis['mood'] or summary_obj.mood
+    if analysis['topics']:
+        summary_obj.tags = json.dumps(analysis['topics'][:5])
+    summary_obj.topics_explored = json.dumps(analysis['topics'])
+    summary_obj.key_insights = analysis['key_insights']
+    summary_obj.emotional_journey = analysis['emotional_journey']
+    summary_obj.action_items = json.dumps(analysis['action_items'])
+    summary_obj.breakthrough_moments = json.dumps(analysis['breakthrough_moments'])
+    summary_obj.user_engagement_level = analysis['user_engagement_level']
+    summary_obj.session_quality_score = analysis['session_quality_score']
+    summary_obj.analysis_data = json.dumps(analysis)
+    # The session's card changed, so delta syncs of the session list should pick it up
+    session_obj.updated_at = datetime.utcnow()
+    db.session.commit()
+    logger.info(f"Wrote GROQ summary for session {session_id} ({len(messages)} messages)")
+
+job_queue.register('summarize_session', summarize_session_job)
+
+def enqueue_turn_enrichment(user_id, session_id, user_message_id, bot_message_id, analysis, new_session, at, commit=True):
+    """Queue the non-critical writes for a chat turn (emotion vector, response quality, theme, analytics)"""
+    return job_queue.enqueue('enrich_turn', {
+        'user_id': user_id,
+        'session_id': session_id,
+        'user_message_id': user_message_id,
+        'bot_message_id': bot_message_id,
+        'emotions': {label: float(score) for label, score in analysis['emotions'].items()} if analysis else None,
+        'intent': analysis.get('intent') if analysis else None,
+        'new_session': new_session,
+        'at': at.isoformat()
+    }, commit=commit)
+
+def enrich_turns_job(payloads):
+    """Background job: enrichment for a batch of chat turns, in one transaction"""
+    encode_emotions = emotion_analyzer.encode_emotions if emotion_analyzer else None
+    try:
+        enrich_turns(db.session, payloads, encode_emotions)
+    except IntegrityError:
+        # A concurrent batch inserted one of our theme/analytics rows first; start over and update it
+        db.session.rollback()
+        enrich_turns(db.session, payloads, encode_emotions)
+
+job_queue.register('enrich_turn', enrich_turns_job, batch_size=int(os.getenv('ENRICH_BATCH_SIZE', '50')))
+if USE_DATABASE:
+    job_queue.start()
+
+def intent_budget(pipeline):
+    """Seconds the intent stage may take: half of what is left of the turn's budget (None without a deadline)"""
+    remaining = pipeline.remaining()
+    return None if remaining is None else remaining / 2
+
+def submit_intent(pipeline, message_text):
+    """Classify the message's intent in the background, with the GROQ call bounded by the intent budget"""
+    if emotion_analyzer:
+        pipeline.submit('intent', emotion_analyzer.classify_intent, message_text,
+                        timeout=intent_budget(pipeline), executor=llm_executor)
+
+def intent_within_budget(pipeline, message_text):
+    """Result of the pipeline's intent stage, or a local classification once it would eat into the generation budget"""
+    try:
+        # Leave at least half of what is left of the turn's budget for generating the reply
+        return pipeline.result('intent', timeout=intent_budget(pipeline))
+    except FuturesTimeoutError:
+        # The stage gives up on GROQ at its own timeout, freeing its worker
+        logger.warning("Intent classification exceeded its share of the chat deadline, using local intent")
+        return emotion_analyzer.classify_intent(message_text, allow_llm=False)
+
+def analyze_chat_message(message_text, user_data, conversation_history=None, intent_result=None):
+    """Analyze a chat message once per turn; the result is shared by sentiment storage, prompt building and fallbacks"""
+    if not emotion_analyzer:
+        return None
+    try:
+        return emotion_analyzer.analyze_message_with_context(
+            message_text,
+            user_data,
+            format_conversation_history(conversation_history or []),
+            intent_result=intent_result
+        )
+    except Exception as e:
+        logger.error(f"Error in sentiment analysis: {str(e)}")
+        return None
+
+def get_or_create_active_session(user_id, message_text, title=None):
+    """
+    (active ChatSession, created) for the user, creating it and setting its title if needed.
+    Changes are left for the caller to commit with the turn's messages.
+    """
+    active_session = ChatSession.query.filter_by(
+        user_id=user_id, status='active'
+    ).first()
+    
+    if not active_session:
+        active_session = ChatSession()
+        active_session.session_id = generate_uuid()
+        active_session.user_id = user_id
+        active_session.chat_mode = 'mentor'
+        # Set title from request if provided, else use first message
+        active_session.title = title or message_text[:60]
+        reset_stats(active_session)
+        db.session.add(active_session)
+        return active_session, True
+    if not active_session.title:
+        # Set title if not already set
+        active_session.title = title or message_text[:60]
+    return active_session, False
+
+def persist_cached_session(active_session, new_messages, titled=False):
+    """
+    Fold a turn's messages into a session rebuilt from the cache and write its statistics with one
+    UPDATE that only applies while the row is as cached; False if it was changed or ended elsewhere.
+    The title is only written when this turn set it (``titled``), and only over an untitled row,
+    so a rename from another process is never reverted.
+    """
+    cached_count = active_session.message_count
+    for message in new_messages:
+        record_message(active_session, message)
+    fields = STAT_FIELDS + ('title',) if titled else STAT_FIELDS
+    query = ChatSession.query.filter_by(session_id=active_session.session_id, status='active', message_count=cached_count)
+    if titled:
+        query = query.filter(ChatSession.title.is_(None))
+    updated = query.update({field: getattr(active_session, field) for field in fields}, synchronize_session=False)
+    return updated == 1
+
+# Cursor kinds: message timelines, session list pages by start time, session list changes
+MESSAGE_CURSOR = 'messages'
+SESSION_CURSOR = 'sessions'
+SESSION_CHANGE_CURSOR = 'session-changes'
+
+def paging_requested(args):
+    """Listings stay whole unless the client asks for a page or a delta"""
+    return any(key in args for key in ('limit', 'before', 'since'))
+
+def message_cursor(message):
+    return encode_cursor(MESSAGE_CURSOR, message.timestamp, message.message_id)
+
+def message_sync_cursor(message, read_at):
+    """``since`` cursor after ``message``, the newest one of a read that started at ``read_at``"""
+    last = (message.timestamp, message.message_id) if message else None
+    return sync_cursor(MESSAGE_CURSOR, last, read_at, SYNC_OVERLAP_SECONDS)
+
+def page_messages(query, args):
+    """
+    One page of a ChatMessage query under the request's ``limit``, ``before`` and ``since``
+    arguments, oldest first, and its cursors; raises ValueError on a bad argument.
+    """
+    read_at = datetime.utcnow()
+    limit = page_size(args.get('limit'))
+    since, horizon = decode_sync_cursor(args['since'], MESSAGE_CURSOR) if args.get('since') else (None, None)
+    before = decode_cursor(args['before'], MESSAGE_CURSOR) if args.get('before') and not since else None
+    rows, has_more = keyset_page(query, ChatMessage.timestamp, ChatMessage.message_id, limit, before=before, after=since)
+    last = (rows[-1].timestamp, rows[-1].message_id) if rows else since
+    if since:
+        sync = sync_cursor(MESSAGE_CURSOR, last, read_at, SYNC_OVERLAP_SECONDS, has_more, horizon)
+    else:
+        sync = sync_cursor(MESSAGE_CURSOR, last, read_at, SYNC_OVERLAP_SECONDS) if not before else None
+    return rows, {
+        'has_more': has_more,
+        'next_cursor': message_cursor(rows[0]) if has_more and not since else None,
+        'sync_cursor': sync
+    }
+
+def latest_session_change_cursor(user_id, read_at):
+    """``since`` cursor covering every change to the user's sessions committed before ``read_at``"""
+    latest = ChatSession.query.filter(
+        ChatSession.user_id == user_id, ChatSession.updated_at.isnot(None)
+    ).order_by(ChatSession.updated_at.desc(), ChatSession.session_id.desc()).first()
+    last = (latest.updated_at, latest.session_id) if latest else None
+    return sync_cursor(SESSION_CHANGE_CURSOR, last, read_at, SYNC_OVERLAP_SECONDS)
+
+def get_or_create_memory_session(user_id):
+    """In-memory counterpart of get_or_create_active_session; returns the session id"""
+    for s_id, s_data in chat_sessions.items():
+        if s_data.get('user_id') == user_id and s_data.get('status') == 'active':
+            return s_id
+    
+    active_session_id = generate_uuid()
+    chat_sessions[active_session_id] = {
+        'session_id': active_session_id,
+        'user_id': user_id,
+        'chat_mode': 'mentor',
+        'status': 'active',
+        'started_at': datetime.utcnow().isoformat(),
+        'ended_at': None
+    }
+    return active_session_id
+
+def get_ai_response(message_text, user_data, conversation_history=None, analysis=None, conversation_summary=None, deadline=None):
+    """Enhanced AI response generation with better fallbacks; ``deadline`` is a ``time.monotonic()`` value"""
     try:
         name = user_data.get('screen_name', user_data.get('name', 'friend'))
         
@@ -251,18 +729,15 @@ def get_ai_response(message_text, user_data, conversation_history=[]):
         if client and response_generator:
             try:
                 # Convert history to proper format for response generator
-                formatted_history = []
-                for i in range(0, len(conversation_history), 2):
-                    if i + 1 < len(conversation_history):
-                        formatted_history.append({
-                            'user': conversation_history[i].get('message_text', ''),
-                            'bot': conversation_history[i + 1].get('message_text', '')
-                        })
+                formatted_history = format_conversation_history(conversation_history or [])
                 
                 response_data = response_generator.generate_response(
                     message_text,
                     user_data,
-                    formatted_history
+                    formatted_history,
+                    analysis=analysis,
+                    conversation_summary=conversation_summary,
+                    deadline=deadline
                 )
                 return response_data['response']
                 
@@ -271,82 +746,15 @@ def get_ai_response(message_text, user_data, conversation_history=[]):
                 # Fall through to simple responses
         
         # Enhanced fallback responses with personalization
-        return generate_enhanced_fallback_response(message_text, user_data)
+        return generate_enhanced_fallback_response(message_text, user_data, analysis.get('lexicon') if analysis else None)
         
     except Exception as e:
         logger.error(f"Error generating AI response: {str(e)}")
         return f"I hear you, {user_data.get('screen_name', 'friend')}. I'm here to support you. Could you tell me more about how you're feeling?"
 
-def generate_enhanced_fallback_response(message_text, user_data):
-    """Generate enhanced fallback responses with personalization"""
-    name = user_data.get('screen_name', user_data.get('name', 'friend'))
-    pronouns = user_data.get('pronouns', '')
-    identity_goals = user_data.get('identity_goals', '')
-    focus_area = user_data.get('focus_area', '')
-    
-    message_lower = message_text.lower()
-    
-    # Personalized responses based on content
-    if any(word in message_lower for word in ['hello', 'hi', 'hey']):
-        responses = [
-            f"Hello {name}! I'm M, your identity mentor. How are you feeling today?",
-            f"Hi {name}! I'm so glad you're here. What would you like to explore today?",
-            f"Hey {name}! This is your safe space. What's on your mind?"
-        ]
-    elif any(word in message_lower for word in ['affirm who i am', 'identity', 'who am i']):
-        responses = [
-            f"Exploring your identity is such a brave journey, {name}. What aspects of yourself feel most authentic to you right now?",
-            f"Identity exploration takes courage, {name}. {f'Given your focus on {focus_area}, ' if focus_area else ''}what feels true about who you are?",
-            f"Your authentic self matters, {name}. What part of your identity would you like to affirm today?"
-        ]
-    elif any(word in message_lower for word in ['sad', 'depressed', 'down', 'feeling sad']):
-        responses = [
-            f"I hear that you're feeling sad, {name}. Those feelings are completely valid. What's been weighing on your heart?",
-            f"Thank you for sharing that with me, {name}. Sadness can feel heavy. Would you like to talk about what's contributing to these feelings?",
-            f"I'm here with you in this difficult moment, {name}. What would feel most supportive right now?"
-        ]
-    elif any(word in message_lower for word in ['anxious', 'worried', 'anxiety', 'stress']):
-        responses = [
-            f"Anxiety can feel overwhelming, {name}. You're not alone in this. What's been causing you the most worry lately?",
-            f"I understand you're feeling anxious, {name}. Would you like to try a grounding technique together, or would you prefer to talk about what's on your mind?",
-            f"Thank you for trusting me with your anxiety, {name}. What thoughts have been racing through your mind?"
-        ]
-    elif any(word in message_lower for word in ['gender', 'pronouns', 'expression']):
-        pronoun_text = f" I see you use {pronouns} pronouns" if pronouns else ""
-        responses = [
-            f"Gender expression is such a personal journey, {name}.{pronoun_text}. How would you like to explore this today?",
-            f"Your gender identity is valid, {name}. What feels most authentic about your gender expression?",
-            f"Thank you for trusting me with this part of your identity, {name}. What aspects of gender feel most important to you?"
-        ]
-    elif any(word in message_lower for word in ['support', 'well-being', 'help']):
-        responses = [
-            f"I'm here to support you, {name}. {f'I know {focus_area} is important to you. ' if focus_area else ''}What kind of support would be most helpful today?",
-            f"Your well-being matters deeply, {name}. What area of your life would you like to focus on?",
-            f"You deserve support and care, {name}. How can I best help you right now?"
-        ]
-    elif any(word in message_lower for word in ['spiritual', 'growth', 'meaning']):
-        responses = [
-            f"Spiritual growth is a beautiful part of the human experience, {name}. What's calling to your spirit lately?",
-            f"The search for meaning is so important, {name}. What gives your life a sense of purpose?",
-            f"Your spiritual journey is uniquely yours, {name}. What practices or beliefs bring you peace?"
-        ]
-    elif any(word in message_lower for word in ['relationship', 'family', 'friends']):
-        responses = [
-            f"Relationships can be complex, {name}. What's been on your mind about your connections with others?",
-            f"Thank you for sharing about your relationships, {name}. How do others respond when you express your authentic self?",
-            f"The people in our lives shape our journey, {name}. What relationship dynamics would you like to explore?"
-        ]
-    else:
-        # General supportive responses
-        responses = [
-            f"Thank you for sharing that with me, {name}. I'm here to listen and support you. What feels most important to talk about right now?",
-            f"I hear you, {name}. {f'Given your focus on {focus_area}, ' if focus_area else ''}how are you feeling about everything?",
-            f"Your thoughts and feelings matter, {name}. What would be most helpful to explore together today?",
-            f"I'm glad you're here, {name}. This is your safe space to share whatever is on your mind."
-        ]
-    
-    import random
-    return random.choice(responses)
+def generate_enhanced_fallback_response(message_text, user_data, match=None):
+    """Generate enhanced fallback responses with personalization (reuses the turn's lexicon match when available)"""
+    return fallback_engine.respond(message_text, user_data, match)
 
 # Rate limiting storage (in production, use Redis)
 rate_limit_storage = {}
@@ -827,13 +1235,28 @@ def get_conversation(user_id):
                 session_id = active_session.session_id if active_session else None
                 
                 if session_id:
-                    db_messages = ChatMessage.query.filter_by(
-                        session_id=session_id
-                    ).order_by(ChatMessage.timestamp.asc()).all()
+                    query = ChatMessage.query.filter_by(session_id=session_id)
+                else:
+                    query = ChatMessage.query.join(ChatSession).filter(ChatSession.user_id == user_id)
+                
+                if paging_requested(request.args):
+                    try:
+                        db_messages, paging = page_messages(query, request.args)
+                    except ValueError as e:
+                        return jsonify({'error': str(e)}), 400
                 else:
-                    db_messages = ChatMessage.query.join(ChatSession).filter(
-                        ChatSession.user_id == user_id
-                    ).order_by(ChatMessage.timestamp.desc()).limit(50).all()
+                    read_at = datetime.utcnow()
+                    if session_id:
+                        db_messages = query.order_by(ChatMessage.timestamp.asc()).all()
+                        newest = db_messages[-1] if db_messages else None
+                    else:
+                        db_messages = query.order_by(ChatMessage.timestamp.desc()).limit(50).all()
+                        newest = db_messages[0] if db_messages else None
+                    paging = {
+                        'has_more': False,
+                        'next_cursor': None,
+                        'sync_cursor': message_sync_cursor(newest, read_at)
+                    }
                 
                 messages_data = []
                 for msg in db_messages:
@@ -847,7 +1270,8 @@ def get_conversation(user_id):
                 
                 return jsonify({
                     'messages': messages_data,
-                    'sessionId': session_id
+                    'sessionId': session_id,
+                    **paging
                 })
         else:
             # In-memory fallback
@@ -899,141 +1323,142 @@ def secure_api_chat():
     if len(message_text) < 1:
         return jsonify({"error": "Message too short or contains invalid characters"}), 400
     
+    received_at = datetime.utcnow()
+    pipeline = ChatPipeline(pipeline_executor, context_factory=app.app_context, budget=CHAT_DEADLINE_SECONDS)
     try:
-        user_data = get_user_data(user_id)
+        # Same process served the user's last turn: session row and recent messages come from memory
+        cached = session_cache.get(user_id) if USE_DATABASE else None
+        # Independent I/O-bound stages run concurrently
+        pipeline.submit('user', get_user_data, user_id)
+        if not cached:
+            pipeline.submit('history', get_conversation_history, user_id)
+        submit_intent(pipeline, message_text)
+        
+        user_data = pipeline.result('user')
         if not user_data:
             return jsonify({
                 "error": "User data not found",
                 "response": "I apologize, but I'm having trouble accessing your profile information."
             }), 404
-
+        
         if USE_DATABASE:
-            with app.app_context():
-                data = request.get_json()
-                message_text = data.get('message')
-                # Get or create active session
-                active_session = ChatSession.query.filter_by(
-                    user_id=user_id, status='active'
-                ).first()
-                
-                if not active_session:
-                    active_session = ChatSession()
-                    active_session.session_id = generate_uuid()
-                    active_session.user_id = user_id
-                    active_session.chat_mode = 'mentor'
-                    # Set title from request if provided, else use first message
-                    active_session.title = data.get('title') or message_text[:60]
-                    db.session.add(active_session)
-                    db.session.commit()
-                elif not active_session.title:
-                    # Set title if not already set
-                    active_session.title = data.get('title') or message_text[:60]
-                    db.session.commit()
-                
-                # Analyze sentiment
-                sentiment_score = 0.0
-                if emotion_analyzer:
-                    try:
-                        analysis = emotion_analyzer.analyze_message(message_text)
-                        sentiment_score = analysis.get('emotion_intensity', 0.0)
-                    except Exception as e:
-                        logger.error(f"Error in sentiment analysis: {str(e)}")
-                
-                # Store user message
+            # Get or create active session on the request thread (its session owns the writes below)
+            with pipeline.stage('session'):
+                if cached:
+                    # Detached copy of the cached row; its changes are written by persist_cached_session
+                    active_session, new_session = ChatSession(**cached.row), False
+                    titled = not active_session.title
+                    if titled:
+                        active_session.title = data.get('title') or message_text[:60]
+                else:
+                    active_session, new_session = get_or_create_active_session(user_id, message_text, data.get('title'))
+            session_id = active_session.session_id
+            conversation_summary = active_session.rolling_summary
+            summarized_count = active_session.summary_message_count
+        else:
+            # In-memory handling
+            session_id = get_or_create_memory_session(user_id)
+            conversation_summary = None
+        
+        # Conversation history for context (loaded before this turn's message is added)
+        if cached:
+            conversation_history = list(cached.messages)
+        else:
+            conversation_history = pipeline.result('history')
+            if USE_DATABASE:
+                session_cache.verify(user_id, session_row(active_session), conversation_history)
+        
+        # Analyze once; the same result drives sentiment, prompt and fallback
+        intent_result = intent_within_budget(pipeline, message_text)
+        with pipeline.stage('analysis'):
+            analysis = analyze_chat_message(message_text, user_data, conversation_history, intent_result)
+        sentiment_score = analysis.get('emotion_intensity', 0.0) if analysis else 0.0
+        
+        # Generate AI response
+        with pipeline.stage('generate'):
+            response_text = get_ai_response(message_text, user_data, conversation_history, analysis, conversation_summary,
+                                            deadline=pipeline.deadline)
+        
+        with pipeline.stage('store'):
+            if USE_DATABASE:
+                # Store user and bot messages
                 user_message = ChatMessage()
                 user_message.message_id = generate_uuid()
-                user_message.session_id = active_session.session_id
+                user_message.session_id = session_id
                 user_message.user_id = user_id
                 user_message.sender = 'user'
                 user_message.message_text = message_text
+                user_message.timestamp = received_at
                 user_message.sentiment_score = sentiment_score
                 db.session.add(user_message)
                 
-                # Get conversation history for context
-                conversation_history = get_conversation_history(user_id, active_session.session_id)
-                
-                # Generate AI response
-                response_text = get_ai_response(message_text, user_data, conversation_history)
-                
-                # Store bot message
                 bot_message = ChatMessage()
                 bot_message.message_id = generate_uuid()
-                bot_message.session_id = active_session.session_id
+                bot_message.session_id = session_id
                 bot_message.user_id = user_id
                 bot_message.sender = 'M'
                 bot_message.message_text = response_text
                 bot_message.sentiment_score = 0.0
+                
+                cacheable = True
+                if cached and not persist_cached_session(active_session, [user_message, bot_message], titled):
+                    # Another process changed the session since it was cached: store into the current row instead
+                    session_cache.conflict(user_id)
+                    cached, cacheable = None, False
+                    active_session, new_session = get_or_create_active_session(user_id, message_text, data.get('title'))
+                    session_id = user_message.session_id = bot_message.session_id = active_session.session_id
+                if not cached:
+                    record_session_messages(active_session, [user_message, bot_message])
+                db.session.add(user_message)
                 db.session.add(bot_message)
+                # Everything else about the turn is written behind the response, committed with the messages
+                enqueue_turn_enrichment(user_id, session_id, user_message.message_id, bot_message.message_id,
+                                        analysis, new_session, received_at, commit=False)
+                db.session.flush()
+                message_count = active_session.message_count
+                if cacheable:
+                    cache_row = session_row(active_session)
+                    # The user message's vector is the one the enrichment job will store
+                    emotion_vector = emotion_analyzer.encode_emotions(analysis['emotions']) \
+                        if emotion_analyzer and analysis else None
+                    cache_messages = conversation_history + [
+                        dict(user_message.to_dict(), emotion_vector=emotion_vector),
+                        dict(bot_message.to_dict(), emotion_vector=None)
+                    ]
                 db.session.commit()
-                
-                return jsonify({
-                    "response": response_text,
-                    "time": datetime.utcnow().strftime("%I:%M %p"),
-                    "sentiment": sentiment_score,
-                    "sessionId": active_session.session_id
-                }), 200
-        else:
-            # In-memory handling
-            active_session_id = None
-            for s_id, s_data in chat_sessions.items():
-                if s_data.get('user_id') == user_id and s_data.get('status') == 'active':
-                    active_session_id = s_id
-                    break
-            
-            if not active_session_id:
-                active_session_id = generate_uuid()
-                chat_sessions[active_session_id] = {
-                    'session_id': active_session_id,
+                if cacheable:
+                    session_cache.store(user_id, cache_row, cache_messages, verified=not cached)
+                job_queue.notify()
+                schedule_rolling_summary(session_id, user_data, message_count, summarized_count)
+            else:
+                messages.append({
+                    'message_id': generate_uuid(),
+                    'session_id': session_id,
                     'user_id': user_id,
-                    'chat_mode': 'mentor',
-                    'status': 'active',
-                    'started_at': datetime.utcnow().isoformat(),
-                    'ended_at': None
-                }
-            
-            # Analyze sentiment
-            sentiment_score = 0.0
-            if emotion_analyzer:
-                try:
-                    analysis = emotion_analyzer.analyze_message(message_text)
-                    sentiment_score = analysis.get('emotion_intensity', 0.0)
-                except Exception as e:
-                    logger.error(f"Error in sentiment analysis: {str(e)}")
-            
-            # Store user message
-            user_message_data = {
-                'message_id': generate_uuid(),
-                'session_id': active_session_id,
-                'user_id': user_id,
-                'sender': 'user',
-                'message_text': message_text,
-                'timestamp': datetime.utcnow().isoformat(),
-                'sentiment_score': sentiment_score
-            }
-            messages.append(user_message_data)
-            
-            # Generate AI response
-            conversation_history = get_conversation_history(user_id, active_session_id)
-            response_text = get_ai_response(message_text, user_data, conversation_history)
-            
-            # Store bot message
-            bot_message_data = {
-                'message_id': generate_uuid(),
-                'session_id': active_session_id,
-                'user_id': user_id,
-                'sender': 'M',
-                'message_text': response_text,
-                'timestamp': datetime.utcnow().isoformat(),
-                'sentiment_score': 0.0
-            }
-            messages.append(bot_message_data)
-            
-            return jsonify({
-                "response": response_text,
-                "time": datetime.utcnow().strftime("%I:%M %p"),
-                "sentiment": sentiment_score,
-                "sessionId": active_session_id
-            }), 200
+                    'sender': 'user',
+                    'message_text': message_text,
+                    'timestamp': received_at.isoformat(),
+                    'sentiment_score': sentiment_score
+                })
+                messages.append({
+                    'message_id': generate_uuid(),
+                    'session_id': session_id,
+                    'user_id': user_id,
+                    'sender': 'M',
+                    'message_text': response_text,
+                    'timestamp': datetime.utcnow().isoformat(),
+                    'sentiment_score': 0.0
+                })
+        
+        pipeline.log_timings()
+        response = jsonify({
+            "response": response_text,
+            "time": datetime.utcnow().strftime("%I:%M %p"),
+            "sentiment": sentiment_score,
+            "sessionId": session_id
+        })
+        response.headers['Server-Timing'] = pipeline.server_timing()
+        return response, 200
             
     except Exception as e:
         logger.error(f"Error in chat API: {str(e)}")
@@ -1042,6 +1467,166 @@ def secure_api_chat():
             "response": "I apologize, but I'm having trouble processing your message right now. Please try again."
         }), 500
 
+def sse_event(data, event=None):
+    """Format a Server-Sent Events frame"""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+@app.route("/api/chat/stream", methods=["POST"])
+@enhanced_jwt_required
+@rate_limit_decorator
+def secure_api_chat_stream():
+    """Streaming variant of /api/chat that forwards tokens as Server-Sent Events"""
+    pipeline = ChatPipeline(pipeline_executor, context_factory=app.app_context, name="chat-stream", budget=CHAT_DEADLINE_SECONDS)
+    user_id = get_jwt_identity()
+    data = request.get_json() if request.is_json else request.form
+    message_text = data.get("message", "").strip()
+    if not message_text:
+        return jsonify({"error": "Message is required"}), 400
+    # Sanitize input
+    message_text = sanitize_input(message_text, 2000)
+    if len(message_text) < 1:
+        return jsonify({"error": "Message too short or contains invalid characters"}), 400
+    
+    try:
+        submit_intent(pipeline, message_text)
+        user_data = get_user_data(user_id)
+        if not user_data:
+            return jsonify({
+                "error": "User data not found",
+                "response": "I apologize, but I'm having trouble accessing your profile information."
+            }), 404
+        
+        if USE_DATABASE:
+            active_session, new_session = get_or_create_active_session(user_id, message_text, data.get('title'))
+            # Messages are stored in their own transactions below, so the session has to exist first
+            db.session.commit()
+            session_id = active_session.session_id
+            conversation_summary = active_session.rolling_summary
+            summarized_count = active_session.summary_message_count
+            stored_count = active_session.message_count or 0
+        else:
+            session_id = get_or_create_memory_session(user_id)
+            conversation_summary = None
+        
+        conversation_history = get_conversation_history(user_id, session_id)
+        intent_result = intent_within_budget(pipeline, message_text)
+        analysis = analyze_chat_message(message_text, user_data, conversation_history, intent_result)
+        sentiment_score = analysis.get('emotion_intensity', 0.0) if analysis else 0.0
+        
+        # Persist the user message before streaming so it survives an aborted stream
+        user_message_id = generate_uuid()
+        store_message({
+            'message_id': user_message_id,
+            'session_id': session_id,
+            'user_id': user_id,
+            'sender': 'user',
+            'message_text': message_text,
+            'sentiment_score': sentiment_score
+        })
+    except Exception as e:
+        logger.error(f"Error in chat stream API: {str(e)}")
+        return jsonify({
+            "error": "Internal server error",
+            "response": "I apologize, but I'm having trouble processing your message right now. Please try again."
+        }), 500
+    
+    def fallback_text():
+        return generate_enhanced_fallback_response(message_text, user_data, analysis.get('lexicon') if analysis else None)
+    
+    def store_reply(response_text):
+        return store_message({
+            'message_id': generate_uuid(),
+            'session_id': session_id,
+            'user_id': user_id,
+            'sender': 'M',
+            'message_text': response_text,
+            'sentiment_score': 0.0
+        })
+    
+    def after_reply(bot_message):
+        """Queue the turn's background work once the bot message is stored; never raises"""
+        if not USE_DATABASE:
+            return
+        try:
+            with app.app_context():
+                enqueue_turn_enrichment(user_id, session_id, user_message_id, bot_message['message_id'],
+                                        analysis, new_session, datetime.utcnow())
+            schedule_rolling_summary(session_id, user_data, stored_count + 2, summarized_count)
+        except Exception as e:
+            logger.error(f"Error queueing background work for chat stream: {str(e)}")
+    
+    def store_partial_reply(chunks, default=None):
+        """Keep the turn paired after an aborted stream: whatever was streamed, else ``default`` or the local fallback"""
+        try:
+            after_reply(store_reply("".join(chunks).strip() or default or fallback_text()))
+        except Exception as e:
+            logger.error(f"Error storing partial chat stream reply: {str(e)}")
+    
+    def generate():
+        chunks = []
+        stream = None
+        try:
+            yield sse_event({"sessionId": session_id, "sentiment": sentiment_score}, event="meta")
+            
+            stream_error = False
+            if client and response_generator:
+                try:
+                    stream = response_generator.generate_response_stream(
+                        message_text,
+                        user_data,
+                        format_conversation_history(conversation_history),
+                        analysis=analysis,
+                        conversation_summary=conversation_summary,
+                        deadline=pipeline.deadline
+                    )
+                    for chunk in stream:
+                        chunks.append(chunk)
+                        yield sse_event({"token": chunk})
+                except Exception as e:
+                    logger.error(f"GROQ streaming failed: {str(e)}")
+                    stream_error = bool(chunks)
+            
+            if stream_error:
+                yield sse_event({"error": "Response stream interrupted"}, event="error")
+            elif not chunks:
+                # Nothing was streamed (no client, error or deadline): deliver the local fallback as a single chunk
+                chunks.append(fallback_text())
+                yield sse_event({"token": chunks[0]})
+            
+            response_text = "".join(chunks).strip()
+        except GeneratorExit:
+            # The client went away mid-stream: stop the upstream generation and keep the turn paired
+            if stream is not None:
+                stream.close()
+            logger.info(f"Client disconnected from chat stream for session {session_id}, generation aborted")
+            store_partial_reply(chunks)
+            raise
+        except Exception as e:
+            logger.error(f"Error in chat stream for session {session_id}: {str(e)}")
+            # Not the local fallback: it may be what failed
+            apology = "I apologize, but I'm having trouble processing your message right now. Please try again."
+            store_partial_reply(chunks, apology)
+            yield sse_event({"error": "Failed to complete the response", "response": apology}, event="error")
+            return
+        # Stored outside the try: nothing after this point can store the reply a second time
+        bot_message = store_reply(response_text)
+        after_reply(bot_message)
+        
+        yield sse_event({
+            "response": response_text,
+            "time": datetime.utcnow().strftime("%I:%M %p"),
+            "sentiment": sentiment_score,
+            "sessionId": session_id,
+            "messageId": bot_message.get('message_id')
+        }, event="done")
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route("/api/feedback", methods=["POST"])
 @enhanced_jwt_required
 def submit_feedback():
@@ -1100,7 +1685,15 @@ def enhanced_health_check():
                 'security': True,
                 'rate_limiting': True
             },
-            'environment': os.getenv('FLASK_ENV', 'development')
+            'environment': os.getenv('FLASK_ENV', 'development'),
+            'intent_cache': emotion_analyzer.intent_cache.stats() if emotion_analyzer else None,
+            'intent_single_flight': emotion_analyzer.intent_flight.stats() if emotion_analyzer else None,
+            'profile_prompt_cache': response_generator.profile_blocks.stats() if response_generator else None,
+            'fallback_cache': fallback_engine.stats(),
+            'groq_client': client.stats() if client else None,
+            'training_data': training_store.stats(),
+            'background_jobs': job_queue.stats() if USE_DATABASE else None,
+            'session_cache': session_cache.stats()
         }
         # Test database connection if enabled
         if USE_DATABASE:
@@ -1329,6 +1922,7 @@ def rename_session(session_id):
                     return jsonify({'error': 'Session not found'}), 404
                 session_obj.title = new_title.strip()
                 db.session.commit()
+                session_cache.invalidate(user_id)
                 return jsonify({'session_id': session_id, 'title': session_obj.title}), 200
         else:
             session_obj = chat_sessions.get(session_id)
@@ -1357,46 +1951,19 @@ def end_session():
                 if session_obj.status != 'completed':
                     session_obj.status = 'completed'
                     session_obj.ended_at = datetime.utcnow()
-                    db.session.commit()
-                # --- Create ChatSummary if not exists ---
-                summary_obj = ChatSummary.query.filter_by(session_id=session_id).first()
-                if not summary_obj:
-                    # Get all messages for this session
-                    messages = ChatMessage.query.filter_by(session_id=session_id).order_by(ChatMessage.timestamp.asc()).all()
-                    user_messages = [m for m in messages if m.sender == 'user']
-                    bot_messages = [m for m in messages if m.sender == 'M']
-                    # Title: use session title or first user message
-                    title = session_obj.title or (user_messages[0].message_text[:60] if user_messages else f"Session {session_id[:8]}")
-                    # Summary: concatenate first and last user message, or use all if short
-                    if len(user_messages) >= 2:
-                        summary_text = f"{user_messages[0].message_text} ... {user_messages[-1].message_text}"
-                    elif user_messages:
-                        summary_text = user_messages[0].message_text
-                    else:
-                        summary_text = "No user messages."
-                    # Mood: average sentiment
-                    sentiments = [m.sentiment_score for m in user_messages if m.sentiment_score is not None]
-                    avg_sentiment = sum(sentiments) / len(sentiments) if sentiments else 0
-                    if avg_sentiment > 0.3:
-                        mood = 'positive'
-                    elif avg_sentiment < -0.3:
-                        mood = 'negative'
-                    else:
-                        mood = 'neutral'
-                    # Tags: extract keywords (simple split for now)
-                    tags = list(set([w for m in user_messages for w in m.message_text.lower().split() if len(w) > 4]))[:5]
-                    # Date
-                    date = session_obj.ended_at.strftime('%Y-%m-%d') if session_obj.ended_at else datetime.utcnow().strftime('%Y-%m-%d')
-                    summary_obj = ChatSummary()
-                    summary_obj.session_id = session_id
-                    summary_obj.user_id = user_id
-                    summary_obj.title = title
-                    summary_obj.summary = summary_text
-                    summary_obj.mood = mood
-                    summary_obj.tags = json.dumps(tags)
-                    summary_obj.date = date
-                    db.session.add(summary_obj)
-                    db.session.commit()
+                if not ChatSummary.query.filter_by(session_id=session_id).first():
+                    create_basic_summary(session_obj)
+                # GROQ's analysis is added by a background job; one job per session however often this is called
+                summary_job = job_queue.enqueue(
+                    'summarize_session',
+                    {'session_id': session_id},
+                    dedupe_key=f"summarize_session:{session_id}",
+                    commit=False
+                )
+                db.session.commit()
+                session_cache.invalidate(user_id)
+                if summary_job:
+                    job_queue.notify()
                 return jsonify({'message': 'Session ended successfully', 'session_id': session_id}), 200
         else:
             session_obj = chat_sessions.get(session_id)
@@ -1419,7 +1986,41 @@ def get_sessions(user_id):
     try:
         if USE_DATABASE:
             with app.app_context():
-                sessions = ChatSession.query.filter_by(user_id=user_id).order_by(ChatSession.started_at.desc()).all()
+                read_at = datetime.utcnow()
+                query = ChatSession.query.filter_by(user_id=user_id)
+                paging = {'has_more': False, 'next_cursor': None, 'sync_cursor': None}
+                if paging_requested(request.args):
+                    try:
+                        limit = page_size(request.args.get('limit'))
+                        if request.args.get('since'):
+                            # Delta: sessions created or changed since the cursor, oldest change first
+                            since, horizon = decode_sync_cursor(request.args['since'], SESSION_CHANGE_CURSOR)
+                            sessions, has_more = keyset_page(
+                                query, ChatSession.updated_at, ChatSession.session_id, limit, after=since
+                            )
+                            last = (sessions[-1].updated_at, sessions[-1].session_id) if sessions else since
+                            paging['sync_cursor'] = sync_cursor(
+                                SESSION_CHANGE_CURSOR, last, read_at, SYNC_OVERLAP_SECONDS, has_more, horizon
+                            )
+                        else:
+                            before = decode_cursor(request.args['before'], SESSION_CURSOR) \
+                                if request.args.get('before') else None
+                            sessions, has_more = keyset_page(
+                                query, ChatSession.started_at, ChatSession.session_id, limit, before=before
+                            )
+                            sessions.reverse()
+                            if has_more:
+                                paging['next_cursor'] = encode_cursor(
+                                    SESSION_CURSOR, sessions[-1].started_at, sessions[-1].session_id
+                                )
+                            if not before:
+                                paging['sync_cursor'] = latest_session_change_cursor(user_id, read_at)
+                        paging['has_more'] = has_more
+                    except ValueError as e:
+                        return jsonify({'error': str(e)}), 400
+                else:
+                    sessions = query.order_by(ChatSession.started_at.desc()).all()
+                    paging['sync_cursor'] = latest_session_change_cursor(user_id, read_at)
                 session_ids = [s.session_id for s in sessions]
                 # Get summaries for all sessions in one query
                 summaries = {s.session_id: s for s in ChatSummary.query.filter(ChatSummary.session_id.in_(session_ids)).all()}
@@ -1428,10 +2029,14 @@ def get_sessions(user_id):
                     summary = summaries.get(s.session_id)
                     session_dict = s.to_dict()
                     session_dict['title'] = s.title or (summary.title if summary else f"Session {s.session_id[:8]}")
+                    # Live sessions have no summary yet; their card comes from the running statistics
+                    card = session_card(s)
+                    session_dict['message_count'] = card['message_count']
                     session_dict['summary'] = summary.summary if summary else None
-                    session_dict['mood'] = summary.mood if summary else None
+                    session_dict['mood'] = summary.mood if summary else card['mood']
+                    session_dict['tags'] = json.loads(summary.tags) if summary and summary.tags else card['tags']
                     session_list.append(session_dict)
-                return jsonify({'sessions': session_list}), 200
+                return jsonify({'sessions': session_list, **paging}), 200
         else:
             user_sessions = [s for s in chat_sessions.values() if s.get('user_id') == user_id]
             # Sort by started_at descending
@@ -1486,8 +2091,10 @@ def get_analytics(user_id):
                 # Total sessions
                 total_sessions = ChatSession.query.filter_by(user_id=user_id).count()
 
-                # Average mood: use sentiment_score from user messages
-                user_messages = ChatMessage.query.join(ChatSession, ChatMessage.session_id == ChatSession.session_id)
+                # Average mood: use sentiment_score from user messages (texts are only loaded when needed)
+                user_messages = db.session.query(
+                    ChatMessage.message_id, ChatMessage.sentiment_score, ChatMessage.timestamp, ChatMessage.emotion_vector
+                ).join(ChatSession, ChatMessage.session_id == ChatSession.session_id)
                 user_messages = user_messages.filter(ChatSession.user_id == user_id, ChatMessage.sender == 'user').all()
                 sentiment_scores = [msg.sentiment_score for msg in user_messages if msg.sentiment_score is not None]
                 average_mood = round(sum(sentiment_scores) / len(sentiment_scores), 2) if sentiment_scores else None
@@ -1524,8 +2131,27 @@ def get_analytics(user_id):
                             pass
                 topics_count = len(topics)
 
-                # Insights: can be extended, for now just return empty or basic
+                # Insights: emotion profile across all user messages from their stored vectors
                 insights = {}
+                if emotion_analyzer and user_messages:
+                    def load_texts(indices):
+                        ids = [user_messages[i].message_id for i in indices]
+                        texts = dict(db.session.query(ChatMessage.message_id, ChatMessage.message_text)
+                                     .filter(ChatMessage.message_id.in_(ids)).all())
+                        return [texts.get(message_id, '') for message_id in ids]
+
+                    emotion_scores, labels = emotion_analyzer.stored_emotion_matrix(
+                        [msg.emotion_vector for msg in user_messages], load_texts
+                    )
+                    average_scores = emotion_scores.mean(axis=0)
+                    top_emotions = [i for i in np.argsort(-average_scores) if average_scores[i] > 0 and labels[i] != 'neutral'][:3]
+                    insights = {
+                        'dominantEmotions': [
+                            {'emotion': labels[i], 'averageIntensity': round(float(average_scores[i]), 3)}
+                            for i in top_emotions
+                        ],
+                        'messagesAnalyzed': len(user_messages)
+                    }
 
                 return jsonify({
                     'totalSessions': total_sessions,
@@ -1600,9 +2226,22 @@ def get_session_messages(session_id):
                 session_obj = ChatSession.query.filter_by(session_id=session_id, user_id=user_id).first()
                 if not session_obj:
                     return jsonify({'error': 'Session not found'}), 404
-                messages = ChatMessage.query.filter_by(session_id=session_id).order_by(ChatMessage.timestamp.asc()).all()
+                query = ChatMessage.query.filter_by(session_id=session_id)
+                if paging_requested(request.args):
+                    try:
+                        messages, paging = page_messages(query, request.args)
+                    except ValueError as e:
+                        return jsonify({'error': str(e)}), 400
+                else:
+                    read_at = datetime.utcnow()
+                    messages = query.order_by(ChatMessage.timestamp.asc()).all()
+                    paging = {
+                        'has_more': False,
+                        'next_cursor': None,
+                        'sync_cursor': message_sync_cursor(messages[-1] if messages else None, read_at)
+                    }
                 messages_data = [m.to_dict() for m in messages]
-                return jsonify({'messages': messages_data}), 200
+                return jsonify({'messages': messages_data, **paging}), 200
         else:
             from app import messages as global_messages
             user_messages = [m for m in global_messages if m.get('session_id') == session_id]
@@ -0,0 +1,120 @@
+"""
+Benchmark cold-start time and per-worker memory of the embedding storage formats.
+
+Creates a SQLite ``training_data`` table holding the same synthetic embeddings as
+legacy JSON text and as packed float32 blobs, plus the ``.npy`` snapshot, then
+starts several worker processes per format (like gunicorn workers) that each load
+the full matrix and report load time and resident memory. ``anon`` memory is
+private to each worker; ``file`` memory is page cache shared between workers.
+
+Usage:
+    python bench_embeddings.py [--rows 50000] [--workers 4]
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from retrieval import EMBEDDING_DIM, pack_embedding
+
+MODES = ('json', 'blob', 'mmap')
+
+def prepare(directory: str, rows: int, seed: int = 3) -> None:
+    """Write the database and ``.npy`` snapshot for ``rows`` random unit vectors."""
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((rows, EMBEDDING_DIM)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    connection = sqlite3.connect(os.path.join(directory, 'bench.db'))
+    connection.execute("CREATE TABLE training_data (id INTEGER PRIMARY KEY, embedding TEXT, embedding_vector BLOB)")
+    connection.executemany(
+        "INSERT INTO training_data (embedding, embedding_vector) VALUES (?, ?)",
+        ((json.dumps(vector.tolist()), pack_embedding(vector)) for vector in matrix)
+    )
+    connection.commit()
+    connection.close()
+    np.save(os.path.join(directory, 'embeddings.npy'), matrix)
+
+def _memory() -> Dict[str, float]:
+    """Resident memory of this process in MiB, split into private (anon) and file-backed pages."""
+    fields = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'RssAnon', 'RssFile'):
+                fields[key] = int(value.split()[0]) / 1024
+    return fields
+
+def worker(mode: str, directory: str) -> Dict[str, float]:
+    """Load the embedding matrix the way ``mode`` stores it and report time and memory."""
+    before = _memory()
+    start = time.perf_counter()
+
+    if mode == 'mmap':
+        matrix = np.load(os.path.join(directory, 'embeddings.npy'), mmap_mode='r')
+    else:
+        connection = sqlite3.connect(os.path.join(directory, 'bench.db'))
+        column = 'embedding' if mode == 'json' else 'embedding_vector'
+        values = [row[0] for row in connection.execute(f"SELECT {column} FROM training_data ORDER BY id")]
+        connection.close()
+        if mode == 'json':
+            matrix = np.array([json.loads(value) for value in values], dtype=np.float32)
+        else:
+            matrix = np.frombuffer(b''.join(values), dtype='<f4').reshape(-1, EMBEDDING_DIM)
+        del values
+
+    # Touch every page, as the first searches would
+    checksum = float(np.asarray(matrix, dtype=np.float32).sum(dtype=np.float64))
+    elapsed = time.perf_counter() - start
+    after = _memory()
+    return {
+        'seconds': elapsed,
+        'rss': after['VmRSS'] - before['VmRSS'],
+        'anon': after['RssAnon'] - before['RssAnon'],
+        'file': after['RssFile'] - before['RssFile'],
+        'checksum': checksum
+    }
+
+def run_workers(mode: str, directory: str, workers: int) -> list:
+    """Start ``workers`` processes at once and collect their reports."""
+    processes = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), '--worker', mode, '--dir', directory],
+                         stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    return [json.loads(process.communicate()[0]) for process in processes]
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark embedding storage formats")
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--worker', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--dir', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.dir)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        prepare(directory, args.rows)
+        print(f"{args.rows} embeddings x {EMBEDDING_DIM} float32 "
+              f"({args.rows * EMBEDDING_DIM * 4 / 2 ** 20:.1f} MiB), {args.workers} workers per format")
+        print(f"{'format':<8}{'load s':>9}{'rss MiB':>10}{'anon MiB':>10}{'file MiB':>10}")
+        for mode in MODES:
+            reports = run_workers(mode, directory, args.workers)
+            median = {key: float(np.median([report[key] for report in reports]))
+                      for key in ('seconds', 'rss', 'anon', 'file')}
+            print(f"{mode:<8}{median['seconds']:>9.3f}{median['rss']:>10.1f}"
+                  f"{median['anon']:>10.1f}{median['file']:>10.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark RAG example retrieval: brute-force Jaccard vs MinHash LSH vs vector index.
+
+Builds a synthetic example library by perturbing the built-in training examples
+(word drops, swaps and filler words), then times top-k queries against each
+backend and reports approximate recall against the exact Jaccard ranking.
+
+Usage:
+    python bench_retrieval.py [--examples 20000] [--queries 200] [--top-k 5] [--bands 8 16 32]
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from nlp_module import EmotionAnalyzer
+from retrieval import word_set, jaccard
+from training_store import TrainingStore, DEFAULT_DATA_PATH, read_records
+
+FILLER_WORDS = [
+    "really", "just", "so", "very", "lately", "honestly", "today", "again", "still",
+    "kind", "of", "always", "sometimes", "now", "maybe", "quite", "a", "lot", "feel",
+    "think", "know", "because", "when", "with", "my", "family", "friends", "work"
+]
+
+def synthetic_examples(count: int, seed: int = 7) -> List[dict]:
+    """``count`` near-duplicate variants of the built-in examples."""
+    rng = random.Random(seed)
+    base = read_records(DEFAULT_DATA_PATH)["training_data"]
+    examples = []
+    for i in range(count):
+        source = base[i % len(base)]
+        words = source["user_input"].split()
+        words = [w for w in words if rng.random() > 0.15] or words
+        for _ in range(rng.randint(0, 4)):
+            words.insert(rng.randint(0, len(words)), rng.choice(FILLER_WORDS))
+        if len(words) > 3 and rng.random() < 0.3:
+            a, b = rng.sample(range(len(words)), 2)
+            words[a], words[b] = words[b], words[a]
+        examples.append(dict(source, user_input=" ".join(words)))
+    return examples
+
+def write_library(examples: List[dict]) -> str:
+    """Write the default keyword tables plus ``examples`` to a temporary training data file."""
+    fd, path = tempfile.mkstemp(suffix='.jsonl')
+    with open(DEFAULT_DATA_PATH, 'r', encoding='utf-8') as source, os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for line in source:
+            if line.strip() and json.loads(line)["kind"] != "example":
+                f.write(line)
+        for example in examples:
+            f.write(json.dumps(dict(example, kind="example")) + "\n")
+    return path
+
+def build_analyzer(path: str, backend: str, bands: int = 16, permutations: int = 64) -> EmotionAnalyzer:
+    start = time.perf_counter()
+    store = TrainingStore(path, retrieval_backend=backend, minhash_permutations=permutations, minhash_bands=bands)
+    analyzer = EmotionAnalyzer(training_store=store)
+    analyzer.build_seconds = time.perf_counter() - start
+    return analyzer
+
+def recall_at_k(query: str, results: List[dict], exact: List[dict]) -> float:
+    """Share of the k slots filled with examples at least as similar as the exact k-th best (ties count)."""
+    if not exact:
+        return 1.0
+    tokens = word_set(query)
+    threshold = jaccard(tokens, word_set(exact[-1]["user_input"]))
+    hits = sum(1 for example in results if jaccard(tokens, word_set(example["user_input"])) >= threshold)
+    return min(hits, len(exact)) / len(exact)
+
+def time_queries(analyzer: EmotionAnalyzer, queries: List[tuple], top_k: int, exact_fn) -> tuple:
+    latencies, recalls = [], []
+    for text, intent in queries:
+        start = time.perf_counter()
+        results = analyzer.retrieve_similar_examples(text, intent, top_k)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(recall_at_k(text, results, exact_fn(text, intent, top_k)))
+    return np.array(latencies) * 1000, float(np.mean(recalls))
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark RAG example retrieval backends")
+    parser.add_argument('--examples', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--permutations', type=int, default=64)
+    parser.add_argument('--bands', type=int, nargs='+', default=[8, 16, 32])
+    parser.add_argument('--no-intent', action='store_true', help='search the whole library instead of one intent')
+    args = parser.parse_args(argv)
+
+    examples = synthetic_examples(args.examples)
+    path = write_library(examples)
+    rng = random.Random(11)
+    queries = [(e["user_input"], None if args.no_intent else e["intent_category"])
+               for e in rng.sample(synthetic_examples(args.examples // 4 or 1, seed=99), min(args.queries, args.examples // 4 or 1))]
+
+    exact = build_analyzer(path, "jaccard")
+    exact_fn = exact._retrieve_similar_examples_exact
+
+    configs = [("jaccard (brute force)", exact)]
+    for bands in args.bands:
+        configs.append((f"minhash {args.permutations}p/{bands}b",
+                        build_analyzer(path, "minhash", bands=bands, permutations=args.permutations)))
+    configs.append(("vector", build_analyzer(path, "vector")))
+    os.remove(path)
+
+    print(f"{len(examples)} examples, {len(queries)} queries, top-{args.top_k}, "
+          f"{'whole library' if args.no_intent else 'filtered by intent'}")
+    print(f"{'backend':<26}{'build s':>9}{'p50 ms':>9}{'p95 ms':>9}{'recall':>9}")
+    for name, analyzer in configs:
+        latencies, recall = time_queries(analyzer, queries, args.top_k, exact_fn)
+        print(f"{name:<26}{analyzer.build_seconds:>9.2f}{np.percentile(latencies, 50):>9.3f}"
+              f"{np.percentile(latencies, 95):>9.3f}{recall:>9.3f}")
+
+if __name__ == '__main__':
+    main()
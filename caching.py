@@ -0,0 +1,164 @@
+"""
+In-process caching helpers for M-bot.
+
+Provides a small thread-safe LRU cache with optional time-to-live, used to avoid
+repeating expensive work (such as GROQ calls) for inputs seen recently, and a
+single-flight helper that lets concurrent identical calls share one execution.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    Bounded, thread-safe LRU cache with an optional TTL and hit/miss counters.
+
+    Entries older than ``ttl`` seconds are treated as misses and dropped on access;
+    when the cache is full the least recently used entry is evicted.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max(1, int(max_size))
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for ``key`` or ``default`` on a miss."""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            value, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store ``value`` under ``key``, evicting the least recently used entry if full."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._entries[key] = (value, time.monotonic())
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop ``key`` from the cache if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters suitable for health/metrics endpoints."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+class FlightTimeout(TimeoutError):
+    """Raised to a SingleFlight follower whose wait for the shared call ran out."""
+
+class _Flight:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    still running wait for it and receive the same result (or exception). Nothing
+    is kept once the call finishes, so results are never stale. A follower that
+    passes ``wait_timeout`` gets ``FlightTimeout`` if the shared call takes longer.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+        self.follower_timeouts = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, wait_timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Run ``fn(*args, **kwargs)`` unless a call for ``key`` is in flight, then share its outcome.
+
+        ``wait_timeout`` bounds how long this caller waits as a follower; it does not
+        limit the call it runs as the leader.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            if not flight.done.wait(wait_timeout):
+                with self._lock:
+                    self.follower_timeouts += 1
+                raise FlightTimeout(f"Shared call still running after {wait_timeout:.2f}s")
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = fn(*args, **kwargs)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters suitable for health/metrics endpoints."""
+        with self._lock:
+            return {
+                'in_flight': len(self._flights),
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'follower_timeouts': self.follower_timeouts
+            }
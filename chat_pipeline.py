@@ -0,0 +1,99 @@
+"""
+Concurrent stage executor for the M-bot chat pipeline.
+
+A chat turn is made of several I/O-bound stages (profile lookup, history fetch,
+GROQ intent classification, ...). Stages that do not depend on each other are
+submitted to a shared thread pool so their latencies overlap instead of adding up
+(stages that call GROQ can go to a pool of their own so a slow upstream cannot
+hold up the database stages),
+and every stage is timed so slow turns can be attributed to a specific step. A
+pipeline can carry a latency budget; stages ask ``remaining()`` how long they may
+still wait.
+"""
+
+import time
+import logging
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class ChatPipeline:
+    """
+    Runs the stages of a single chat turn, overlapping the independent ones.
+
+    Background stages are started with ``submit`` and collected with ``result``;
+    stages that must run on the request thread are wrapped in ``stage``.
+    """
+
+    def __init__(self, executor: Executor, context_factory: Callable = None, name: str = "chat",
+                 budget: Optional[float] = None):
+        """
+        Args:
+            executor: Shared thread pool used for background stages.
+            context_factory: Called in each worker thread to produce a context manager
+                (e.g. ``app.app_context``) that the stage runs inside.
+            name: Label used when logging the timings.
+            budget: Seconds the whole turn may take (None for no deadline).
+        """
+        self.deadline = time.monotonic() + budget if budget else None
+        self.executor = executor
+        self.context_factory = context_factory
+        self.name = name
+        self.timings: Dict[str, float] = {}
+        self._futures: Dict[str, Future] = {}
+        self._started = time.perf_counter()
+
+    def submit(self, stage: str, fn: Callable, *args, executor: Optional[Executor] = None, **kwargs) -> None:
+        """Start a stage in the background (on ``executor`` instead of the shared pool if given)."""
+        def run_stage():
+            start = time.perf_counter()
+            try:
+                with self.context_factory() if self.context_factory else nullcontext():
+                    return fn(*args, **kwargs)
+            finally:
+                self.timings[stage] = time.perf_counter() - start
+
+        self._futures[stage] = (executor or self.executor).submit(run_stage)
+
+    def result(self, stage: str, timeout: Optional[float] = None) -> Any:
+        """Wait for a background stage and return its result (None if it was never submitted)."""
+        future = self._futures.get(stage)
+        if future is None:
+            return None
+        return future.result(timeout)
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Time a stage that runs inline on the request thread."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = time.perf_counter() - start
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline (never negative), or None without a deadline."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def elapsed(self) -> float:
+        """Wall-clock seconds since the pipeline was created."""
+        return time.perf_counter() - self._started
+
+    def server_timing(self) -> str:
+        """Render the timings as a ``Server-Timing`` header value (milliseconds)."""
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.timings.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def log_timings(self) -> None:
+        """Log per-stage timings alongside the sum a sequential pipeline would have taken."""
+        sequential = sum(self.timings.values())
+        stages = ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in self.timings.items())
+        logger.info(
+            f"{self.name} pipeline: total={self.elapsed() * 1000:.0f}ms "
+            f"(sequential {sequential * 1000:.0f}ms) {stages}"
+        )
@@ -0,0 +1,148 @@
+"""
+Write-behind enrichment of chat turns for M-bot.
+
+The chat request stores the user and bot messages in one transaction and
+queues an ``enrich_turn`` job alongside them. Workers later handle batches of
+those jobs. Each batch is one transaction:
+
+- Emotion vectors and response quality ratings go into the messages as bulk
+  updates.
+- Per-user conversation themes and weekly analytics counters are first summed
+  per row, then written once each.
+
+Batches run on several workers in several processes at once. Theme and
+analytics rows are unique per (user, theme) and (user, week) and are read with
+``FOR UPDATE``. If two batches insert the same row, the second one's flush
+raises ``IntegrityError``; the job handler rolls back and applies the batch
+again, now finding the row.
+"""
+
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import update
+
+from models import ChatMessage, ConversationTheme, UserAnalytics
+
+THEME_CATEGORIES = {
+    'Identity Affirmation': 'Identity',
+    'Gender Affirmation': 'Identity',
+    'Identity Exploration': 'Identity',
+    'Well-Being': 'Mental Health',
+    'Emotional Support': 'Mental Health',
+    'Relationships': 'Relationships',
+    'Relationship Advice': 'Relationships',
+    'Daily Support': 'Daily Life'
+}
+
+QUALITY_SCORES = {'good': 1.0, 'neutral': 0.5, 'needs_improvement': 0.0}
+
+# Sessions remembered per theme
+MAX_RELATED_SESSIONS = 50
+
+def rate_response(response_text: Optional[str]) -> str:
+    """Heuristic response_quality for a bot reply until feedback says otherwise."""
+    text = (response_text or '').strip()
+    if len(text) < 20:
+        return 'needs_improvement'
+    # Replies that engage the user (a question back) and say something substantial
+    if '?' in text and len(text) >= 60:
+        return 'good'
+    return 'neutral'
+
+def progress_level(occurrences: int) -> str:
+    if occurrences >= 10:
+        return 'advanced'
+    if occurrences >= 3:
+        return 'developing'
+    return 'beginning'
+
+def week_of(moment: datetime):
+    """Monday of the week ``moment`` falls in."""
+    return (moment - timedelta(days=moment.weekday())).date()
+
+def locked_row(session, model, create: Callable, **keys):
+    """The ``model`` row with ``keys``, locked for this transaction; inserted via ``create()`` when missing."""
+    row = session.query(model).filter_by(**keys).with_for_update().first()
+    if not row:
+        row = create()
+        session.add(row)
+        # A concurrent insert of the same row fails here (IntegrityError), not at commit
+        session.flush()
+    return row
+
+def enrich_turns(session, payloads: List[Dict], encode_emotions: Optional[Callable[[Dict[str, float]], bytes]] = None) -> None:
+    """
+    Apply a batch of ``enrich_turn`` payloads without committing (the job queue
+    commits them together with the jobs' status).
+
+    Each payload has ``user_id``, ``session_id``, ``user_message_id``,
+    ``bot_message_id``, ``emotions``, ``intent``, ``new_session`` and ``at``
+    (ISO time of the turn).
+    """
+    # Emotion vectors for the user messages
+    if encode_emotions:
+        vectors = [
+            {'message_id': p['user_message_id'], 'emotion_vector': encode_emotions(p['emotions'])}
+            for p in payloads if p.get('emotions') and p.get('user_message_id')
+        ]
+        if vectors:
+            session.execute(update(ChatMessage), vectors)
+
+    # Response quality for the bot messages
+    bot_ids = [p['bot_message_id'] for p in payloads if p.get('bot_message_id')]
+    replies = dict(session.query(ChatMessage.message_id, ChatMessage.message_text)
+                   .filter(ChatMessage.message_id.in_(bot_ids)).all()) if bot_ids else {}
+    ratings = {message_id: rate_response(text) for message_id, text in replies.items()}
+    if ratings:
+        session.execute(update(ChatMessage), [
+            {'message_id': message_id, 'response_quality': rating} for message_id, rating in ratings.items()
+        ])
+
+    # Sum the batch per theme and per analytics week before touching those rows
+    themes = defaultdict(lambda: {'count': 0, 'first': None, 'last': None, 'sessions': []})
+    weeks = defaultdict(lambda: {'sessions': 0, 'messages': 0, 'quality': []})
+    for p in payloads:
+        at = datetime.fromisoformat(p['at'])
+        if p.get('intent'):
+            theme = themes[(p['user_id'], p['intent'])]
+            theme['count'] += 1
+            theme['first'] = min(theme['first'] or at, at)
+            theme['last'] = max(theme['last'] or at, at)
+            if p['session_id'] not in theme['sessions']:
+                theme['sessions'].append(p['session_id'])
+        week = weeks[(p['user_id'], week_of(at))]
+        week['sessions'] += 1 if p.get('new_session') else 0
+        week['messages'] += (1 if p.get('user_message_id') else 0) + (1 if p.get('bot_message_id') else 0)
+        if p.get('bot_message_id') in ratings:
+            week['quality'].append(QUALITY_SCORES[ratings[p['bot_message_id']]])
+
+    for (user_id, theme_name), theme in themes.items():
+        row = locked_row(session, ConversationTheme, lambda: ConversationTheme(
+            user_id=user_id,
+            theme_name=theme_name,
+            theme_category=THEME_CATEGORIES.get(theme_name, 'General'),
+            occurrence_count=0,
+            first_mentioned=theme['first'],
+            related_sessions='[]'
+        ), user_id=user_id, theme_name=theme_name)
+        row.occurrence_count = (row.occurrence_count or 0) + theme['count']
+        row.last_mentioned = max(row.last_mentioned or theme['last'], theme['last'])
+        related = json.loads(row.related_sessions) if row.related_sessions else []
+        related += [session_id for session_id in theme['sessions'] if session_id not in related]
+        row.related_sessions = json.dumps(related[-MAX_RELATED_SESSIONS:])
+        row.progress_level = progress_level(row.occurrence_count)
+
+    for (user_id, week), counts in weeks.items():
+        row = locked_row(session, UserAnalytics, lambda: UserAnalytics(
+            user_id=user_id, week_of=week, total_sessions=0, total_messages=0
+        ), user_id=user_id, week_of=week)
+        # Running mean over the bot replies rated so far this week (half of the messages)
+        rated_before = (row.total_messages or 0) // 2
+        if counts['quality']:
+            total = (row.response_quality_avg or 0.0) * rated_before + sum(counts['quality'])
+            row.response_quality_avg = total / (rated_before + len(counts['quality']))
+        row.total_sessions = (row.total_sessions or 0) + counts['sessions']
+        row.total_messages = (row.total_messages or 0) + counts['messages']
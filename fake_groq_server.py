@@ -0,0 +1,254 @@
+"""
+Local stand-in for the GROQ chat completions API, for offline load testing.
+
+Serves the OpenAI-compatible ``POST /openai/v1/chat/completions`` endpoint that
+the GROQ SDK calls, with configurable latency, token rate, error rates and
+streaming. Replies are canned but shaped like M-bot's real traffic: intent
+classification prompts get intent JSON, summary prompts get summary JSON and
+everything else gets a plain text reply. ``GET /stats`` returns request counters.
+
+Point the app at it with:
+    GROQ_BASE_URL=http://127.0.0.1:8081 GROQ_API_KEY=fake python app.py
+
+Usage:
+    python fake_groq_server.py [--port 8081] [--latency-ms 300] [--latency-dist lognormal]
+                               [--tokens-per-second 250] [--error-rate 0.01] [--rate-limit-rate 0.02]
+                               [--bad-request-rate 0]
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional
+
+# Used when the prompt does not list its categories
+INTENTS = ["Identity Affirmation", "Well-Being", "Daily Support", "Relationships", "Self-Esteem"]
+
+REPLY_WORDS = (
+    "I hear you and it makes sense that this feels heavy right now. Thank you for sharing it with me. "
+    "What you are describing sounds important, and your feelings are valid. Can you tell me a little more "
+    "about what has been on your mind today, and what would feel supportive as we talk it through together?"
+).split()
+
+class FakeGroqConfig:
+    """Behaviour knobs shared by all request handlers."""
+
+    def __init__(self, latency_ms: float = 300.0, latency_dist: str = 'lognormal', latency_sigma: float = 0.5,
+                 tokens_per_second: float = 250.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 1.0, seed: Optional[int] = None, bad_request_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.bad_request_rate = bad_request_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            'requests': 0, 'streamed': 0, 'errors': 0, 'rate_limited': 0, 'bad_requests': 0
+        }
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.counters[key] += 1
+
+    def first_token_delay(self) -> float:
+        """Seconds before the first token, drawn from the configured distribution."""
+        mean = self.latency_ms / 1000
+        with self.lock:
+            if self.latency_dist == 'fixed':
+                return mean
+            if self.latency_dist == 'uniform':
+                return self.rng.uniform(0, 2 * mean)
+            # Lognormal with the requested mean: long right tail like a real API
+            mu = -self.latency_sigma ** 2 / 2
+            return mean * self.rng.lognormvariate(mu, self.latency_sigma)
+
+    def outcome(self) -> str:
+        """'ok', 'error' (500), 'rate_limited' (429) or 'bad_request' (400) for the next request."""
+        with self.lock:
+            roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            return 'rate_limited'
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 'error'
+        if roll < self.rate_limit_rate + self.error_rate + self.bad_request_rate:
+            return 'bad_request'
+        return 'ok'
+
+def reply_text(messages: List[Dict], max_tokens: int) -> str:
+    """Canned completion matching the kind of prompt M-bot sent."""
+    prompt = " ".join(str(message.get('content', '')) for message in messages)
+    lowered = prompt.lower()
+    if 'classify the intent' in lowered:
+        # Answer with one of the categories the prompt offers, or the app would reject the intent
+        listed = re.search(r'available intent categories:\s*(.+)', prompt, re.IGNORECASE)
+        intents = [name.strip() for name in listed.group(1).split(',') if name.strip()] if listed else INTENTS
+        return json.dumps({"intent": intents[len(prompt) % len(intents)], "confidence": 0.85,
+                           "reasoning": "Canned reply from the fake server"})
+    if 'summar' in lowered and 'json' in lowered:
+        return json.dumps({"summary": "The user talked through how they have been feeling.",
+                           "key_insights": "Wants steady support", "emotional_journey": "Settled over the session",
+                           "action_items": ["Check in tomorrow"], "session_quality_score": 7, "mood": "neutral",
+                           "topics": ["well-being"], "user_engagement_level": "medium", "breakthrough_moments": []})
+    words = REPLY_WORDS * (max_tokens // len(REPLY_WORDS) + 1)
+    return " ".join(words[:max(1, min(max_tokens, 80))])
+
+def completion_body(model: str, text: str, prompt_tokens: int) -> Dict:
+    completion_tokens = len(text.split())
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens}
+    }
+
+def chunk_body(completion_id: str, model: str, delta: Dict, finish_reason: Optional[str] = None) -> Dict:
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config: FakeGroqConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict, headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(body).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting (e.g. its read timeout fired)
+            self.close_connection = True
+
+    def do_GET(self):
+        if self.path == '/stats':
+            with self.config.lock:
+                self._send_json(200, dict(self.config.counters))
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/openai/v1/chat/completions':
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request_body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Invalid JSON", "type": "invalid_request_error"}})
+            return
+
+        config = self.config
+        config.count('requests')
+        outcome = config.outcome()
+        if outcome == 'rate_limited':
+            config.count('rate_limited')
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                            {'Retry-After': str(config.retry_after)})
+            return
+        if outcome == 'error':
+            config.count('errors')
+            time.sleep(config.first_token_delay())
+            self._send_json(500, {"error": {"message": "Internal server error", "type": "internal_error"}})
+            return
+        if outcome == 'bad_request':
+            config.count('bad_requests')
+            self._send_json(400, {"error": {"message": "Invalid request", "type": "invalid_request_error"}})
+            return
+
+        messages = request_body.get('messages', [])
+        model = request_body.get('model', 'fake-model')
+        text = reply_text(messages, int(request_body.get('max_tokens') or 256))
+        prompt_tokens = sum(len(str(message.get('content', ''))) for message in messages) // 4
+        token_delay = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+        time.sleep(config.first_token_delay())
+
+        if not request_body.get('stream'):
+            # Whole completion at once after the generation time
+            time.sleep(token_delay * len(text.split()))
+            self._send_json(200, completion_body(model, text, prompt_tokens))
+            return
+
+        config.count('streamed')
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        try:
+            events = [chunk_body(completion_id, model, {"role": "assistant", "content": ""})]
+            words = text.split(' ')
+            for i, word in enumerate(words):
+                events.append(chunk_body(completion_id, model, {"content": word + (' ' if i < len(words) - 1 else '')}))
+            events.append(chunk_body(completion_id, model, {}, 'stop'))
+            for i, event in enumerate(events):
+                if 0 < i < len(events) - 1:
+                    time.sleep(token_delay)
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+def make_server(host: str = '127.0.0.1', port: int = 8081, config: Optional[FakeGroqConfig] = None) -> ThreadingHTTPServer:
+    """Build (but do not start) a fake server; ``port=0`` picks a free port."""
+    handler = type('ConfiguredFakeGroqHandler', (FakeGroqHandler,), {'config': config or FakeGroqConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Fake GROQ chat completions server for load testing")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=300.0, help='mean time to first token')
+    parser.add_argument('--latency-dist', choices=['fixed', 'uniform', 'lognormal'], default='lognormal')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='lognormal shape (tail heaviness)')
+    parser.add_argument('--tokens-per-second', type=float, default=250.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='share of requests answered with 429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds on 429')
+    parser.add_argument('--bad-request-rate', type=float, default=0.0, help='share of requests answered with 400')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    config = FakeGroqConfig(args.latency_ms, args.latency_dist, args.latency_sigma, args.tokens_per_second,
+                            args.error_rate, args.rate_limit_rate, args.retry_after, args.seed,
+                            args.bad_request_rate)
+    server = make_server(args.host, args.port, config)
+    print(f"Fake GROQ listening on http://{args.host}:{server.server_port}/openai/v1/chat/completions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
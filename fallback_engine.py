@@ -0,0 +1,168 @@
+"""
+Local fallback responses for M-bot.
+
+When GROQ is unavailable every reply comes from here, so the work per message is
+kept to one lexicon pass (shared with the rest of the turn) plus a dictionary
+lookup. Response templates are plain data; for each user profile they are
+rendered once into ready-made strings and cached, and pronoun substitution uses
+one precompiled pattern per pronoun set.
+"""
+
+import re
+import random
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from lexicon import LexiconMatch
+
+# Fallback topics in priority order; the first one present in the message wins.
+# Placeholders: {name}, {focus_given}, {focus_known}, {pronoun_text}
+TOPIC_TEMPLATES: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("greeting", (
+        "Hello {name}! I'm M, your identity mentor. How are you feeling today?",
+        "Hi {name}! I'm so glad you're here. What would you like to explore today?",
+        "Hey {name}! This is your safe space. What's on your mind?"
+    )),
+    ("identity", (
+        "Exploring your identity is such a brave journey, {name}. What aspects of yourself feel most authentic to you right now?",
+        "Identity exploration takes courage, {name}. {focus_given}what feels true about who you are?",
+        "Your authentic self matters, {name}. What part of your identity would you like to affirm today?"
+    )),
+    ("sadness", (
+        "I hear that you're feeling sad, {name}. Those feelings are completely valid. What's been weighing on your heart?",
+        "Thank you for sharing that with me, {name}. Sadness can feel heavy. Would you like to talk about what's contributing to these feelings?",
+        "I'm here with you in this difficult moment, {name}. What would feel most supportive right now?"
+    )),
+    ("anxiety", (
+        "Anxiety can feel overwhelming, {name}. You're not alone in this. What's been causing you the most worry lately?",
+        "I understand you're feeling anxious, {name}. Would you like to try a grounding technique together, or would you prefer to talk about what's on your mind?",
+        "Thank you for trusting me with your anxiety, {name}. What thoughts have been racing through your mind?"
+    )),
+    ("gender", (
+        "Gender expression is such a personal journey, {name}.{pronoun_text}. How would you like to explore this today?",
+        "Your gender identity is valid, {name}. What feels most authentic about your gender expression?",
+        "Thank you for trusting me with this part of your identity, {name}. What aspects of gender feel most important to you?"
+    )),
+    ("support", (
+        "I'm here to support you, {name}. {focus_known}What kind of support would be most helpful today?",
+        "Your well-being matters deeply, {name}. What area of your life would you like to focus on?",
+        "You deserve support and care, {name}. How can I best help you right now?"
+    )),
+    ("spiritual", (
+        "Spiritual growth is a beautiful part of the human experience, {name}. What's calling to your spirit lately?",
+        "The search for meaning is so important, {name}. What gives your life a sense of purpose?",
+        "Your spiritual journey is uniquely yours, {name}. What practices or beliefs bring you peace?"
+    )),
+    ("relationships", (
+        "Relationships can be complex, {name}. What's been on your mind about your connections with others?",
+        "Thank you for sharing about your relationships, {name}. How do others respond when you express your authentic self?",
+        "The people in our lives shape our journey, {name}. What relationship dynamics would you like to explore?"
+    )),
+)
+
+GENERAL_TEMPLATES: Tuple[str, ...] = (
+    "Thank you for sharing that with me, {name}. I'm here to listen and support you. What feels most important to talk about right now?",
+    "I hear you, {name}. {focus_given}how are you feeling about everything?",
+    "Your thoughts and feelings matter, {name}. What would be most helpful to explore together today?",
+    "I'm glad you're here, {name}. This is your safe space to share whatever is on your mind."
+)
+
+# One reply per intent for ResponseGenerator's fallback
+INTENT_TEMPLATES: Dict[str, str] = {
+    "Identity Affirmation": "Thank you for sharing that with me, {name}. Exploring identity takes courage. What feels most important to you right now?",
+    "Gender Affirmation": "I hear you, {name}. Your feelings about your gender identity are valid. What would feel supportive to you today?",
+    "Well-Being": "I understand, {name}. Taking care of your mental health is important. How have you been coping lately?",
+    "Relationships": "Relationships can be complex, {name}. What aspect of this situation feels most challenging for you?",
+    "Daily Support": "Thanks for sharing, {name}. I'm here to listen. How are you feeling about everything right now?"
+}
+
+PRONOUN_REPLACEMENTS: Tuple[Tuple[str, Dict[str, str]], ...] = (
+    ('she/her', {'they': 'she', 'them': 'her', 'their': 'her', 'theirs': 'hers'}),
+    ('he/him', {'they': 'he', 'them': 'him', 'their': 'his', 'theirs': 'his'}),
+)
+
+def pronoun_replacements(pronouns: str) -> Dict[str, str]:
+    """Generic-to-specific pronoun map for a profile's pronouns (empty for they/them or unknown)."""
+    pronouns_lower = (pronouns or '').lower()
+    for marker, mapping in PRONOUN_REPLACEMENTS:
+        if marker in pronouns_lower:
+            return mapping
+    return {}
+
+@lru_cache(maxsize=64)
+def _pronoun_pattern(words: Tuple[str, ...]) -> re.Pattern:
+    # Longest first so alternation never stops at a prefix
+    alternatives = "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+    return re.compile(r'\b(?:' + alternatives + r')\b', re.IGNORECASE)
+
+def apply_pronoun_replacements(text: str, pronoun_map: Dict[str, str]) -> str:
+    """Replace generic pronouns with the user's pronouns in a single pass."""
+    if not pronoun_map:
+        return text
+    pattern = _pronoun_pattern(tuple(sorted(pronoun_map)))
+    return pattern.sub(lambda m: pronoun_map[m.group(0).lower()], text)
+
+class FallbackEngine:
+    """
+    Renders local fallback replies.
+
+    ``match_text`` returns the lexicon match for a message (normally the current
+    knowledge snapshot's ``lexicon.match``); callers that already matched the
+    message pass the match in instead. Rendered replies are cached per profile.
+    """
+
+    def __init__(self, match_text: Callable[[str], LexiconMatch], cache_size: int = 1024):
+        self.match_text = match_text
+        self.cache_size = max(1, cache_size)
+        # Plain dict: this lookup is on every fallback reply, so it skips LRUCache's lock and clock
+        self._rendered: Dict[Tuple[str, str, str], Dict] = {}
+
+    @staticmethod
+    def _profile_fields(user_profile: Dict) -> Tuple[str, str, str]:
+        return (
+            user_profile.get('screen_name', user_profile.get('name', 'friend')) or 'friend',
+            user_profile.get('pronouns') or '',
+            user_profile.get('focus_area') or ''
+        )
+
+    def _renderer(self, user_profile: Dict) -> Dict[str, List[str]]:
+        """Every reply for this profile, rendered once: topic (or intent) -> candidate strings."""
+        fields = self._profile_fields(user_profile)
+        rendered = self._rendered.get(fields)
+        if rendered is None:
+            name, pronouns, focus_area = fields
+            values = {
+                'name': name,
+                'focus_given': f"Given your focus on {focus_area}, " if focus_area else "",
+                'focus_known': f"I know {focus_area} is important to you. " if focus_area else "",
+                'pronoun_text': f" I see you use {pronouns} pronouns" if pronouns else ""
+            }
+            rendered = {topic: [template.format(**values) for template in templates]
+                        for topic, templates in TOPIC_TEMPLATES}
+            rendered['general'] = [template.format(**values) for template in GENERAL_TEMPLATES]
+            rendered['intents'] = {intent: template.format(**values) for intent, template in INTENT_TEMPLATES.items()}
+            if len(self._rendered) >= self.cache_size:
+                # Evict the oldest profile (dicts keep insertion order)
+                self._rendered.pop(next(iter(self._rendered), None), None)
+            self._rendered[fields] = rendered
+        return rendered
+
+    def topic(self, message_text: str, match: Optional[LexiconMatch] = None) -> str:
+        """Highest-priority fallback topic in the message, or 'general'."""
+        topics = (match or self.match_text(message_text)).group('fallback')
+        for topic, _ in TOPIC_TEMPLATES:
+            if topic in topics:
+                return topic
+        return 'general'
+
+    def respond(self, message_text: str, user_profile: Dict, match: Optional[LexiconMatch] = None) -> str:
+        """A personalized reply for the message's topic."""
+        return random.choice(self._renderer(user_profile)[self.topic(message_text, match)])
+
+    def intent_response(self, intent: str, user_profile: Dict) -> str:
+        """The fixed reply for a classified intent (Daily Support for unknown intents)."""
+        replies = self._renderer(user_profile)['intents']
+        return replies.get(intent, replies['Daily Support'])
+
+    def stats(self) -> Dict:
+        return {'profiles': len(self._rendered), 'max_profiles': self.cache_size}
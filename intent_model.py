@@ -0,0 +1,304 @@
+"""
+Local intent classifier for M-bot.
+
+A CPU-only TF-IDF + multinomial logistic regression model implemented with NumPy.
+It answers in microseconds, so EmotionAnalyzer consults it first and only falls
+back to the GROQ intent call when the model's confidence is below a threshold.
+Confidences are temperature-calibrated on held-out data when enough is available;
+on small corpora the temperature stays at 1.
+
+Training data comes from the examples and intent keywords in training_data.jsonl, the
+``training_data`` table, and (message, intent) pairs logged from the LLM.
+
+Usage:
+    python intent_model.py train --output intent_model.npz [--database-url URL] [--log intent_log.jsonl]
+    python intent_model.py predict "I feel lost about who I am" [--model intent_model.npz]
+"""
+
+import os
+import re
+import json
+import logging
+import argparse
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from training_store import read_records, DEFAULT_DATA_PATH
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intent_model.npz')
+
+# Fewer held-out examples than this give a noisy temperature (a handful of
+# out-of-vocabulary rows drive it to the top of the grid), so T stays at 1.
+MIN_CALIBRATION_EXAMPLES = 100
+TEMPERATURE_GRID = np.geomspace(0.1, 10.0, 41)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word unigrams plus adjacent-word bigrams."""
+    words = _TOKEN_RE.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+class IntentClassifier:
+    """TF-IDF features with a temperature-calibrated softmax regression head."""
+
+    def __init__(self, vocabulary: Dict[str, int], idf: np.ndarray, weights: np.ndarray,
+                 bias: np.ndarray, labels: List[str], temperature: float = 1.0):
+        self.vocabulary = vocabulary
+        self.idf = idf.astype(np.float32)
+        self.weights = weights.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+        self.labels = list(labels)
+        self.temperature = float(temperature)
+
+    # ------------------------------------------------------------------
+    # Inference
+    # ------------------------------------------------------------------
+
+    def _features(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Sparse L2-normalized TF-IDF vector for ``text`` as (indices, values)."""
+        counts: Dict[int, int] = {}
+        for token in tokenize(text):
+            index = self.vocabulary.get(token)
+            if index is not None:
+                counts[index] = counts.get(index, 0) + 1
+        if not counts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        values = (1.0 + np.log(tf)) * self.idf[indices]
+        return indices, values / np.linalg.norm(values)
+
+    def predict_proba(self, text: str) -> np.ndarray:
+        """Calibrated class probabilities for ``text`` (ordered like ``labels``)."""
+        indices, values = self._features(text)
+        logits = self.bias + values @ self.weights[indices]
+        return _softmax(logits / self.temperature)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Most likely intent and its calibrated confidence."""
+        proba = self.predict_proba(text)
+        best = int(proba.argmax())
+        return self.labels[best], float(proba[best])
+
+    # ------------------------------------------------------------------
+    # Training
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def train(cls, texts: List[str], labels: List[str], epochs: int = 300, learning_rate: float = 1.0,
+              l2: float = 1e-3, holdout: float = 0.2, seed: int = 13) -> "IntentClassifier":
+        """
+        Fit a classifier on (text, label) pairs.
+
+        When ``holdout`` of the examples is at least MIN_CALIBRATION_EXAMPLES, those are
+        kept aside to fit the softmax temperature, then the weights are refit on
+        everything. Otherwise the temperature is 1.
+        """
+        if not texts:
+            raise ValueError("No training examples")
+
+        label_names = sorted(set(labels))
+        y = np.array([label_names.index(label) for label in labels])
+
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(len(texts))
+        n_holdout = int(len(texts) * holdout)
+        if n_holdout < MIN_CALIBRATION_EXAMPLES:
+            n_holdout = 0
+        calibration_idx, fit_idx = order[:n_holdout], order[n_holdout:]
+
+        model = cls._fit([texts[i] for i in fit_idx], y[fit_idx], label_names, epochs, learning_rate, l2)
+        if n_holdout:
+            model.temperature = model._fit_temperature([texts[i] for i in calibration_idx], y[calibration_idx])
+            temperature = model.temperature
+            model = cls._fit(texts, y, label_names, epochs, learning_rate, l2)
+            model.temperature = temperature
+        return model
+
+    @classmethod
+    def _fit(cls, texts: List[str], y: np.ndarray, label_names: List[str],
+             epochs: int, learning_rate: float, l2: float) -> "IntentClassifier":
+        tokenized = [tokenize(text) for text in texts]
+
+        vocabulary: Dict[str, int] = {}
+        document_frequency: List[int] = []
+        for tokens in tokenized:
+            for token in set(tokens):
+                if token not in vocabulary:
+                    vocabulary[token] = len(vocabulary)
+                    document_frequency.append(0)
+                document_frequency[vocabulary[token]] += 1
+
+        n_docs = len(texts)
+        idf = np.log((1 + n_docs) / (1 + np.array(document_frequency, dtype=np.float32))) + 1.0
+        n_features, n_classes = len(vocabulary), len(label_names)
+
+        model = cls(vocabulary, idf, np.zeros((n_features, n_classes), np.float32),
+                    np.zeros(n_classes, np.float32), label_names)
+
+        # Sparse design matrix in coordinate form
+        rows, cols, vals = [], [], []
+        for row, text in enumerate(texts):
+            indices, values = model._features(text)
+            rows.append(np.full(len(indices), row))
+            cols.append(indices)
+            vals.append(values)
+        rows = np.concatenate(rows).astype(np.int64)
+        cols = np.concatenate(cols).astype(np.int64)
+        vals = np.concatenate(vals).astype(np.float32)
+
+        targets = np.zeros((n_docs, n_classes), np.float32)
+        targets[np.arange(n_docs), y] = 1.0
+        weights, bias = model.weights, model.bias
+
+        for _ in range(epochs):
+            logits = np.tile(bias, (n_docs, 1))
+            np.add.at(logits, rows, vals[:, None] * weights[cols])
+            error = (_softmax(logits) - targets) / n_docs
+
+            grad_w = l2 * weights
+            np.add.at(grad_w, cols, vals[:, None] * error[rows])
+            weights -= learning_rate * grad_w
+            bias -= learning_rate * error.sum(axis=0)
+
+        return model
+
+    def _fit_temperature(self, texts: List[str], y: np.ndarray) -> float:
+        """Pick the softmax temperature that minimizes negative log-likelihood on ``texts``."""
+        logits = []
+        for text in texts:
+            indices, values = self._features(text)
+            logits.append(self.bias + values @ self.weights[indices])
+        logits = np.array(logits)
+
+        best_temperature, best_nll = 1.0, np.inf
+        for temperature in TEMPERATURE_GRID:
+            proba = _softmax(logits / temperature)
+            nll = -np.mean(np.log(proba[np.arange(len(y)), y] + 1e-9))
+            if nll < best_nll:
+                best_temperature, best_nll = float(temperature), nll
+        if best_temperature in (TEMPERATURE_GRID[0], TEMPERATURE_GRID[-1]):
+            logger.warning(f"Fitted temperature {best_temperature:.2f} is at the edge of the grid; "
+                           f"calibration data may be unrepresentative")
+        return best_temperature
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, path: str) -> None:
+        """Write the model as a compressed ``.npz`` artifact."""
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        np.savez_compressed(
+            path,
+            terms=np.array(terms),
+            idf=self.idf,
+            weights=self.weights,
+            bias=self.bias,
+            labels=np.array(self.labels),
+            temperature=np.array(self.temperature)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        """Load a model written by ``save``."""
+        with np.load(path, allow_pickle=False) as data:
+            terms = [str(term) for term in data['terms']]
+            return cls(
+                vocabulary={term: i for i, term in enumerate(terms)},
+                idf=data['idf'],
+                weights=data['weights'],
+                bias=data['bias'],
+                labels=[str(label) for label in data['labels']],
+                temperature=float(data['temperature'])
+            )
+
+# ----------------------------------------------------------------------
+# Training data sources
+# ----------------------------------------------------------------------
+
+def builtin_examples() -> List[Tuple[str, str]]:
+    """(text, intent) pairs from the curated examples and intent keywords in training_data.jsonl."""
+    data = read_records(DEFAULT_DATA_PATH)
+    examples = []
+    for example in data["training_data"]:
+        examples.append((example["user_input"], example["intent_category"]))
+    for intent, keywords in data["intent_keywords"].items():
+        examples.extend((keyword, intent) for keyword in keywords)
+    return examples
+
+def database_examples(database_url: str) -> List[Tuple[str, str]]:
+    """(text, intent) pairs from the ``training_data`` table."""
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(database_url)
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT DISTINCT user_input, intent_category FROM training_data"))
+        return [(row[0], row[1]) for row in rows if row[0] and row[1]]
+
+def logged_examples(log_path: str, min_confidence: float = 0.7) -> List[Tuple[str, str]]:
+    """(message, intent) pairs appended by EmotionAnalyzer when the LLM classified a message."""
+    examples = []
+    if not os.path.exists(log_path):
+        return examples
+    with open(log_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('confidence', 0) >= min_confidence and record.get('message') and record.get('intent'):
+                examples.append((record['message'], record['intent']))
+    return examples
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Train or query the local M-bot intent classifier")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help='train a model and save it')
+    train_parser.add_argument('--output', default=DEFAULT_MODEL_PATH)
+    train_parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'))
+    train_parser.add_argument('--log', default=os.getenv('INTENT_LOG_PATH'), help='JSONL of LLM-labelled messages')
+    train_parser.add_argument('--epochs', type=int, default=300)
+
+    predict_parser = subparsers.add_parser('predict', help='classify a message')
+    predict_parser.add_argument('text')
+    predict_parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == 'predict':
+        intent, confidence = IntentClassifier.load(args.model).predict(args.text)
+        print(json.dumps({'intent': intent, 'confidence': round(confidence, 4)}))
+        return
+
+    examples = builtin_examples()
+    if args.database_url:
+        try:
+            examples += database_examples(args.database_url)
+        except Exception as e:
+            logger.warning(f"Skipping training_data table: {str(e)}")
+    if args.log:
+        examples += logged_examples(args.log)
+
+    texts, labels = zip(*examples)
+    model = IntentClassifier.train(list(texts), list(labels), epochs=args.epochs)
+    accuracy = np.mean([model.predict(text)[0] == label for text, label in examples])
+    model.save(args.output)
+    logger.info(f"Trained on {len(examples)} examples ({len(model.labels)} intents, "
+                f"{len(model.vocabulary)} features, T={model.temperature:.2f}, "
+                f"train accuracy {accuracy:.2%}); saved to {args.output}")
+
+if __name__ == '__main__':
+    main()
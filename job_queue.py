@@ -0,0 +1,309 @@
+"""
+Durable background jobs for M-bot.
+
+Jobs are rows in the ``background_jobs`` table, so work queued by a request
+survives restarts and can be picked up by any app process. Worker threads claim
+a job with a conditional ``UPDATE`` (only one worker in any process wins), run
+its handler inside an app context and record the outcome. Failed jobs are
+retried with exponential backoff up to their ``max_attempts``. While a handler
+runs, its worker renews the jobs' lease every third of ``lease_seconds``; jobs left
+``running`` by a process that died stop being renewed and are put back once their
+lease expires.
+
+The number of worker threads bounds how many jobs (and so how many background
+GROQ calls) run at once per process. Kinds registered with a ``batch_size`` are
+claimed and handled up to that many jobs at a time, so their writes share one
+transaction.
+"""
+
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    """
+    Database-backed job queue with a fixed pool of worker threads.
+
+    Handlers are registered per job ``kind`` and called with the job's payload
+    dict (or a list of payloads for batched kinds); an exception marks the
+    attempt as failed. Writes a handler leaves uncommitted are committed
+    together with the jobs' ``done`` status.
+    """
+
+    def __init__(self, app, db, workers: int = 2, poll_interval: float = 2.0, lease_seconds: float = 600.0,
+                 retry_base: float = 30.0):
+        self.app = app
+        self.db = db
+        self.workers = max(0, workers)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.retry_base = retry_base
+        self.handlers: Dict[str, Tuple[Callable[[Any], Any], int]] = {}
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._last_requeue = 0.0
+        self._counters = {'succeeded': 0, 'failed': 0, 'retried': 0, 'requeued': 0}
+
+    def register(self, kind: str, handler: Callable[[Any], Any], batch_size: int = 1) -> None:
+        """Handle jobs of ``kind``; with ``batch_size`` > 1 the handler gets a list of up to that many payloads."""
+        self.handlers[kind] = (handler, max(1, batch_size))
+
+    def enqueue(self, kind: str, payload: Dict, dedupe_key: Optional[str] = None, delay: float = 0.0,
+                max_attempts: int = 3, commit: bool = True) -> Optional[BackgroundJob]:
+        """
+        Add a job; returns it, or None when a job with ``dedupe_key`` already exists.
+
+        With ``commit=False`` the job joins the caller's transaction and becomes
+        visible to workers when the caller commits (call ``notify`` afterwards).
+        A duplicate ``dedupe_key`` is skipped by the insert itself, so concurrent
+        callers never fail the caller's transaction with a unique violation.
+        """
+        values = dict(
+            kind=kind,
+            payload=json.dumps(payload),
+            dedupe_key=dedupe_key,
+            status='pending',
+            attempts=0,
+            max_attempts=max_attempts,
+            run_after=datetime.utcnow() + timedelta(seconds=delay)
+        )
+        if dedupe_key:
+            job = self._insert_unless_duplicate(values)
+            if job is None:
+                return None
+        else:
+            job = BackgroundJob(**values)
+            self.db.session.add(job)
+        if commit:
+            self.db.session.commit()
+            self.notify()
+        return job
+
+    def _insert_unless_duplicate(self, values: Dict) -> Optional[BackgroundJob]:
+        """Insert a job row, doing nothing if its ``dedupe_key`` is taken; the new job or None."""
+        session = self.db.session
+        table = BackgroundJob.__table__
+        dialect = session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+            statement = insert(table).values(**values).on_conflict_do_nothing(index_elements=['dedupe_key'])
+        elif dialect in ('mysql', 'mariadb'):
+            statement = mysql.insert(table).values(**values).prefix_with('IGNORE')
+        else:
+            # No portable insert-or-ignore; a concurrent duplicate still fails at flush here
+            if BackgroundJob.query.filter_by(dedupe_key=values['dedupe_key']).first():
+                return None
+            job = BackgroundJob(**values)
+            session.add(job)
+            return job
+        result = session.execute(statement)
+        if not result.rowcount:
+            return None
+        return session.get(BackgroundJob, result.inserted_primary_key[0])
+
+    def notify(self) -> None:
+        """Wake idle workers instead of waiting for the next poll."""
+        self._wake.set()
+
+    def start(self) -> None:
+        """Start the worker threads (no-op when already started or ``workers`` is 0)."""
+        if self._threads or self.workers <= 0:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(f"{self.worker_prefix}:{i}",),
+                                      name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} background job workers")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self, worker: str) -> None:
+        while not self._stop.is_set():
+            try:
+                ran = self.run_next(worker)
+            except Exception as e:
+                logger.error(f"Background job worker error: {str(e)}")
+                ran = False
+            if not ran:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def run_next(self, worker: str = 'inline') -> bool:
+        """Claim and run one due job; returns whether there was one."""
+        with self.app.app_context():
+            self._requeue_stale()
+            job_ids = self._claim(worker)
+            if not job_ids:
+                return False
+            self._run(job_ids, worker)
+            return True
+
+    def _claim(self, worker: str) -> List[int]:
+        """Ids of the due jobs this worker now owns: one job, or a batch of one kind."""
+        session = self.db.session
+        now = datetime.utcnow()
+        due = (BackgroundJob.status == 'pending', BackgroundJob.run_after <= now)
+        candidates = session.query(BackgroundJob.id, BackgroundJob.kind).filter(*due).order_by(
+            BackgroundJob.run_after, BackgroundJob.id
+        ).limit(5).all()
+        for job_id, kind in candidates:
+            batch_size = self.handlers.get(kind, (None, 1))[1]
+            job_ids = [job_id]
+            if batch_size > 1:
+                job_ids += [row.id for row in session.query(BackgroundJob.id).filter(
+                    *due, BackgroundJob.kind == kind, BackgroundJob.id != job_id
+                ).order_by(BackgroundJob.id).limit(batch_size - 1)]
+            # Compare-and-set: other workers may have taken some of them since the select
+            claimed = session.query(BackgroundJob).filter(
+                BackgroundJob.id.in_(job_ids), BackgroundJob.status == 'pending'
+            ).update({
+                'status': 'running',
+                'locked_by': worker,
+                'locked_at': now,
+                'attempts': BackgroundJob.attempts + 1
+            }, synchronize_session=False)
+            session.commit()
+            if claimed == len(job_ids):
+                return job_ids
+            if claimed:
+                return [row.id for row in session.query(BackgroundJob.id).filter(
+                    BackgroundJob.id.in_(job_ids), BackgroundJob.status == 'running', BackgroundJob.locked_by == worker
+                )]
+        return []
+
+    @contextmanager
+    def _lease_renewal(self, job_ids: List[int], worker: str):
+        """Keep renewing the lease on ``job_ids`` from a side thread until the block exits."""
+        engine = self.db.engine
+        table = BackgroundJob.__table__
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    # Own connection: the handler's session may be in the middle of its transaction
+                    with engine.begin() as connection:
+                        renewed = connection.execute(update(table).where(
+                            table.c.id.in_(job_ids), table.c.status == 'running', table.c.locked_by == worker
+                        ).values(locked_at=datetime.utcnow())).rowcount
+                    if renewed < len(job_ids):
+                        logger.warning(f"Lost the lease on {len(job_ids) - renewed} background jobs held by {worker}")
+                except Exception as e:
+                    logger.error(f"Failed to renew background job lease: {str(e)}")
+
+        thread = threading.Thread(target=renew, name=f'job-lease-{job_ids[0]}', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def _run(self, job_ids: List[int], worker: str) -> None:
+        session = self.db.session
+        jobs = session.query(BackgroundJob).filter(BackgroundJob.id.in_(job_ids)).order_by(BackgroundJob.id).all()
+        kind = jobs[0].kind
+        attempts = [(job.id, job.attempts, job.max_attempts) for job in jobs]
+        payloads = [json.loads(job.payload) if job.payload else {} for job in jobs]
+        handler, batch_size = self.handlers.get(kind, (None, 1))
+        start = time.perf_counter()
+        # The outcome is committed inside the block so renewal never waits on the handler's transaction
+        with self._lease_renewal(job_ids, worker):
+            try:
+                if handler is None:
+                    raise LookupError(f"No handler registered for job kind '{kind}'")
+                handler(payloads if batch_size > 1 else payloads[0])
+                session.query(BackgroundJob).filter(BackgroundJob.id.in_(job_ids)).update({
+                    'status': 'done',
+                    'locked_by': None,
+                    'last_error': None,
+                    'updated_at': datetime.utcnow()
+                }, synchronize_session=False)
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                for job_id, job_attempts, max_attempts in attempts:
+                    self._record_failure(job_id, kind, job_attempts, max_attempts, e)
+                return
+        self._count('succeeded', len(job_ids))
+        label = f"Background job {job_ids[0]}" if len(job_ids) == 1 else f"{len(job_ids)} background jobs"
+        logger.info(f"{label} ({kind}) done in {time.perf_counter() - start:.2f}s")
+
+    def _record_failure(self, job_id: int, kind: str, attempts: int, max_attempts: int, error: Exception) -> None:
+        values = {'locked_by': None, 'last_error': str(error)[:2000], 'updated_at': datetime.utcnow()}
+        if attempts >= max_attempts:
+            values['status'] = 'failed'
+            self._count('failed')
+            logger.error(f"Background job {job_id} ({kind}) failed after {attempts} attempts: {str(error)}")
+        else:
+            delay = self.retry_base * (2 ** (attempts - 1))
+            values['status'] = 'pending'
+            values['run_after'] = datetime.utcnow() + timedelta(seconds=delay)
+            self._count('retried')
+            logger.warning(f"Background job {job_id} ({kind}) attempt {attempts} failed ({str(error)}), retry in {delay:.0f}s")
+        session = self.db.session
+        session.query(BackgroundJob).filter_by(id=job_id).update(values, synchronize_session=False)
+        session.commit()
+
+    def _requeue_stale(self) -> None:
+        """Put back jobs whose worker stopped renewing its lease (checked at most every quarter lease)."""
+        with self._lock:
+            if time.monotonic() - self._last_requeue < self.lease_seconds / 4:
+                return
+            self._last_requeue = time.monotonic()
+        session = self.db.session
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        stale = session.query(BackgroundJob).filter(
+            BackgroundJob.status == 'running',
+            BackgroundJob.locked_at < cutoff
+        )
+        exhausted = stale.filter(BackgroundJob.attempts >= BackgroundJob.max_attempts).update(
+            {'status': 'failed', 'locked_by': None, 'last_error': 'Lease expired'}, synchronize_session=False
+        )
+        requeued = stale.update(
+            {'status': 'pending', 'locked_by': None, 'last_error': 'Lease expired'}, synchronize_session=False
+        )
+        session.commit()
+        if exhausted or requeued:
+            self._count('requeued', requeued)
+            logger.warning(f"Requeued {requeued} and failed {exhausted} background jobs with expired leases")
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[key] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-status job counts plus this process's worker counters."""
+        with self._lock:
+            stats = dict(self._counters)
+        stats['workers'] = len(self._threads)
+        try:
+            with self.app.app_context():
+                stats['jobs'] = dict(self.db.session.query(BackgroundJob.status, func.count(BackgroundJob.id))
+                                     .group_by(BackgroundJob.status).all())
+        except Exception as e:
+            logger.error(f"Failed to count background jobs: {str(e)}")
+            stats['jobs'] = None
+        return stats
@@ -0,0 +1,150 @@
+"""
+Precompiled keyword lexicon matcher for M-bot.
+
+All keyword lists (emotions, intents, topics, ...) are compiled once into a single
+n-gram lookup table. A message is tokenized once and every group is matched in a
+single pass over its tokens, with whole-word semantics (so "mad" no longer
+matches inside "made"). BatchTermMatcher does the same for many texts at once
+with NumPy.
+"""
+
+import re
+from typing import Dict, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; hyphenated and apostrophe words stay whole."""
+    return _TOKEN_RE.findall(text.lower())
+
+class LexiconMatch:
+    """Result of matching one message: its tokens and the terms hit per group and label."""
+
+    __slots__ = ('tokens', 'hits')
+
+    def __init__(self, tokens: List[str], hits: Dict[str, Dict[str, List[str]]]):
+        self.tokens = tokens
+        self.hits = hits
+
+    def group(self, group: str) -> Dict[str, List[str]]:
+        """Matched terms per label for ``group`` (labels without hits are absent)."""
+        return self.hits.get(group, {})
+
+    def terms(self, group: str, label: str) -> List[str]:
+        """Distinct terms of ``label`` found in the message."""
+        return self.hits.get(group, {}).get(label, [])
+
+    def has(self, group: str, label: str) -> bool:
+        return bool(self.terms(group, label))
+
+class LexiconMatcher:
+    """
+    Matches grouped keyword lists against text in one pass.
+
+    ``groups`` maps a group name to ``{label: [terms]}``. Multi-word terms are
+    matched as consecutive tokens; each distinct term is reported once per message.
+    """
+
+    def __init__(self, groups: Mapping[str, Mapping[str, Sequence[str]]]):
+        self.groups = {name: {label: list(terms) for label, terms in labels.items()} for name, labels in groups.items()}
+        self._index: Dict[Tuple[str, ...], List[Tuple[str, str, str]]] = {}
+        self.max_ngram = 1
+
+        for group, labels in self.groups.items():
+            for label, terms in labels.items():
+                for term in terms:
+                    key = tuple(tokenize(term))
+                    if not key:
+                        continue
+                    self._index.setdefault(key, []).append((group, label, term))
+                    self.max_ngram = max(self.max_ngram, len(key))
+
+    def match(self, text: str) -> LexiconMatch:
+        """Tokenize ``text`` once and collect the hits of every group."""
+        tokens = tokenize(text)
+        hits: Dict[str, Dict[str, List[str]]] = {}
+        index = self._index
+
+        for start in range(len(tokens)):
+            for length in range(1, min(self.max_ngram, len(tokens) - start) + 1):
+                entries = index.get(tuple(tokens[start:start + length]))
+                if not entries:
+                    continue
+                for group, label, term in entries:
+                    found = hits.setdefault(group, {}).setdefault(label, [])
+                    if term not in found:
+                        found.append(term)
+
+        return LexiconMatch(tokens, hits)
+
+class BatchTermMatcher:
+    """
+    Vectorized whole-word matching of a fixed term list against many texts.
+
+    Texts are tokenized exactly like ``LexiconMatcher``; token n-grams are then
+    encoded as integers and looked up with NumPy, so the per-term work happens in
+    array operations rather than Python loops.
+    """
+
+    def __init__(self, terms: Sequence[str]):
+        self.terms = list(terms)
+        self._vocabulary: Dict[str, int] = {}
+        encoded: Dict[int, List[Tuple[int, int]]] = {}
+
+        term_tokens = [tokenize(term) for term in self.terms]
+        for tokens in term_tokens:
+            for token in tokens:
+                self._vocabulary.setdefault(token, len(self._vocabulary))
+        self._base = len(self._vocabulary) + 1
+
+        for term_id, tokens in enumerate(term_tokens):
+            if tokens:
+                encoded.setdefault(len(tokens), []).append((self._encode([self._vocabulary[t] for t in tokens]), term_id))
+
+        # Per n-gram length: sorted codes and the term each code belongs to
+        self._tables = {}
+        for length, pairs in encoded.items():
+            pairs.sort()
+            self._tables[length] = (np.array([code for code, _ in pairs], dtype=np.int64),
+                                    np.array([term for _, term in pairs], dtype=np.int64))
+
+    def _encode(self, token_ids: List[int]) -> int:
+        code = 0
+        for token_id in token_ids:
+            code = code * self._base + token_id + 1
+        return code
+
+    def match(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Return unique (row, term index) pairs for every term found in each text."""
+        tokenized = [tokenize(text or "") for text in texts]
+        lengths = np.fromiter((len(tokens) for tokens in tokenized), dtype=np.int64, count=len(tokenized))
+        vocabulary = self._vocabulary
+        # Token ids shifted by one; 0 marks tokens outside the term vocabulary
+        ids = np.fromiter((vocabulary.get(token, -1) + 1 for tokens in tokenized for token in tokens),
+                          dtype=np.int64, count=int(lengths.sum()))
+        rows = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+
+        found_rows, found_terms = [], []
+        for length, (codes, term_ids) in self._tables.items():
+            if len(ids) < length:
+                continue
+            span = len(ids) - length + 1
+            code = np.zeros(span, dtype=np.int64)
+            valid = rows[:span] == rows[length - 1:]
+            for offset in range(length):
+                window = ids[offset:offset + span]
+                valid &= window > 0
+                code = code * self._base + window
+            positions = np.flatnonzero(valid)
+            slots = np.searchsorted(codes, code[positions])
+            slots[slots >= len(codes)] = 0
+            hit = codes[slots] == code[positions]
+            found_rows.append(rows[positions[hit]])
+            found_terms.append(term_ids[slots[hit]])
+
+        if not found_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        pairs = np.unique(np.concatenate(found_rows) * len(self.terms) + np.concatenate(found_terms))
+        return pairs // len(self.terms), pairs % len(self.terms)
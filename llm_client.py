@@ -0,0 +1,302 @@
+"""
+Resilient GROQ client for M-bot.
+
+Wraps the GROQ SDK client with explicit connect/read timeouts, a keep-alive
+connection pool, jittered exponential-backoff retries for rate limits and server
+errors (honouring ``Retry-After``) and a circuit breaker. While the breaker is
+open, calls fail immediately with ``CircuitOpenError`` so callers fall back to
+local responses instead of waiting on a degraded upstream.
+
+Deterministic requests (temperature at or below ``coalesce_max_temperature``)
+that are identical and in flight at the same time share one upstream call; a
+caller joining one waits at most its own ``timeout`` and then gets
+``FlightTimeout`` (a ``TimeoutError``) so it can fall back locally.
+
+``ResilientGroq`` exposes the same ``client.chat.completions.create(...)`` call as
+the SDK client, so it can be passed anywhere a ``Groq`` client is expected.
+"""
+
+import json
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import httpx
+import groq
+from groq import Groq
+
+from caching import FlightTimeout, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS = {408, 409, 429}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling GROQ while the circuit breaker is open."""
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` failures in a row the breaker opens and rejects
+    calls for ``reset_timeout`` seconds; it then lets a single probe call through
+    (half-open) and closes again if that call succeeds.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.opened_count = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go through now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            # Half-open: one probe at a time
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("GROQ circuit closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release(self) -> None:
+        """End a call that says nothing about upstream health (frees the half-open probe slot)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opened_count += 1
+                    logger.warning(f"GROQ circuit opened after {self._failures} consecutive failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'opened_count': self.opened_count
+            }
+
+def retry_after_seconds(response: Optional[httpx.Response]) -> Optional[float]:
+    """Delay requested by ``Retry-After`` / ``retry-after-ms`` headers, if any."""
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if 'retry-after-ms' in headers:
+            return max(0.0, float(headers['retry-after-ms']) / 1000)
+        value = headers.get('retry-after')
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def classify_error(error: Exception) -> Tuple[bool, Optional[float]]:
+    """(retryable, retry_after) for an exception raised by the GROQ SDK."""
+    if isinstance(error, (groq.APITimeoutError, groq.APIConnectionError)):
+        return True, None
+    if isinstance(error, groq.APIStatusError):
+        status = error.status_code
+        if status in RETRYABLE_STATUS or status >= 500:
+            return True, retry_after_seconds(error.response)
+    return False, None
+
+def is_timeout(error: Exception) -> bool:
+    return isinstance(error, (groq.APITimeoutError, httpx.TimeoutException))
+
+class ResilientGroq:
+    """
+    Drop-in replacement for ``groq.Groq`` with timeouts, pooling, retries and a circuit breaker.
+
+    The SDK's own retries are disabled so every attempt is visible to the retry
+    policy and the breaker. Client errors (400, 401, ...) are raised without retry
+    and do not count against the breaker. A ``timeout`` passed to ``create`` is
+    treated as a deadline for the call including its retries; running out of that
+    deadline is counted as ``deadline_exceeded`` but not held against the breaker
+    when it was shorter than ``read_timeout``.
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None, connect_timeout: float = 3.0,
+                 read_timeout: float = 30.0, max_connections: int = 16, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, coalesce_max_temperature: float = 0.2):
+        self.max_retries = max_retries
+        self.read_timeout = read_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.coalesce_max_temperature = coalesce_max_temperature
+        self.flight = SingleFlight()
+
+        timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.http_client = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        self._client = Groq(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0,
+                            http_client=self.http_client)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create_chat_completion))
+
+        self._lock = threading.Lock()
+        self._counters = {
+            'calls': 0,
+            'successes': 0,
+            'failures': 0,
+            'retries': 0,
+            'short_circuited': 0,
+            'deadline_exceeded': 0
+        }
+        self.last_error: Optional[str] = None
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._counters[key] += 1
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for retry ``attempt`` (0-based)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def create_chat_completion(self, **kwargs) -> Any:
+        """``chat.completions.create`` with coalescing, the retry policy and the circuit breaker applied."""
+        temperature = kwargs.get('temperature', 1.0)
+        if not kwargs.get('stream') and temperature is not None and temperature <= self.coalesce_max_temperature:
+            # Identical deterministic requests give the same answer; let them share one call
+            key = json.dumps({k: v for k, v in kwargs.items() if k != 'timeout'}, sort_keys=True, default=str)
+            timeout = kwargs.get('timeout')
+            try:
+                return self.flight.do(key, self._create,
+                                      wait_timeout=timeout if isinstance(timeout, (int, float)) else None, **kwargs)
+            except FlightTimeout:
+                self._count('deadline_exceeded')
+                raise
+        return self._create(**kwargs)
+
+    def _create(self, **kwargs) -> Any:
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise CircuitOpenError("GROQ circuit is open; using local fallback")
+        self._count('calls')
+
+        # A per-request timeout is the caller's deadline; retries have to fit inside it too
+        timeout = kwargs.get('timeout')
+        deadline = time.monotonic() + timeout if isinstance(timeout, (int, float)) else None
+
+        attempt = 0
+        while True:
+            if deadline is not None:
+                kwargs['timeout'] = deadline - time.monotonic()
+            # A timeout under a budget tighter than read_timeout is the caller's, not upstream's
+            caller_limited = deadline is not None and kwargs['timeout'] < self.read_timeout
+            try:
+                result = self._client.chat.completions.create(**kwargs)
+            except Exception as e:
+                retryable, retry_after = classify_error(e)
+                if not retryable:
+                    # The request itself was rejected; upstream is healthy
+                    self.breaker.record_success()
+                    raise
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                out_of_time = deadline is not None and time.monotonic() + delay >= deadline
+                if attempt >= self.max_retries or delay > self.backoff_max or out_of_time:
+                    caller_timeout = caller_limited and is_timeout(e)
+                    if out_of_time or caller_timeout:
+                        self._count('deadline_exceeded')
+                    if caller_timeout:
+                        self.breaker.release()
+                    else:
+                        self._record_failure(e)
+                    raise
+                attempt += 1
+                self._count('retries')
+                logger.warning(f"GROQ call failed ({str(e)}), retry {attempt} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+
+            if kwargs.get('stream'):
+                return self._guard_stream(result, caller_limited)
+            self._record_success()
+            return result
+
+    def _guard_stream(self, stream: Iterator, caller_limited: bool = False) -> Iterator:
+        """Count a stream as a success once it is read to the end or abandoned by the caller."""
+        try:
+            for chunk in stream:
+                yield chunk
+        except GeneratorExit:
+            self._record_success()
+            close = getattr(stream, 'close', None)
+            if close:
+                close()
+            raise
+        except Exception as e:
+            if caller_limited and is_timeout(e):
+                self._count('deadline_exceeded')
+                self.breaker.release()
+            else:
+                self._record_failure(e)
+            raise
+        self._record_success()
+
+    def _record_success(self) -> None:
+        self._count('successes')
+        self.breaker.record_success()
+
+    def _record_failure(self, error: Exception) -> None:
+        self._count('failures')
+        self.last_error = str(error)
+        self.breaker.record_failure()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and breaker state for health/metrics endpoints."""
+        with self._lock:
+            counters = dict(self._counters)
+        counters['circuit'] = self.breaker.stats()
+        counters['coalesced'] = self.flight.coalesced
+        counters['last_error'] = self.last_error
+        return counters
@@ -0,0 +1,182 @@
+"""
+End-to-end load test for the M-bot API.
+
+Each virtual user signs up, logs in, sends a few chat messages and ends the
+session, with ``--concurrency`` users running at once. Reports throughput and
+p50/p95/p99 latency per endpoint (and time to first token with ``--stream``).
+Run the app against ``fake_groq_server.py`` to measure without the real GROQ API:
+
+    python fake_groq_server.py --port 8081 &
+    GROQ_BASE_URL=http://127.0.0.1:8081 GROQ_API_KEY=fake python app.py &
+    python load_test.py --base-url http://127.0.0.1:5000 --users 50 --concurrency 10
+
+Each virtual user sends a distinct ``X-Forwarded-For`` address so the per-IP rate
+limiter does not throttle the whole run (``--single-ip`` disables that).
+
+Usage:
+    python load_test.py [--base-url URL] [--users 20] [--concurrency 5] [--messages 3] [--stream]
+"""
+
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import requests
+
+from training_store import DEFAULT_DATA_PATH, read_records
+
+class Recorder:
+    """Thread-safe per-endpoint latency and error collection."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, status: Optional[int], ok: bool) -> None:
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if status is not None:
+                self.statuses[endpoint][status] += 1
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report(self, wall_seconds: float) -> str:
+        lines = [f"{'endpoint':<18}{'count':>7}{'errors':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses"]
+        for endpoint, values in self.latencies.items():
+            ms = np.array(values) * 1000
+            statuses = " ".join(f"{code}:{n}" for code, n in sorted(self.statuses[endpoint].items()))
+            lines.append(
+                f"{endpoint:<18}{len(values):>7}{self.errors[endpoint]:>8}{len(values) / wall_seconds:>8.1f}"
+                f"{np.percentile(ms, 50):>9.1f}{np.percentile(ms, 95):>9.1f}{np.percentile(ms, 99):>9.1f}  {statuses}"
+            )
+        return "\n".join(lines)
+
+class VirtualUser:
+    """One signup -> login -> chat x N -> end_session journey."""
+
+    def __init__(self, base_url: str, recorder: Recorder, messages: List[str], stream: bool, forwarded_for: Optional[str],
+                 timeout: float):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.messages = messages
+        self.stream = stream
+        self.timeout = timeout
+        self.http = requests.Session()
+        if forwarded_for:
+            self.http.headers['X-Forwarded-For'] = forwarded_for
+
+    def _call(self, endpoint: str, path: str, body: Dict, expected=(200, 201)) -> Optional[Dict]:
+        start = time.perf_counter()
+        try:
+            response = self.http.post(self.base_url + path, json=body, timeout=self.timeout)
+        except requests.RequestException:
+            self.recorder.record(endpoint, time.perf_counter() - start, None, False)
+            return None
+        self.recorder.record(endpoint, time.perf_counter() - start, response.status_code, response.status_code in expected)
+        try:
+            return response.json() if response.status_code in expected else None
+        except ValueError:
+            return None
+
+    def _stream_chat(self, message: str) -> Optional[Dict]:
+        """POST /api/chat/stream, recording time to first token and total time; returns the done event."""
+        start = time.perf_counter()
+        done, first_token = None, None
+        try:
+            with self.http.post(self.base_url + '/api/chat/stream', json={'message': message},
+                                stream=True, timeout=self.timeout) as response:
+                if response.status_code != 200:
+                    self.recorder.record('chat/stream', time.perf_counter() - start, response.status_code, False)
+                    return None
+                event = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith('event: '):
+                        event = line[7:]
+                    elif line.startswith('data: '):
+                        data = json.loads(line[6:])
+                        if first_token is None and 'token' in data:
+                            first_token = time.perf_counter() - start
+                        if event == 'done':
+                            done = data
+                        event = None
+        except requests.RequestException:
+            self.recorder.record('chat/stream', time.perf_counter() - start, None, False)
+            return None
+        self.recorder.record('chat/stream', time.perf_counter() - start, 200, done is not None)
+        if first_token is not None:
+            self.recorder.record('chat/stream ttft', first_token, None, True)
+        return done
+
+    def run(self) -> None:
+        email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+        password = 'load-test-password'
+        signup = self._call('signup', '/api/signup', {'email': email, 'password': password})
+        if signup is None:
+            return
+        login = self._call('login', '/api/login', {'email': email, 'password': password})
+        # A failed login is already counted; carry on with the signup token so chat is still measured
+        token = (login or {}).get('access_token') or signup.get('access_token')
+        if not token:
+            return
+        self.http.headers['Authorization'] = f"Bearer {token}"
+
+        session_id = None
+        for message in self.messages:
+            if self.stream:
+                result = self._stream_chat(message)
+            else:
+                result = self._call('chat', '/api/chat', {'message': message})
+            if result:
+                session_id = result.get('sessionId') or session_id
+
+        if session_id:
+            self._call('end_session', '/api/end_session', {'sessionId': session_id})
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Load test the M-bot chat API")
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--users', type=int, default=20, help='virtual users (journeys) in total')
+    parser.add_argument('--concurrency', type=int, default=5, help='virtual users running at once')
+    parser.add_argument('--messages', type=int, default=3, help='chat messages per user')
+    parser.add_argument('--stream', action='store_true', help='use /api/chat/stream instead of /api/chat')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--single-ip', action='store_true', help='do not vary X-Forwarded-For per user')
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    corpus = [example['user_input'] for example in read_records(DEFAULT_DATA_PATH)['training_data']]
+    recorder = Recorder()
+    users = [
+        VirtualUser(
+            args.base_url,
+            recorder,
+            [rng.choice(corpus) for _ in range(args.messages)],
+            args.stream,
+            None if args.single_ip else f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+            args.timeout
+        )
+        for i in range(args.users)
+    ]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for future in [executor.submit(user.run) for user in users]:
+            future.result()
+    wall = time.perf_counter() - start
+
+    print(f"{args.users} users x {args.messages} messages, concurrency {args.concurrency}, "
+          f"{'streaming' if args.stream else 'JSON'} chat, {wall:.1f}s wall")
+    print(recorder.report(wall))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""
+Schema and data migrations for M-bot.
+
+``db.create_all()`` creates missing tables but never alters existing ones, so
+columns and indexes added to the models after a database was created are added
+here with ``ALTER TABLE`` and ``CREATE INDEX``. Data migrations then run in
+order; each one is idempotent, so ``run_migrations`` is safe to call on every
+startup.
+
+Usage:
+    python migrations.py [--database-url URL]
+"""
+
+import os
+import json
+import logging
+import argparse
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import bindparam, create_engine, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import MetaData
+
+from retrieval import EMBEDDING_DIM, pack_embedding, unpack_embedding
+
+logger = logging.getLogger(__name__)
+
+def add_missing_columns(engine: Engine, metadata: MetaData) -> List[str]:
+    """Add model columns that are missing from existing tables; returns ``table.column`` names added."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                logger.warning(f"Skipping NOT NULL column {table.name}.{column.name}: needs a manual migration")
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            added.append(f"{table.name}.{column.name}")
+
+    return added
+
+def _merge_duplicate_themes(connection) -> int:
+    from enrichment import MAX_RELATED_SESSIONS, progress_level
+
+    removed = 0
+    groups = connection.execute(text(
+        "SELECT user_id, theme_name FROM conversation_themes WHERE user_id IS NOT NULL AND theme_name IS NOT NULL "
+        "GROUP BY user_id, theme_name HAVING COUNT(*) > 1"
+    )).fetchall()
+    for user_id, theme_name in groups:
+        rows = connection.execute(text(
+            "SELECT id, occurrence_count, first_mentioned, last_mentioned, related_sessions FROM conversation_themes "
+            "WHERE user_id = :user_id AND theme_name = :theme_name ORDER BY id"
+        ), {'user_id': user_id, 'theme_name': theme_name}).fetchall()
+        count = sum(row[1] or 0 for row in rows)
+        firsts = [row[2] for row in rows if row[2] is not None]
+        lasts = [row[3] for row in rows if row[3] is not None]
+        related = []
+        for row in rows:
+            for session_id in json.loads(row[4]) if row[4] else []:
+                if session_id not in related:
+                    related.append(session_id)
+        connection.execute(text(
+            "UPDATE conversation_themes SET occurrence_count = :count, first_mentioned = :first, "
+            "last_mentioned = :last, related_sessions = :related, progress_level = :level WHERE id = :id"
+        ), {'count': count, 'first': min(firsts) if firsts else None, 'last': max(lasts) if lasts else None,
+            'related': json.dumps(related[-MAX_RELATED_SESSIONS:]), 'level': progress_level(count), 'id': rows[0][0]})
+        connection.execute(text("DELETE FROM conversation_themes WHERE id = :id"), [{'id': row[0]} for row in rows[1:]])
+        removed += len(rows) - 1
+    return removed
+
+def _merge_duplicate_analytics(connection) -> int:
+    removed = 0
+    groups = connection.execute(text(
+        "SELECT user_id, week_of FROM user_analytics WHERE user_id IS NOT NULL AND week_of IS NOT NULL "
+        "GROUP BY user_id, week_of HAVING COUNT(*) > 1"
+    )).fetchall()
+    for user_id, week_of in groups:
+        rows = connection.execute(text(
+            "SELECT id, total_sessions, total_messages, response_quality_avg, breakthrough_count FROM user_analytics "
+            "WHERE user_id = :user_id AND week_of = :week_of ORDER BY id"
+        ), {'user_id': user_id, 'week_of': week_of}).fetchall()
+        # Quality averages are over the rated bot replies, half of each row's messages (as in enrichment.py)
+        rated = [((row[2] or 0) // 2, row[3]) for row in rows if row[3] is not None]
+        weight = sum(count for count, _ in rated)
+        quality = sum(count * avg for count, avg in rated) / weight if weight else (rated[0][1] if rated else None)
+        connection.execute(text(
+            "UPDATE user_analytics SET total_sessions = :sessions, total_messages = :messages, "
+            "response_quality_avg = :quality, breakthrough_count = :breakthroughs WHERE id = :id"
+        ), {'sessions': sum(row[1] or 0 for row in rows), 'messages': sum(row[2] or 0 for row in rows),
+            'quality': quality, 'breakthroughs': sum(row[4] or 0 for row in rows), 'id': rows[0][0]})
+        connection.execute(text("DELETE FROM user_analytics WHERE id = :id"), [{'id': row[0]} for row in rows[1:]])
+        removed += len(rows) - 1
+    return removed
+
+def merge_duplicate_enrichment_rows(engine: Engine) -> int:
+    """
+    Fold duplicate ``conversation_themes`` (user, theme) and ``user_analytics`` (user, week) rows,
+    written by concurrent enrichment batches before those pairs were unique, into the oldest row of
+    each pair so the unique indexes can be created. Returns the number of rows removed.
+    """
+    existing_tables = set(inspect(engine).get_table_names())
+    removed = 0
+    with engine.begin() as connection:
+        if 'conversation_themes' in existing_tables:
+            removed += _merge_duplicate_themes(connection)
+        if 'user_analytics' in existing_tables:
+            removed += _merge_duplicate_analytics(connection)
+    return removed
+
+def migrate_training_embeddings(engine: Engine, batch_size: int = 500) -> int:
+    """
+    Convert legacy JSON ``training_data.embedding`` values into packed float32 ``embedding_vector`` blobs.
+
+    Values that are not EMBEDDING_DIM finite numbers are skipped and left as they are.
+    Each batch writes its blobs, reads them back and only clears the JSON of rows
+    whose blob decodes to the same vector.
+    """
+    converted = 0
+    skipped = []
+    with engine.connect() as connection:
+        rows = connection.execute(text(
+            "SELECT id, embedding FROM training_data WHERE embedding IS NOT NULL AND embedding_vector IS NULL"
+        )).fetchall()
+
+    for start in range(0, len(rows), batch_size):
+        vectors = {}
+        for row_id, embedding in rows[start:start + batch_size]:
+            try:
+                vector = np.asarray(json.loads(embedding), dtype=np.float32)
+            except (ValueError, TypeError):
+                skipped.append(row_id)
+                continue
+            if vector.shape != (EMBEDDING_DIM,) or not np.isfinite(vector).all():
+                skipped.append(row_id)
+                continue
+            vectors[row_id] = vector
+        if not vectors:
+            continue
+
+        with engine.begin() as connection:
+            connection.execute(text("UPDATE training_data SET embedding_vector = :vector WHERE id = :id"),
+                               [{'id': row_id, 'vector': pack_embedding(vector)} for row_id, vector in vectors.items()])
+            stored = connection.execute(
+                text("SELECT id, embedding_vector FROM training_data WHERE id IN :ids").bindparams(
+                    bindparam('ids', expanding=True)),
+                {'ids': list(vectors)}
+            ).fetchall()
+            verified, failed = [], []
+            for row_id, blob in stored:
+                vector = unpack_embedding(blob)
+                if vector is not None and np.array_equal(vector, vectors[row_id]):
+                    verified.append({'id': row_id})
+                else:
+                    failed.append({'id': row_id})
+            if verified:
+                connection.execute(text("UPDATE training_data SET embedding = NULL WHERE id = :id"), verified)
+                converted += len(verified)
+            if failed:
+                connection.execute(text("UPDATE training_data SET embedding_vector = NULL WHERE id = :id"), failed)
+                skipped.extend(params['id'] for params in failed)
+
+    if skipped:
+        logger.warning(f"Left {len(skipped)} training_data embeddings as JSON (wrong size or unreadable): "
+                       f"ids {skipped[:20]}")
+    return converted
+
+def backfill_session_updated_at(engine: Engine) -> int:
+    """Give sessions created before ``chat_sessions.updated_at`` existed their last known change time."""
+    with engine.begin() as connection:
+        result = connection.execute(text(
+            "UPDATE chat_sessions SET updated_at = COALESCE(ended_at, started_at) WHERE updated_at IS NULL"
+        ))
+        return result.rowcount or 0
+
+# Data migrations in the order they run
+DATA_MIGRATIONS: List[Callable[[Engine], int]] = [
+    migrate_training_embeddings,
+    backfill_session_updated_at
+]
+
+def add_missing_indexes(engine: Engine, metadata: MetaData) -> List[str]:
+    """Create model indexes that are missing from existing tables; returns the index names created."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            index.create(bind=engine)
+            created.append(index.name)
+
+    return created
+
+def run_migrations(engine: Engine, metadata: MetaData) -> None:
+    """Bring an existing database up to date with the models."""
+    added = add_missing_columns(engine, metadata)
+    if added:
+        logger.info(f"Added columns: {', '.join(added)}")
+    # Unique indexes cannot be created over duplicates
+    merged = merge_duplicate_enrichment_rows(engine)
+    if merged:
+        logger.info(f"merge_duplicate_enrichment_rows: {merged} duplicate rows merged")
+    created = add_missing_indexes(engine, metadata)
+    if created:
+        logger.info(f"Created indexes: {', '.join(created)}")
+    for migration in DATA_MIGRATIONS:
+        changed = migration(engine)
+        if changed:
+            logger.info(f"{migration.__name__}: {changed} rows migrated")
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Migrate the M-bot database schema and data")
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:///instance/mbot.db'))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    from models import db
+
+    database_url = args.database_url
+    if database_url.startswith('mysql://'):
+        database_url = database_url.replace('mysql://', 'mysql+pymysql://', 1)
+    engine = create_engine(database_url)
+    db.metadata.create_all(engine)
+    run_migrations(engine, db.metadata)
+
+if __name__ == '__main__':
+    main()
@@ -57,6 +57,11 @@ class UserProfile(db.Model):
 
 class ChatSession(db.Model):
     __tablename__ = 'chat_sessions'
+    # Keyset pagination of a user's sessions by start time, and delta sync by last change
+    __table_args__ = (
+        db.Index('ix_chat_sessions_user_started', 'user_id', 'started_at'),
+        db.Index('ix_chat_sessions_user_updated', 'user_id', 'updated_at'),
+    )
     
     session_id = db.Column(db.CHAR(36), primary_key=True)
     user_id = db.Column(db.CHAR(36), db.ForeignKey('users.user_id', ondelete='CASCADE'))
@@ -65,6 +70,17 @@ class ChatSession(db.Model):
     ended_at = db.Column(db.DateTime)
     status = db.Column(db.Enum('active', 'completed', 'abandoned', name='session_status_enum'), default='active')
     title = db.Column(db.String(200), nullable=True)
+    rolling_summary = db.Column(db.Text, nullable=True)  # Running summary of earlier exchanges for prompts
+    summary_message_count = db.Column(db.Integer, nullable=True)  # Messages covered by rolling_summary
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True)  # Row or summary last changed
+    
+    # Running statistics, updated with every stored message (see session_stats.py)
+    message_count = db.Column(db.Integer, nullable=True)
+    sentiment_sum = db.Column(db.Float, nullable=True)  # Over the user's messages
+    sentiment_count = db.Column(db.Integer, nullable=True)
+    first_user_message_id = db.Column(db.CHAR(36), nullable=True)
+    last_user_message_id = db.Column(db.CHAR(36), nullable=True)
+    keyword_sketch = db.Column(db.Text, nullable=True)  # JSON top-k word counts
     
     # Relationships
     messages = db.relationship('ChatMessage', backref='session', lazy=True)
@@ -84,6 +100,8 @@ class ChatSession(db.Model):
 
 class ChatMessage(db.Model):
     __tablename__ = 'chat_messages'
+    # Latest-messages-of-a-session lookups (history windows, pagination)
+    __table_args__ = (db.Index('ix_chat_messages_session_timestamp', 'session_id', 'timestamp'),)
     
     message_id = db.Column(db.CHAR(36), primary_key=True)
     session_id = db.Column(db.CHAR(36), db.ForeignKey('chat_sessions.session_id', ondelete='CASCADE'))
@@ -92,6 +110,7 @@ class ChatMessage(db.Model):
     message_text = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     sentiment_score = db.Column(db.Float)
+    emotion_vector = db.Column(db.LargeBinary, nullable=True)  # Packed float16 emotion scores (see EmotionAnalyzer.encode_emotions)
     response_quality = db.Column(db.Enum('good', 'neutral', 'needs_improvement', name='response_quality_enum'))
     
     def to_dict(self):
@@ -160,7 +179,9 @@ class TrainingData(db.Model):
     response_text = db.Column(db.Text, nullable=False)
     emotional_tone = db.Column(db.String(50), nullable=False)
     context_tags = db.Column(db.Text, nullable=True)  # Stored as JSON
-    embedding = db.Column(db.Text, nullable=True)  # Stored as JSON
+    embedding = db.Column(db.Text, nullable=True)  # Legacy JSON list, migrated to embedding_vector
+    embedding_vector = db.Column(db.LargeBinary, nullable=True)  # Packed float32
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True)
 
 class ChatSummary(db.Model):
     """Enhanced model to store GROQ-generated chat summaries with detailed analysis"""
@@ -221,6 +242,8 @@ class ChatSummary(db.Model):
 class UserAnalytics(db.Model):
     """Model to store aggregated user analytics and insights"""
     __tablename__ = 'user_analytics'
+    # One row per user and week: concurrent enrichment batches upsert into it (see enrichment.py)
+    __table_args__ = (db.Index('uq_user_analytics_user_week', 'user_id', 'week_of', unique=True),)
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.CHAR(36), db.ForeignKey('users.user_id', ondelete='CASCADE'))
@@ -279,6 +302,8 @@ class UserAnalytics(db.Model):
 class ConversationTheme(db.Model):
     """Model to track recurring themes across conversations"""
     __tablename__ = 'conversation_themes'
+    # One row per user and theme: concurrent enrichment batches upsert into it (see enrichment.py)
+    __table_args__ = (db.Index('uq_conversation_themes_user_theme', 'user_id', 'theme_name', unique=True),)
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.CHAR(36), db.ForeignKey('users.user_id', ondelete='CASCADE'))
@@ -318,3 +343,36 @@ class ConversationTheme(db.Model):
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
+
+class BackgroundJob(db.Model):
+    """Durable queue entry for work done outside the request (see job_queue.py)"""
+    __tablename__ = 'background_jobs'
+    __table_args__ = (db.Index('ix_background_jobs_status_run_after', 'status', 'run_after'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # Handler name, e.g. "summarize_session"
+    payload = db.Column(db.Text)  # JSON arguments for the handler
+    dedupe_key = db.Column(db.String(100), unique=True, nullable=True)  # At most one job per key
+    status = db.Column(db.Enum('pending', 'running', 'done', 'failed', name='job_status_enum'), default='pending')
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)  # Not claimed before this time (retry backoff)
+    locked_by = db.Column(db.String(64))  # Worker running the job
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'payload': json.loads(self.payload) if self.payload else {},
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
@@ -9,170 +9,135 @@ import json
 import re
 import os
 import logging
-from typing import Dict, List, Tuple, Optional, Any
+import threading
+import time
+from typing import Dict, List, Tuple, Optional, Any, Iterator, Callable
 from collections import Counter
 from datetime import datetime
 import numpy as np
+from caching import LRUCache, SingleFlight
+from fallback_engine import FallbackEngine, apply_pronoun_replacements, pronoun_replacements
+from lexicon import LexiconMatch
+from retrieval import embed_text, word_set
+from training_store import TrainingStore, KnowledgeBase
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def normalize_message(text: str) -> str:
+    """Normalize a message for cache lookups: lowercase, collapse whitespace, trim surrounding punctuation."""
+    text = re.sub(r'\s+', ' ', text.lower()).strip()
+    return text.strip('.,!?;:~ ')
+
+# Prompt templates. The system prompt (instructions + profile block) is stable per user
+# so the provider can reuse its cached prefix; per-turn context goes in the user prompt.
+SYSTEM_INSTRUCTIONS = (
+    "You are M, a highly empathetic and skilled identity mentor and therapeutic AI assistant.\n"
+    "INSTRUCTIONS:\n"
+    "1. Address the user by name naturally in your response\n"
+    "2. Use their pronouns if provided, otherwise gender-neutral language\n"
+    "3. Reference their identity goals and focus areas when relevant\n"
+    "4. Match the suggested tone of the current turn\n"
+    "5. Keep to their preferred response length\n"
+    "6. Be warm, professional, and genuinely supportive\n"
+    "7. Ask thoughtful follow-up questions when appropriate\n"
+    "8. Validate their emotions and experiences\n"
+    "Remember: You are creating a safe, non-judgmental space for personal growth and self-discovery."
+)
+
+PROFILE_TEMPLATE = (
+    "You are having a conversation with {name}.\n"
+    "USER PROFILE:\n"
+    "- Name: {name}\n"
+    "- Pronouns: {pronouns}\n"
+    "- Identity Goals: {identity_goals}\n"
+    "- Focus Areas: {focus_area}\n"
+    "- Communication Preference: {comm_style}\n"
+    "- Response Length Preference: {response_length}"
+)
+
+TURN_TEMPLATE = (
+    "{conversation_context}"
+    "CURRENT TURN:\n"
+    "- Intent: {intent}\n"
+    "- Emotional State: {emotion} (intensity: {intensity:.2f})\n"
+    "- Suggested Tone: {tone}\n"
+    "{emotional_context}"
+    "Current message from {name}: \"{message}\"\n"
+    "Please respond as M, keeping in mind {name}'s profile, emotional state, and conversation history."
+)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count used for prompt budgeting (about four characters per token)."""
+    return (len(text) + 3) // 4
+
 class EmotionAnalyzer:
     """
     Enhanced analyzer that considers user profile and conversation history
     for more personalized emotional understanding.
     """
     
-    # Emotion categories mapped to keywords
-    EMOTION_KEYWORDS = {
-        "anxiety": ["anxious", "worried", "nervous", "panic", "stress", "fear", "scared", "uneasy", "overwhelmed"],
-        "sadness": ["sad", "depressed", "unhappy", "miserable", "grief", "heartbroken", "disappointed", "lonely", "down"],
-        "anger": ["angry", "frustrated", "annoyed", "irritated", "mad", "upset", "furious", "resentful", "pissed"],
-        "confusion": ["confused", "uncertain", "unsure", "lost", "unclear", "doubt", "puzzled", "perplexed", "mixed up"],
-        "hope": ["hopeful", "optimistic", "positive", "looking forward", "excited", "eager", "anticipate", "confident"],
-        "joy": ["happy", "joyful", "delighted", "pleased", "content", "cheerful", "thrilled", "grateful", "elated"],
-        "fear": ["afraid", "terrified", "scared", "fearful", "dread", "horror", "panic", "phobia", "worried"],
-        "shame": ["ashamed", "embarrassed", "guilty", "humiliated", "mortified", "regretful"],
-        "pride": ["proud", "accomplished", "achieved", "successful", "satisfied", "fulfilled"],
-        "love": ["love", "adore", "cherish", "affection", "care", "devoted", "attached"],
-        "loneliness": ["lonely", "isolated", "alone", "disconnected", "abandoned", "excluded"]
-    }
-    
-    # Enhanced intent categories
-    INTENT_CATEGORIES = [
-        "Identity Affirmation", 
-        "Gender Affirmation", 
-        "Well-Being", 
-        "Spiritual Growth", 
-        "Relationships",
-        "Career & Goals",
-        "Family Dynamics",
-        "Self-Esteem",
-        "Trauma Processing",
-        "Daily Support"
-    ]
-    
-    # Response tones with user profile considerations
-    RESPONSE_TONES = [
-        "Supportive & Reassuring",
-        "Empowering & Reflective", 
-        "Encouraging & Safe",
-        "Affirming & Motivational",
-        "Calm & Grounding",
-        "Gentle & Suggestive",
-        "Explorative & Reflective",
-        "Guided & Meditative",
-        "Compassionate & Understanding",
-        "Coaching & Practical",
-        "Celebrating & Validating",
-        "Protective & Nurturing"
-    ]
-    
-    # Enhanced training data with user profile variables
-    TRAINING_DATA = [
-        {
-            "intent_category": "Identity Affirmation",
-            "user_input": "I feel lost about who I am.",
-            "response_variations": [
-                {
-                    "text": "Exploring your identity is a brave journey, {name}. What aspects of yourself feel unclear right now?",
-                    "emotional_tone": "Supportive & Reassuring",
-                    "user_variables": ["name"]
-                },
-                {
-                    "text": "It's completely okay to feel uncertain about identity. Given your goals around {identity_goals}, what feels most authentic to you?",
-                    "emotional_tone": "Supportive & Reassuring", 
-                    "user_variables": ["identity_goals"]
-                }
-            ],
-            "context_tags": ["identity", "self-discovery", "uncertainty", "personal growth"]
-        },
-        {
-            "intent_category": "Gender Affirmation",
-            "user_input": "I want to express my true gender but I feel scared.",
-            "response_variations": [
-                {
-                    "text": "Your feelings are completely valid, {name}. Using {pronouns} feels right to you - what's one small step you could take today to honor that?",
-                    "emotional_tone": "Encouraging & Safe",
-                    "user_variables": ["name", "pronouns"]
-                },
-                {
-                    "text": "Fear around gender expression is natural. What would feel like a safe way to explore your authentic self?",
-                    "emotional_tone": "Encouraging & Safe",
-                    "user_variables": []
-                }
-            ],
-            "context_tags": ["gender", "fear", "expression", "authenticity"]
-        },
-        {
-            "intent_category": "Well-Being",
-            "user_input": "I'm struggling with anxiety.",
-            "response_variations": [
-                {
-                    "text": "Anxiety can feel overwhelming, {name}. Since you prefer {response_length} responses, let me offer a grounding technique that might help.",
-                    "emotional_tone": "Calm & Grounding",
-                    "user_variables": ["name", "response_length"]
-                },
-                {
-                    "text": "I hear you. Given that you're focusing on {focus_area}, would you like to try a breathing exercise together?",
-                    "emotional_tone": "Calm & Grounding",
-                    "user_variables": ["focus_area"]
-                }
-            ],
-            "context_tags": ["anxiety", "mental health", "coping", "wellness"]
-        },
-        {
-            "intent_category": "Relationships",
-            "user_input": "My relationships feel strained.",
-            "response_variations": [
-                {
-                    "text": "Relationship challenges are tough, {name}. How do others typically respond when you express yourself authentically?",
-                    "emotional_tone": "Compassionate & Understanding",
-                    "user_variables": ["name"]
-                },
-                {
-                    "text": "It sounds difficult. What aspects of communication feel most challenging for you right now?",
-                    "emotional_tone": "Compassionate & Understanding",
-                    "user_variables": []
-                }
-            ],
-            "context_tags": ["relationships", "communication", "strain", "support"]
-        }
-    ]
-    
-    def __init__(self, groq_client=None):
-        """Initialize the enhanced EmotionAnalyzer with GROQ integration."""
+    def __init__(self, groq_client=None, intent_cache_size: int = 2048, intent_cache_ttl: Optional[float] = 3600,
+                 intent_model=None, intent_model_threshold: float = 0.6, intent_log_path: Optional[str] = None,
+                 training_store: Optional[TrainingStore] = None, retrieval_backend: str = "vector",
+                 minhash_permutations: int = 64, minhash_bands: int = 16):
+        """
+        Initialize the enhanced EmotionAnalyzer with GROQ integration.
+
+        Keyword tables and RAG examples come from ``training_store`` (a default store
+        over ``training_data.jsonl`` when omitted) and hot-reload with it.
+        ``intent_model`` is an optional local ``IntentClassifier``; GROQ is only asked
+        when its confidence is below ``intent_model_threshold``. When ``intent_log_path``
+        is set, LLM classifications are appended there as training data for it.
+        ``retrieval_backend`` selects RAG example retrieval for the default store:
+        "vector" (hashed n-gram embeddings in a VectorIndex), "minhash" (approximate
+        word-overlap neighbours via MinHash LSH; ``minhash_bands`` trades speed for
+        recall) or "jaccard" (exact word overlap, brute force).
+        """
         self.groq_client = groq_client
-        self._process_training_data()
-        
-    def _process_training_data(self):
-        """Process training data for enhanced RAG retrieval."""
-        self.processed_examples = []
-        
-        for example in self.TRAINING_DATA:
-            self.processed_examples.append({
-                "intent": example["intent_category"],
-                "user_input": example["user_input"],
-                "responses": [v["text"] for v in example["response_variations"]],
-                "tones": [v["emotional_tone"] for v in example["response_variations"]],
-                "user_variables": [v.get("user_variables", []) for v in example["response_variations"]],
-                "tags": example.get("context_tags", [])
-            })
-    
-    def analyze_message_with_context(self, text: str, user_profile: Dict = None, conversation_history: List = None) -> Dict[str, Any]:
+        # LLM intent results keyed on the normalized message text
+        self.intent_cache = LRUCache(max_size=intent_cache_size, ttl=intent_cache_ttl)
+        # Concurrent misses for the same key share one LLM call
+        self.intent_flight = SingleFlight()
+        self.intent_model = intent_model
+        self.intent_model_threshold = intent_model_threshold
+        self.intent_log_path = intent_log_path
+        self._intent_log_lock = threading.Lock()
+        self.training_store = training_store or TrainingStore(
+            retrieval_backend=retrieval_backend,
+            minhash_permutations=minhash_permutations,
+            minhash_bands=minhash_bands
+        )
+    
+    @property
+    def knowledge(self) -> KnowledgeBase:
+        """Current keyword/example snapshot; read it once per operation so a reload cannot mix versions."""
+        return self.training_store.snapshot
+    
+    @property
+    def emotion_labels(self) -> Tuple[str, ...]:
+        return self.knowledge.emotion_labels
+    
+    def analyze_message_with_context(self, text: str, user_profile: Dict = None, conversation_history: List = None, intent_result: Tuple[str, float] = None) -> Dict[str, Any]:
         """
         Enhanced message analysis that considers user profile and conversation context.
+
+        ``intent_result`` lets callers that already ran ``classify_intent`` (e.g.
+        concurrently with other work) skip the classification here.
         """
+        # Tokenize and match every keyword lexicon once for the whole analysis
+        match = self.knowledge.lexicon.match(text)
+        
         # Basic emotion and intent analysis
-        emotions = self.detect_emotion(text)
-        intent, intent_confidence = self.classify_intent(text)
+        emotions = self.detect_emotion(text, match)
+        intent, intent_confidence = intent_result if intent_result else self.classify_intent(text, match)
         
         # Enhanced analysis with user context
         if user_profile:
             # Adjust analysis based on user's stated goals and focus areas
             emotions = self._adjust_emotions_for_user_context(emotions, user_profile)
-            intent = self._refine_intent_with_user_profile(intent, text, user_profile)
+            intent = self._refine_intent_with_user_profile(intent, text, user_profile, match)
         
         # Conversation history analysis
         emotional_trajectory = self._analyze_emotional_trajectory(conversation_history) if conversation_history else {}
@@ -195,13 +160,14 @@ class EmotionAnalyzer:
             "suggested_tone": tone,
             "similar_examples": examples,
             "emotional_trajectory": emotional_trajectory,
-            "user_context_applied": bool(user_profile)
+            "user_context_applied": bool(user_profile),
+            "lexicon": match
         }
     
     def _adjust_emotions_for_user_context(self, emotions: Dict[str, float], user_profile: Dict) -> Dict[str, float]:
         """Adjust emotion detection based on user's profile and stated challenges."""
-        focus_areas = user_profile.get('focus_area', '').lower()
-        identity_goals = user_profile.get('identity_goals', '').lower()
+        focus_areas = (user_profile.get('focus_area') or '').lower()
+        identity_goals = (user_profile.get('identity_goals') or '').lower()
         
         # Boost certain emotions if they align with user's stated focus areas
         if 'anxiety' in focus_areas and 'anxiety' in emotions:
@@ -216,18 +182,19 @@ class EmotionAnalyzer:
         
         return emotions
     
-    def _refine_intent_with_user_profile(self, intent: str, text: str, user_profile: Dict) -> str:
+    def _refine_intent_with_user_profile(self, intent: str, text: str, user_profile: Dict, match: LexiconMatch = None) -> str:
         """Refine intent classification based on user's profile."""
-        focus_areas = user_profile.get('focus_area', '').lower()
-        identity_goals = user_profile.get('identity_goals', '').lower()
+        focus_areas = (user_profile.get('focus_area') or '').lower()
+        identity_goals = (user_profile.get('identity_goals') or '').lower()
         
         # If the detected intent is generic but user has specific focus areas, refine it
         if intent == "Well-Being":
+            match = match or self.knowledge.lexicon.match(text)
             if 'identity' in focus_areas or 'gender' in focus_areas:
-                if any(word in text.lower() for word in ['who am i', 'myself', 'identity', 'authentic']):
+                if match.has("topic", "identity"):
                     return "Identity Affirmation"
             if 'relationship' in focus_areas:
-                if any(word in text.lower() for word in ['people', 'others', 'friends', 'family']):
+                if match.has("topic", "social"):
                     return "Relationships"
         
         return intent
@@ -239,12 +206,11 @@ class EmotionAnalyzer:
         
         # Extract emotional content from recent messages
         recent_emotions = []
-        for exchange in conversation_history[-5:]:  # Last 5 exchanges
-            if 'user' in exchange:
-                emotions = self.detect_emotion(exchange['user'])
-                if emotions:
-                    dominant = max(emotions.items(), key=lambda x: x[1])
-                    recent_emotions.append(dominant)
+        user_turns = [exchange for exchange in conversation_history[-5:] if 'user' in exchange]  # Last 5 exchanges
+        for emotions in self._stored_turn_emotions(user_turns):
+            if emotions:
+                dominant = max(emotions.items(), key=lambda x: x[1])
+                recent_emotions.append(dominant)
         
         if not recent_emotions:
             return {}
@@ -270,6 +236,63 @@ class EmotionAnalyzer:
             "consistency": len(set(emotion_names)) / len(emotion_names) if emotion_names else 0
         }
     
+    def _stored_turn_emotions(self, exchanges: List[Dict]) -> List[Dict[str, float]]:
+        """Emotions of each exchange's user turn from its stored vector; turns stored without one are analyzed now."""
+        knowledge = self.knowledge
+        results = [self.decode_emotions(exchange.get('user_emotion_vector'), knowledge) for exchange in exchanges]
+        missing = [i for i, emotions in enumerate(results) if emotions is None]
+        if missing:
+            for i, emotions in zip(missing, self.analyze_batch([exchanges[i]['user'] for i in missing])):
+                results[i] = emotions
+        return results
+    
+    def encode_emotions(self, emotions: Dict[str, float], knowledge: KnowledgeBase = None) -> bytes:
+        """
+        Pack an emotion dict for storage: a 4-byte label-order checksum followed by one
+        float16 score per emotion label (in ``emotion_labels`` order).
+        """
+        knowledge = knowledge or self.knowledge
+        vector = np.array([emotions.get(label, 0.0) for label in knowledge.emotion_labels], dtype='<f2')
+        return knowledge.emotion_labels_checksum.to_bytes(4, 'little') + vector.tobytes()
+    
+    def decode_emotions(self, blob: Optional[bytes], knowledge: KnowledgeBase = None) -> Optional[Dict[str, float]]:
+        """Inverse of ``encode_emotions``; None if missing or packed for a different label set."""
+        knowledge = knowledge or self.knowledge
+        vector = self._decode_emotion_vector(blob, knowledge)
+        if vector is None:
+            return None
+        return {knowledge.emotion_labels[i]: float(vector[i]) for i in np.flatnonzero(vector)}
+    
+    @staticmethod
+    def _decode_emotion_vector(blob: Optional[bytes], knowledge: KnowledgeBase) -> Optional[np.ndarray]:
+        if not blob or len(blob) != 4 + 2 * len(knowledge.emotion_labels):
+            return None
+        if int.from_bytes(blob[:4], 'little') != knowledge.emotion_labels_checksum:
+            return None
+        return np.frombuffer(blob, dtype='<f2', offset=4).astype(np.float64)
+    
+    def stored_emotion_matrix(self, blobs: List[Optional[bytes]],
+                              load_texts: Callable[[List[int]], List[str]]) -> Tuple[np.ndarray, Tuple[str, ...]]:
+        """
+        (messages x labels) emotion scores from stored vectors, plus the label order.
+
+        Messages without a usable stored vector (e.g. written before vectors were
+        stored) are scored with ``emotion_matrix`` on the texts ``load_texts``
+        returns for their indices.
+        """
+        knowledge = self.knowledge
+        scores = np.zeros((len(blobs), len(knowledge.emotion_labels)))
+        missing = []
+        for i, blob in enumerate(blobs):
+            vector = self._decode_emotion_vector(blob, knowledge)
+            if vector is None:
+                missing.append(i)
+            else:
+                scores[i] = vector
+        if missing:
+            scores[missing] = self._emotion_matrix(knowledge, load_texts(missing))
+        return scores, knowledge.emotion_labels
+    
     def suggest_response_tone_enhanced(self, intent: str, emotions: Dict[str, float], user_profile: Dict = None) -> str:
         """Enhanced tone suggestion considering user preferences."""
         # Base tone suggestion
@@ -279,7 +302,7 @@ class EmotionAnalyzer:
             return base_tone
         
         # Adjust based on user's communication preferences
-        comm_style = user_profile.get('preferred_communication_style', '').lower()
+        comm_style = (user_profile.get('preferred_communication_style') or '').lower()
         response_length = user_profile.get('preferred_response_length', 'medium')
         
         # User preference overrides
@@ -304,6 +327,8 @@ class EmotionAnalyzer:
         # Filter or prioritize examples that can use user profile variables
         enhanced_examples = []
         for example in examples:
+            # Examples belong to the shared knowledge snapshot; personalize a copy
+            example = dict(example)
             # Check if example can be personalized with available user data
             for i, response in enumerate(example.get('responses', [])):
                 user_vars = example.get('user_variables', [])
@@ -327,19 +352,20 @@ class EmotionAnalyzer:
         
         return enhanced_examples
     
-    def detect_emotion(self, text: str) -> Dict[str, float]:
+    def detect_emotion(self, text: str, match: LexiconMatch = None) -> Dict[str, float]:
         """Enhanced emotion detection with improved accuracy."""
-        text = text.lower()
+        knowledge = self.knowledge
+        match = match or knowledge.lexicon.match(text)
+        emotion_hits = match.group("emotion")
         results = {}
         
         # Count keywords for each emotion with contextual weighting
-        for emotion, keywords in self.EMOTION_KEYWORDS.items():
+        for emotion in knowledge.emotion_keywords:
             count = 0
-            for keyword in keywords:
-                if keyword in text:
-                    # Weight longer, more specific keywords higher
-                    weight = len(keyword.split()) * 1.2 if len(keyword.split()) > 1 else 1.0
-                    count += weight
+            for keyword in emotion_hits.get(emotion, []):
+                # Weight longer, more specific keywords higher
+                weight = len(keyword.split()) * 1.2 if len(keyword.split()) > 1 else 1.0
+                count += weight
             
             # Normalize to 0-1 score
             score = min(count / 3, 1.0)  # Adjusted threshold for better sensitivity
@@ -348,20 +374,9 @@ class EmotionAnalyzer:
         
         # If no emotions detected, check for subtle indicators
         if not results:
-            subtle_indicators = {
-                "uncertainty": ["maybe", "perhaps", "not sure", "i think", "might be"],
-                "stress": ["busy", "tired", "exhausted", "overwhelmed", "pressure"],
-                "contentment": ["okay", "fine", "alright", "good", "well"]
-            }
-            
-            for indicator, words in subtle_indicators.items():
-                if any(word in text for word in words):
-                    emotion_map = {
-                        "uncertainty": "confusion",
-                        "stress": "anxiety", 
-                        "contentment": "joy"
-                    }
-                    results[emotion_map[indicator]] = 0.3
+            for emotion in knowledge.subtle_emotion_keywords:
+                if match.has("subtle", emotion):
+                    results[emotion] = 0.3
         
         # Default neutral if still nothing detected
         if not results:
@@ -369,33 +384,92 @@ class EmotionAnalyzer:
             
         return results
     
-    def classify_intent(self, text: str) -> Tuple[str, float]:
-        """Enhanced intent classification with better accuracy."""
-        if self.groq_client:
+    def emotion_matrix(self, texts: List[str]) -> np.ndarray:
+        """
+        Emotion scores for many messages as a (messages x ``emotion_labels``) array.
+
+        Messages are matched into a sparse message x lexicon-term matrix (coordinate
+        form) and all scores come from one sparse-dense product, instead of scanning
+        every keyword for every message. Rows equal ``detect_emotion``.
+        """
+        return self._emotion_matrix(self.knowledge, texts)
+    
+    def _emotion_matrix(self, knowledge: KnowledgeBase, texts: List[str]) -> np.ndarray:
+        n_labels = len(knowledge.emotion_labels)
+        if not texts:
+            return np.zeros((0, n_labels))
+        
+        rows, cols = knowledge.emotion_term_matcher.match(texts)
+        
+        counts = np.zeros((len(texts), n_labels))
+        np.add.at(counts, rows, knowledge.emotion_weights[cols])
+        scores = np.minimum(counts / 3, 1.0)
+        scores[scores <= 0.1] = 0.0
+        
+        # Subtle indicators only for messages without any emotion keyword
+        empty = ~scores.any(axis=1)
+        subtle = np.zeros_like(scores)
+        np.add.at(subtle, rows, knowledge.subtle_weights[cols])
+        scores[empty] = np.where(subtle[empty] > 0, 0.3, 0.0)
+        
+        # Default neutral if still nothing detected
+        scores[~scores.any(axis=1), -1] = 0.5
+        return scores
+    
+    def analyze_batch(self, texts: List[str]) -> List[Dict[str, float]]:
+        """Vectorized ``detect_emotion`` for many messages; returns one emotion dict per text."""
+        knowledge = self.knowledge
+        scores = self._emotion_matrix(knowledge, texts)
+        labels = knowledge.emotion_labels
+        subtle_order = [labels.index(emotion) for emotion in knowledge.subtle_emotion_keywords]
+        
+        results = []
+        for row in scores:
+            columns = np.flatnonzero(row)
+            if len(columns) and (row[columns] == 0.3).all():
+                # Subtle-indicator rows keep detect_emotion's key order (it breaks ties)
+                columns = [i for i in subtle_order if row[i]] or columns
+            results.append({labels[i]: float(row[i]) for i in columns})
+        return results
+    
+    def classify_intent(self, text: str, match: LexiconMatch = None, allow_llm: bool = True,
+                        timeout: Optional[float] = None) -> Tuple[str, float]:
+        """
+        Enhanced intent classification with better accuracy.
+
+        With ``allow_llm=False`` only the local model, cache and keywords are used.
+        ``timeout`` bounds the wait for the LLM (including a shared in-flight call);
+        past it the keyword classification is returned.
+        """
+        # Local model first; it answers in microseconds
+        if self.intent_model:
             try:
-                intent, confidence = self._classify_intent_with_llm(text)
-                if intent in self.INTENT_CATEGORIES and confidence > 0.4:  # Lower threshold
+                intent, confidence = self.intent_model.predict(text)
+                if confidence >= self.intent_model_threshold:
                     return intent, confidence
+            except Exception as e:
+                logger.error(f"Error in local intent classification: {str(e)}")
+        
+        if self.groq_client and allow_llm and (timeout is None or timeout > 0):
+            cache_key = normalize_message(text)
+            cached = self.intent_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            try:
+                result = self.intent_flight.do(cache_key, self._classify_and_cache_intent, text, cache_key, timeout,
+                                               wait_timeout=timeout)
+                if result is not None:
+                    return result
             except Exception as e:
                 logger.error(f"Error in LLM intent classification: {str(e)}")
         
         # Enhanced fallback classification
-        intent_keywords = {
-            "Identity Affirmation": ["identity", "who am i", "myself", "authentic", "real me", "true self"],
-            "Gender Affirmation": ["gender", "pronouns", "transition", "expression", "masculine", "feminine", "non-binary"],
-            "Well-Being": ["anxiety", "stress", "depression", "mental health", "wellbeing", "coping"],
-            "Spiritual Growth": ["spiritual", "mindfulness", "meditation", "purpose", "meaning", "growth"],
-            "Relationships": ["relationship", "friends", "family", "partner", "social", "people"],
-            "Career & Goals": ["work", "job", "career", "goals", "future", "ambition"],
-            "Self-Esteem": ["confidence", "self-worth", "value", "deserve", "good enough"],
-            "Daily Support": ["today", "feeling", "how are", "help", "support", "listen"]
-        }
-        
-        text_lower = text.lower()
+        knowledge = self.knowledge
+        intent_hits = (match or knowledge.lexicon.match(text)).group("intent")
         intent_scores = {}
         
-        for intent, keywords in intent_keywords.items():
-            score = sum(1 for keyword in keywords if keyword in text_lower)
+        for intent, keywords in knowledge.intent_keywords.items():
+            score = len(intent_hits.get(intent, []))
             if score > 0:
                 intent_scores[intent] = score / len(keywords)
         
@@ -405,15 +479,39 @@ class EmotionAnalyzer:
         
         return "Daily Support", 0.5  # Default fallback
     
-    def _classify_intent_with_llm(self, text: str) -> Tuple[str, float]:
-        """Enhanced LLM-based intent classification."""
+    def _classify_and_cache_intent(self, text: str, cache_key: str,
+                                   timeout: Optional[float] = None) -> Optional[Tuple[str, float]]:
+        """LLM intent for ``text``, cached and logged when usable; None when it is not."""
+        result = self._classify_intent_with_llm(text, timeout)
+        if result is None:
+            return None
+        intent, confidence = result
+        if confidence > 0.4:  # Lower threshold
+            self.intent_cache.set(cache_key, (intent, confidence))
+            self._log_intent(text, intent, confidence)
+            return intent, confidence
+        return None
+    
+    def _log_intent(self, text: str, intent: str, confidence: float) -> None:
+        """Append an LLM-labelled message to the intent log used to retrain the local model."""
+        if not self.intent_log_path:
+            return
+        record = {"message": text, "intent": intent, "confidence": confidence, "logged_at": datetime.utcnow().isoformat()}
+        try:
+            with self._intent_log_lock, open(self.intent_log_path, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write intent log: {str(e)}")
+    
+    def _classify_intent_with_llm(self, text: str, timeout: Optional[float] = None) -> Optional[Tuple[str, float]]:
+        """Enhanced LLM-based intent classification; None when the answer is not a known category."""
         prompt = f"""
         Analyze this message from a therapy/counseling context and classify the intent.
         
         User message: "{text}"
         
         Available intent categories:
-        {", ".join(self.INTENT_CATEGORIES)}
+        {", ".join(self.knowledge.intent_categories)}
         
         Consider:
         - The emotional undertone
@@ -439,7 +537,8 @@ class EmotionAnalyzer:
                 }
             ],
             temperature=0.2,
-            max_tokens=150
+            max_tokens=150,
+            **({"timeout": timeout} if timeout is not None else {})
         )
         
         content = completion.choices[0].message.content
@@ -452,12 +551,12 @@ class EmotionAnalyzer:
                 intent = result_json.get("intent")
                 confidence = result_json.get("confidence", 0.7)
                 
-                if intent in self.INTENT_CATEGORIES:
+                if intent in self.knowledge.intent_categories:
                     return (intent, float(confidence))
             except json.JSONDecodeError:
                 logger.warning("Failed to parse JSON from LLM response")
         
-        return ("Daily Support", 0.5)
+        return None
     
     def suggest_response_tone(self, intent: str, emotions: Dict[str, float]) -> str:
         """Suggest appropriate response tone based on intent and emotions."""
@@ -473,7 +572,7 @@ class EmotionAnalyzer:
             "Daily Support": ["Supportive & Reassuring", "Compassionate & Understanding"]
         }
         
-        suitable_tones = intent_tone_map.get(intent, self.RESPONSE_TONES)
+        suitable_tones = intent_tone_map.get(intent, list(self.knowledge.response_tones))
         
         if emotions:
             dominant_emotion = max(emotions.items(), key=lambda x: x[1])[0]
@@ -499,10 +598,22 @@ class EmotionAnalyzer:
     
     def retrieve_similar_examples(self, text: str, intent: str = None, top_k: int = 2) -> List[Dict]:
         """Retrieve similar examples from training data."""
+        knowledge = self.knowledge
+        if knowledge.retrieval_backend == "jaccard":
+            return self._retrieve_similar_examples_exact(text, intent, top_k)
+        if knowledge.example_minhash is not None:
+            hits = knowledge.example_minhash.query(word_set(text), top_k, partition=intent)
+            return [knowledge.processed_examples[row] for row, score in hits]
+        
+        hits = knowledge.example_index.search(embed_text(text, knowledge.example_index.dim), top_k, partition=intent)
+        return [knowledge.processed_examples[row] for row, score in hits]
+    
+    def _retrieve_similar_examples_exact(self, text: str, intent: str = None, top_k: int = 2) -> List[Dict]:
+        """Brute-force Jaccard word overlap against every example."""
         input_words = set(text.lower().split())
         
         examples_with_scores = []
-        for example in self.processed_examples:
+        for example in self.knowledge.processed_examples:
             if intent and example["intent"] != intent:
                 continue
                 
@@ -529,22 +640,43 @@ class ResponseGenerator:
     and GROQ-powered personalization.
     """
     
-    def __init__(self, groq_client, emotion_analyzer):
-        """Initialize the enhanced ResponseGenerator."""
+    def __init__(self, groq_client, emotion_analyzer, history_token_budget: int = 800, summary_max_tokens: int = 250,
+                 profile_cache_size: int = 1024, fallback_engine: Optional[FallbackEngine] = None):
+        """
+        Initialize the enhanced ResponseGenerator.
+
+        ``history_token_budget`` caps the (estimated) tokens of conversation context
+        in a prompt: the rolling summary plus as many recent exchanges as fit.
+        ``summary_max_tokens`` bounds each rolling summary update.
+        ``profile_cache_size`` bounds the cache of rendered profile blocks.
+        ``fallback_engine`` renders the local replies used when GROQ fails.
+        """
         self.groq_client = groq_client
         self.emotion_analyzer = emotion_analyzer
+        self.history_token_budget = history_token_budget
+        self.summary_max_tokens = summary_max_tokens
+        self.profile_blocks = LRUCache(max_size=profile_cache_size)
+        self.fallback_engine = fallback_engine or FallbackEngine(lambda text: emotion_analyzer.knowledge.lexicon.match(text))
     
-    def generate_response(self, user_message: str, user_profile: Dict, conversation_history: List[Dict]) -> Dict[str, Any]:
+    def generate_response(self, user_message: str, user_profile: Dict, conversation_history: List[Dict], analysis: Dict = None,
+                          conversation_summary: Optional[str] = None, deadline: Optional[float] = None) -> Dict[str, Any]:
         """
         Generate a highly personalized response using user profile and conversation context.
+
+        Pass ``analysis`` when the caller has already analyzed the message for this
+        turn so the intent classification is not repeated. ``conversation_summary``
+        is the session's rolling summary of earlier exchanges. If the GROQ call has
+        not finished by ``deadline`` (a ``time.monotonic()`` value) it is abandoned
+        and the local fallback is returned.
         """
         # Enhanced analysis with user context
-        analysis = self.emotion_analyzer.analyze_message_with_context(
-            user_message, user_profile, conversation_history
-        )
+        if analysis is None:
+            analysis = self.emotion_analyzer.analyze_message_with_context(
+                user_message, user_profile, conversation_history
+            )
         
         # Build comprehensive prompt with user context
-        prompt = self._build_enhanced_prompt(user_message, user_profile, conversation_history, analysis)
+        prompt = self._build_enhanced_prompt(user_message, user_profile, conversation_history, analysis, conversation_summary)
         
         try:
             completion = self.groq_client.chat.completions.create(
@@ -560,7 +692,8 @@ class ResponseGenerator:
                     }
                 ],
                 temperature=0.7,
-                max_tokens=self._get_response_length(user_profile.get('preferred_response_length', 'medium'))
+                max_tokens=self._get_response_length(user_profile.get('preferred_response_length', 'medium')),
+                **self._deadline_options(deadline)
             )
             
             response_text = completion.choices[0].message.content
@@ -582,77 +715,202 @@ class ResponseGenerator:
             logger.error(f"Error generating enhanced response: {str(e)}")
             return self._generate_fallback_response(user_message, user_profile, analysis)
     
-    def _build_enhanced_prompt(self, user_message: str, user_profile: Dict, conversation_history: List[Dict], analysis: Dict) -> Dict[str, str]:
-        """Build comprehensive prompt with user profile integration."""
+    def generate_response_stream(self, user_message: str, user_profile: Dict, conversation_history: List[Dict], analysis: Dict = None,
+                                 conversation_summary: Optional[str] = None, deadline: Optional[float] = None) -> Iterator[str]:
+        """
+        Stream a personalized response from GROQ as it is generated.
+
+        Yields text chunks as they arrive. Pronoun personalization is applied to
+        whole words before they are yielded; the name is left to the system prompt
+        since nothing can be prepended once text has been sent. ``deadline`` bounds
+        the wait for the stream to start. Closing the generator closes the upstream
+        stream, so generation stops when the reader goes away.
+        """
+        if analysis is None:
+            analysis = self.emotion_analyzer.analyze_message_with_context(
+                user_message, user_profile, conversation_history
+            )
         
-        # Extract user information
-        name = user_profile.get('screen_name', user_profile.get('name', 'friend'))
-        pronouns = user_profile.get('pronouns', '')
-        identity_goals = user_profile.get('identity_goals', '')
-        focus_area = user_profile.get('focus_area', '')
-        comm_style = user_profile.get('preferred_communication_style', '')
-        response_length = user_profile.get('preferred_response_length', 'medium')
+        prompt = self._build_enhanced_prompt(user_message, user_profile, conversation_history, analysis, conversation_summary)
         
-        # Build system prompt with comprehensive context
-        system_prompt = f"""
-        You are M, a highly empathetic and skilled identity mentor and therapeutic AI assistant. You are having a conversation with {name}.
-
-        USER PROFILE:
-        - Name: {name}
-        - Pronouns: {pronouns if pronouns else 'not specified'}
-        - Identity Goals: {identity_goals if identity_goals else 'general personal growth'}
-        - Focus Areas: {focus_area if focus_area else 'general wellbeing'}
-        - Communication Preference: {comm_style if comm_style else 'warm and supportive'}
-        - Response Length Preference: {response_length}
+        stream = self.groq_client.chat.completions.create(
+            model="llama-3.3-70b-versatile",
+            messages=[
+                {
+                    "role": "system",
+                    "content": prompt["system"]
+                },
+                {
+                    "role": "user",
+                    "content": prompt["user"]
+                }
+            ],
+            temperature=0.7,
+            max_tokens=self._get_response_length(user_profile.get('preferred_response_length', 'medium')),
+            stream=True,
+            **self._deadline_options(deadline)
+        )
+        
+        pronoun_map = self._get_pronoun_replacements(user_profile.get('pronouns') or '')
+        pending = ""
+        try:
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                pending += delta
+                # Only release text up to the last whitespace so words are never split
+                cut = max(pending.rfind(' '), pending.rfind('\n'))
+                if cut < 0:
+                    continue
+                ready, pending = pending[:cut + 1], pending[cut + 1:]
+                yield self._apply_pronoun_replacements(ready, pronoun_map)
+        finally:
+            close = getattr(stream, 'close', None)
+            if close:
+                close()
+        
+        if pending:
+            yield self._apply_pronoun_replacements(pending, pronoun_map)
+    
+    @staticmethod
+    def _deadline_options(deadline: Optional[float]) -> Dict[str, float]:
+        """Per-request ``timeout`` for a GROQ call that must finish by ``deadline``."""
+        if deadline is None:
+            return {}
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Chat deadline exceeded before calling GROQ")
+        return {"timeout": remaining}
+    
+    def _build_enhanced_prompt(self, user_message: str, user_profile: Dict, conversation_history: List[Dict], analysis: Dict,
+                               conversation_summary: Optional[str] = None) -> Dict[str, str]:
+        """
+        Build the system and user prompts for a turn.
 
-        CONVERSATION CONTEXT:
-        - Current Intent: {analysis['intent']}
-        - Emotional State: {analysis['dominant_emotion']} (intensity: {analysis['emotion_intensity']:.2f})
-        - Suggested Tone: {analysis['suggested_tone']}
-        
-        INSTRUCTIONS:
-        1. Address {name} by name naturally in your response
-        2. Use appropriate pronouns if provided: {pronouns if pronouns else 'use gender-neutral language'}
-        3. Reference their goals/focus areas when relevant: {identity_goals or focus_area}
-        4. Match the {analysis['suggested_tone']} tone
-        5. Keep response length {response_length}
-        6. Be warm, professional, and genuinely supportive
-        7. Ask thoughtful follow-up questions when appropriate
-        8. Validate their emotions and experiences
-        
-        Remember: You are creating a safe, non-judgmental space for personal growth and self-discovery.
+        The system prompt is the static instructions plus the user's cached profile
+        block, so it stays byte-identical across a user's turns; everything that
+        changes per turn goes in the user prompt.
         """
-        
-        # Build user context with conversation history
-        conversation_context = ""
-        if conversation_history:
-            conversation_context = "\nRECENT CONVERSATION:\n"
-            for exchange in conversation_history[-3:]:  # Last 3 exchanges
-                if 'user' in exchange:
-                    conversation_context += f"{name}: {exchange['user']}\n"
-                if 'bot' in exchange:
-                    conversation_context += f"M: {exchange['bot']}\n"
+        name = user_profile.get('screen_name', user_profile.get('name', 'friend'))
+        system_prompt = f"{SYSTEM_INSTRUCTIONS}\n\n{self._profile_block(user_profile)}"
         
         # Emotional trajectory context
         emotional_context = ""
         if analysis.get('emotional_trajectory'):
             trajectory = analysis['emotional_trajectory']
-            emotional_context = f"\nEMOTIONAL PATTERN: {trajectory.get('trend', 'stable')} trend observed in recent conversation."
-        
-        user_prompt = f"""
-        {conversation_context}
-        {emotional_context}
-        
-        Current message from {name}: "{user_message}"
-        
-        Please respond as M, keeping in mind {name}'s profile, emotional state, and conversation history.
-        """
+            emotional_context = f"EMOTIONAL PATTERN: {trajectory.get('trend', 'stable')} trend observed in recent conversation.\n"
+        
+        user_prompt = TURN_TEMPLATE.format(
+            conversation_context=self._build_conversation_context(name, conversation_history, conversation_summary),
+            intent=analysis['intent'],
+            emotion=analysis['dominant_emotion'],
+            intensity=analysis['emotion_intensity'],
+            tone=analysis['suggested_tone'],
+            emotional_context=emotional_context,
+            name=name,
+            message=user_message
+        )
         
         return {
             "system": system_prompt,
             "user": user_prompt
         }
     
+    def _profile_block(self, user_profile: Dict) -> str:
+        """Rendered USER PROFILE block, cached per user and profile version."""
+        fields = (
+            user_profile.get('screen_name', user_profile.get('name', 'friend')),
+            user_profile.get('pronouns') or 'not specified',
+            user_profile.get('identity_goals') or 'general personal growth',
+            user_profile.get('focus_area') or 'general wellbeing',
+            user_profile.get('preferred_communication_style') or 'warm and supportive',
+            user_profile.get('preferred_response_length', 'medium')
+        )
+        # Free-text fields can carry arbitrary whitespace; collapse it so it costs no tokens
+        fields = tuple(" ".join(str(value).split()) for value in fields)
+        # The field values themselves are the version: any profile or preference edit changes the key
+        cache_key = (user_profile.get('user_id'), fields)
+        block = self.profile_blocks.get(cache_key)
+        if block is None:
+            name, pronouns, identity_goals, focus_area, comm_style, response_length = fields
+            block = PROFILE_TEMPLATE.format(
+                name=name,
+                pronouns=pronouns,
+                identity_goals=identity_goals,
+                focus_area=focus_area,
+                comm_style=comm_style,
+                response_length=response_length
+            )
+            self.profile_blocks.set(cache_key, block)
+        return block
+    
+    def _build_conversation_context(self, name: str, conversation_history: List[Dict], conversation_summary: Optional[str] = None) -> str:
+        """Rolling summary plus the most recent exchanges that fit in ``history_token_budget``."""
+        budget = self.history_token_budget
+        context = ""
+        if conversation_summary:
+            # The summary may use at most half of the budget
+            summary = conversation_summary.strip()[:budget * 2]
+            context = f"CONVERSATION SO FAR:\n{summary}\n"
+            budget -= estimate_tokens(summary)
+        
+        blocks = []
+        for exchange in reversed(conversation_history or []):
+            block = ""
+            if 'user' in exchange:
+                block += f"{name}: {exchange['user']}\n"
+            if 'bot' in exchange:
+                block += f"M: {exchange['bot']}\n"
+            cost = estimate_tokens(block)
+            if cost > budget:
+                if not blocks and budget > 0:
+                    # Always keep the tail of the latest exchange
+                    blocks.append("..." + block[-budget * 4:])
+                break
+            blocks.append(block)
+            budget -= cost
+        
+        if blocks:
+            context += "RECENT CONVERSATION:\n" + "".join(reversed(blocks))
+        return context
+    
+    def update_conversation_summary(self, previous_summary: Optional[str], exchanges: List[Dict], name: str) -> str:
+        """Fold new exchanges into a session's rolling summary with one GROQ call."""
+        transcript = ""
+        for exchange in exchanges:
+            if 'user' in exchange:
+                transcript += f"{name}: {exchange['user']}\n"
+            if 'bot' in exchange:
+                transcript += f"M: {exchange['bot']}\n"
+        
+        prompt = (
+            f"Current running summary of the conversation between {name} and M:\n"
+            f"{previous_summary or '(none yet)'}\n\n"
+            f"New exchanges:\n{transcript}\n"
+            f"Rewrite the running summary so it also covers the new exchanges. Keep what {name} "
+            f"shared about their feelings, circumstances, goals and any open threads M should "
+            f"follow up on. Write in the third person, at most {self.summary_max_tokens * 3 // 4} words. "
+            f"Reply with the summary text only."
+        )
+        
+        completion = self.groq_client.chat.completions.create(
+            model="llama-3.3-70b-versatile",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You maintain concise running summaries of supportive conversations."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=0.3,
+            max_tokens=self.summary_max_tokens
+        )
+        return completion.choices[0].message.content.strip()
+    
     def _get_response_length(self, preference: str) -> int:
         """Get token limit based on user preference."""
         length_map = {
@@ -668,48 +926,32 @@ class ResponseGenerator:
         pronouns = user_profile.get('pronouns', '')
         
         # Ensure name is used appropriately
-        if name and name.lower() not in response.lower():
+        lowered = response.lower()
+        if name and name.lower() not in lowered:
             # Add name in a natural way if it's missing
             if response.startswith("I "):
                 response = f"I hear you, {name}. " + response[2:]
-            elif not any(greeting in response.lower() for greeting in [name.lower(), 'you']):
+            elif 'you' not in lowered:
                 response = f"{name}, " + response
         
         # Apply pronoun consistency if specified
         if pronouns:
-            pronoun_map = self._get_pronoun_replacements(pronouns)
-            for generic, specific in pronoun_map.items():
-                response = re.sub(r'\b' + generic + r'\b', specific, response, flags=re.IGNORECASE)
+            response = self._apply_pronoun_replacements(response, self._get_pronoun_replacements(pronouns))
         
         return response
     
+    def _apply_pronoun_replacements(self, text: str, pronoun_map: Dict[str, str]) -> str:
+        """Replace generic pronouns with the user's pronouns."""
+        return apply_pronoun_replacements(text, pronoun_map)
+    
     def _get_pronoun_replacements(self, pronouns: str) -> Dict[str, str]:
         """Get pronoun replacement mappings."""
-        pronouns_lower = pronouns.lower().strip()
-        
-        if 'she/her' in pronouns_lower:
-            return {'they': 'she', 'them': 'her', 'their': 'her', 'theirs': 'hers'}
-        elif 'he/him' in pronouns_lower:
-            return {'they': 'he', 'them': 'him', 'their': 'his', 'theirs': 'his'}
-        elif 'they/them' in pronouns_lower:
-            return {}  # Already using correct pronouns
-        
-        return {}
+        return pronoun_replacements(pronouns)
     
     def _generate_fallback_response(self, user_message: str, user_profile: Dict, analysis: Dict) -> Dict[str, Any]:
         """Generate a fallback response when GROQ fails."""
-        name = user_profile.get('screen_name', user_profile.get('name', 'friend'))
-        
-        fallback_responses = {
-            "Identity Affirmation": f"Thank you for sharing that with me, {name}. Exploring identity takes courage. What feels most important to you right now?",
-            "Gender Affirmation": f"I hear you, {name}. Your feelings about your gender identity are valid. What would feel supportive to you today?",
-            "Well-Being": f"I understand, {name}. Taking care of your mental health is important. How have you been coping lately?",
-            "Relationships": f"Relationships can be complex, {name}. What aspect of this situation feels most challenging for you?",
-            "Daily Support": f"Thanks for sharing, {name}. I'm here to listen. How are you feeling about everything right now?"
-        }
-        
         intent = analysis.get('intent', 'Daily Support')
-        response = fallback_responses.get(intent, fallback_responses['Daily Support'])
+        response = self.fallback_engine.intent_response(intent, user_profile)
         
         return {
             "response": response,
@@ -0,0 +1,105 @@
+"""
+Keyset pagination for M-bot's listing endpoints.
+
+Pages are addressed by the (timestamp, id) key of a boundary row rather than
+an offset, so fetching any page is one index range scan however many rows come
+before it. Cursors are that key, tagged with the kind of listing it belongs
+to, JSON-encoded and base64url'd: opaque to clients and stable across inserts.
+
+A listing returns the newest rows first-page-first (``before`` walks back to
+older pages) or, in delta mode, only the rows newer than a ``since`` cursor.
+
+Row timestamps are taken before their transaction commits, so a row stamped
+earlier than one already returned can still appear later, up to the longest
+write (``overlap``) after it was stamped. ``sync_cursor`` therefore never
+points past ``overlap`` seconds before the read that produced it: rows in that
+window are returned again by the next delta, and clients upsert them by id. A
+delta split over several pages carries the first page's horizon in its cursors
+until it is complete.
+"""
+
+import json
+import base64
+from datetime import datetime, timedelta
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+Key = Tuple[datetime, str]
+
+def encode_cursor(kind: str, timestamp: datetime, row_id: str, horizon: Optional[datetime] = None) -> str:
+    """Opaque cursor for the row with key (``timestamp``, ``row_id``) in a ``kind`` listing."""
+    fields = [kind, timestamp.isoformat(), row_id] + ([horizon.isoformat()] if horizon else [])
+    payload = json.dumps(fields, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_sync_cursor(cursor: str, kind: str) -> Tuple[Key, Optional[datetime]]:
+    """The key in ``cursor`` and the horizon of an unfinished delta; ValueError if malformed or from another listing."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_kind, timestamp, row_id, *rest = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if len(rest) > 1:
+            raise ValueError("too many fields")
+        key = (datetime.fromisoformat(timestamp), str(row_id))
+        horizon = datetime.fromisoformat(rest[0]) if rest else None
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+    if cursor_kind != kind:
+        raise ValueError(f"Cursor is for a '{cursor_kind}' listing, not '{kind}'")
+    return key, horizon
+
+def decode_cursor(cursor: str, kind: str) -> Key:
+    """The (timestamp, id) key in ``cursor``; ValueError if it is malformed or from another listing."""
+    return decode_sync_cursor(cursor, kind)[0]
+
+def sync_cursor(kind: str, last: Optional[Key], read_at: datetime, overlap: float, has_more: bool = False,
+                horizon: Optional[datetime] = None) -> Optional[str]:
+    """
+    ``since`` cursor to continue a delta after ``last``, the newest key of a read that started at ``read_at``.
+
+    With ``has_more`` the cursor resumes right after ``last`` and carries the horizon
+    (``horizon`` from an earlier page, else ``read_at - overlap``). Otherwise the delta
+    is complete and the cursor is moved back to that horizon if ``last`` is newer.
+    """
+    if last is None:
+        return None
+    horizon = min(horizon, read_at - timedelta(seconds=overlap)) if horizon else read_at - timedelta(seconds=overlap)
+    if has_more:
+        return encode_cursor(kind, *last, horizon=horizon)
+    if last[0] > horizon:
+        last = (horizon, '')
+    return encode_cursor(kind, *last)
+
+def page_size(value: Optional[str]) -> int:
+    """The requested page size, clamped to 1..MAX_PAGE_SIZE."""
+    if value in (None, ''):
+        return DEFAULT_PAGE_SIZE
+    try:
+        return max(1, min(MAX_PAGE_SIZE, int(value)))
+    except ValueError:
+        raise ValueError(f"Invalid limit: {value}")
+
+def keyset_page(query, time_column, id_column, limit: int, before: Optional[Key] = None,
+                after: Optional[Key] = None) -> Tuple[List[Any], bool]:
+    """
+    (rows in ascending key order, whether more rows exist beyond them).
+
+    Without ``after``: the newest ``limit`` rows, or the newest older than
+    ``before``. With ``after``: the oldest ``limit`` rows newer than it. Rows
+    with a NULL timestamp are never returned.
+    """
+    query = query.filter(time_column.isnot(None))
+    if after is not None:
+        timestamp, row_id = after
+        rows = query.filter(or_(
+            time_column > timestamp, and_(time_column == timestamp, id_column > row_id)
+        )).order_by(time_column.asc(), id_column.asc()).limit(limit + 1).all()
+        return rows[:limit], len(rows) > limit
+    if before is not None:
+        timestamp, row_id = before
+        query = query.filter(or_(time_column < timestamp, and_(time_column == timestamp, id_column < row_id)))
+    rows = query.order_by(time_column.desc(), id_column.desc()).limit(limit + 1).all()
+    return list(reversed(rows[:limit])), len(rows) > limit
@@ -0,0 +1,199 @@
+"""
+Vector retrieval for M-bot's RAG examples.
+
+Examples are embedded locally with signed feature hashing of word and character
+n-grams (no model download, deterministic across workers) into L2-normalized
+float32 vectors. VectorIndex keeps them in one contiguous matrix, optionally
+partitioned by intent, and answers top-k queries with a single matrix-vector
+product plus ``argpartition``. MinHashLSH gives approximate Jaccard neighbours for
+large example libraries where exact word-overlap scoring is too slow.
+"""
+
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from lexicon import tokenize
+
+EMBEDDING_DIM = 256
+
+def _features(text: str) -> List[str]:
+    """Word unigrams, word bigrams and character trigrams of each word."""
+    words = tokenize(text)
+    features = [f"w:{word}" for word in words]
+    features += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"#{word}#"
+        features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return features
+
+def embed_text(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Hashed n-gram embedding of ``text`` as an L2-normalized float32 vector."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in _features(text):
+        hashed = zlib.crc32(feature.encode('utf-8'))
+        # Top bit chooses the sign so collisions tend to cancel out
+        vector[hashed % dim] += -1.0 if hashed & 0x80000000 else 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def embed_batch(texts: Sequence[str], dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Embed many texts into a (len(texts) x dim) float32 matrix."""
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        matrix[row] = embed_text(text, dim)
+    return matrix
+
+def pack_embedding(vector: np.ndarray) -> bytes:
+    """Packed little-endian float32 bytes for storage in a binary column."""
+    return np.asarray(vector, dtype='<f4').tobytes()
+
+def unpack_embedding(blob: bytes, dim: int = EMBEDDING_DIM) -> Optional[np.ndarray]:
+    """Inverse of ``pack_embedding``; None if the blob does not hold a ``dim`` vector."""
+    if not blob or len(blob) != dim * 4:
+        return None
+    return np.frombuffer(blob, dtype='<f4')
+
+class VectorIndex:
+    """
+    In-memory top-k index over normalized vectors, scored by dot product (cosine).
+
+    Rows can be tagged with a partition key (e.g. intent) so searches restricted to
+    one partition only score that partition's rows. Partitions whose rows are
+    contiguous are kept as views, so an index over a read-only memory map never
+    copies the vectors.
+    """
+
+    def __init__(self, vectors: Optional[np.ndarray] = None, partitions: Optional[Sequence[str]] = None,
+                 dim: int = EMBEDDING_DIM):
+        self.dim = dim if vectors is None else vectors.shape[1]
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32) if vectors is None else np.asarray(vectors, dtype=np.float32)
+        self.partition_keys = list(partitions) if partitions is not None else [None] * len(self.vectors)
+        self._build_partitions()
+
+    def _build_partitions(self) -> None:
+        rows_by_key: Dict[str, List[int]] = {}
+        for row, key in enumerate(self.partition_keys):
+            rows_by_key.setdefault(key, []).append(row)
+        # Contiguous block per partition so a filtered search is one dense product
+        self._partitions = {}
+        for key, rows in rows_by_key.items():
+            start, stop = rows[0], rows[-1] + 1
+            block = self.vectors[start:stop] if stop - start == len(rows) else self.vectors[rows]
+            self._partitions[key] = (np.array(rows, dtype=np.int64), block)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def add(self, vectors: np.ndarray, partitions: Sequence[str]) -> None:
+        """Append rows (re-partitions the index; intended for load time, not per request)."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        self.vectors = np.vstack([self.vectors, vectors])
+        self.partition_keys.extend(partitions)
+        self._build_partitions()
+
+    def search(self, query: np.ndarray, top_k: int = 5, partition: Optional[str] = None) -> List[Tuple[int, float]]:
+        """Return up to ``top_k`` (row, score) pairs, best first."""
+        if partition is None:
+            rows, matrix = None, self.vectors
+        elif partition in self._partitions:
+            rows, matrix = self._partitions[partition]
+        else:
+            return []
+
+        if len(matrix) == 0 or top_k <= 0:
+            return []
+
+        scores = matrix @ query.astype(np.float32)
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind='stable')]
+        row_ids = best if rows is None else rows[best]
+        return [(int(row), float(scores[i])) for row, i in zip(row_ids, best)]
+
+_MERSENNE_PRIME = (1 << 31) - 1
+
+def word_set(text: str) -> frozenset:
+    """Token set used for Jaccard similarity (same splitting as the exact retrieval loop)."""
+    return frozenset(text.lower().split())
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    union = len(a | b)
+    return len(a & b) / union if union else 0.0
+
+class MinHashLSH:
+    """
+    Approximate Jaccard nearest neighbours with MinHash signatures and LSH banding.
+
+    Each set gets ``num_perm`` MinHash values split into ``bands`` bands; two sets
+    become candidates when any band matches exactly, and candidates are re-ranked
+    by exact Jaccard. More bands (fewer rows per band) raise recall at the cost of
+    more candidates to re-rank; at most ``max_candidates`` of them, those sharing the
+    most bands with the query, are re-ranked, which bounds query cost on libraries
+    full of near-duplicates. Partitions smaller than ``brute_force_limit`` are
+    searched exactly when LSH finds too few candidates.
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, seed: int = 1, brute_force_limit: int = 256,
+                 max_candidates: int = 256):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.brute_force_limit = brute_force_limit
+        self.max_candidates = max_candidates
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self._sets: List[frozenset] = []
+        self._partition_keys: List[Optional[str]] = []
+        self._rows_by_partition: Dict[Optional[str], List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._sets)
+
+    def signature(self, tokens: frozenset) -> np.ndarray:
+        """MinHash signature of a token set (all-max for the empty set)."""
+        if not tokens:
+            return np.full(self.num_perm, _MERSENNE_PRIME, dtype=np.int64)
+        hashes = np.fromiter((zlib.crc32(token.encode('utf-8')) for token in tokens),
+                             dtype=np.int64, count=len(tokens)) % _MERSENNE_PRIME
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _MERSENNE_PRIME).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [band.tobytes() for band in signature.reshape(self.bands, self.rows_per_band)]
+
+    def add(self, tokens: frozenset, partition: Optional[str] = None) -> int:
+        """Index a token set; returns its row id."""
+        row = len(self._sets)
+        self._sets.append(tokens)
+        self._partition_keys.append(partition)
+        self._rows_by_partition.setdefault(partition, []).append(row)
+        if tokens:
+            for band, key in enumerate(self._band_keys(self.signature(tokens))):
+                self._buckets[band].setdefault(key, []).append(row)
+        return row
+
+    def query(self, tokens: frozenset, top_k: int = 5, partition: Optional[str] = None) -> List[Tuple[int, float]]:
+        """Return up to ``top_k`` (row, jaccard) pairs, best first."""
+        band_hits: Counter = Counter()
+        if tokens:
+            for band, key in enumerate(self._band_keys(self.signature(tokens))):
+                band_hits.update(self._buckets[band].get(key, ()))
+        if partition is not None:
+            band_hits = Counter({row: n for row, n in band_hits.items() if self._partition_keys[row] == partition})
+
+        # Shared bands estimate similarity; only the most promising candidates get exact scoring
+        candidates = {row for row, _ in band_hits.most_common(self.max_candidates)}
+        if len(candidates) < top_k:
+            pool = self._rows_by_partition.get(partition, []) if partition is not None else range(len(self._sets))
+            if len(pool) <= self.brute_force_limit:
+                candidates = set(pool)
+
+        scored = sorted(((row, jaccard(tokens, self._sets[row])) for row in candidates),
+                        key=lambda item: (-item[1], item[0]))
+        return scored[:top_k]
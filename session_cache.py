@@ -0,0 +1,108 @@
+"""
+Per-process cache of active chat sessions for M-bot.
+
+For each user with an active session this keeps a snapshot of the session row
+and a ring buffer of its latest messages, so a chat turn served by the same
+process as the previous one reads neither from the database. Entries are
+replaced after every stored turn, dropped on end/rename, and held in an LRU
+across users.
+
+Other processes can write to the same session, so an entry is only trusted for
+``check_interval`` seconds. After that the turn loads from the database again,
+and ``verify`` compares the fresh data with the old entry and counts any
+mismatch. Writes made from a cached row are guarded by the row's message count
+(see ``app.persist_cached_session``).
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+
+from caching import LRUCache
+
+logger = logging.getLogger(__name__)
+
+SESSION_FIELDS = (
+    'session_id', 'user_id', 'chat_mode', 'started_at', 'ended_at', 'status', 'title',
+    'rolling_summary', 'summary_message_count', 'message_count', 'sentiment_sum', 'sentiment_count',
+    'first_user_message_id', 'last_user_message_id', 'keyword_sketch'
+)
+
+def session_row(chat_session) -> Dict[str, Any]:
+    """Column values of a ChatSession, enough to rebuild it without a query."""
+    return {field: getattr(chat_session, field) for field in SESSION_FIELDS}
+
+class SessionEntry:
+    """A session row snapshot plus its latest messages (oldest first)."""
+
+    __slots__ = ('row', 'messages', 'verified_at')
+
+    def __init__(self, row: Dict[str, Any], messages: Iterable[Dict], window: int, verified_at: float):
+        self.row = row
+        self.messages = deque(messages, maxlen=window)
+        self.verified_at = verified_at
+
+class SessionCache:
+    """LRU of active sessions keyed by user id."""
+
+    def __init__(self, max_sessions: int = 1024, window: int = 20, check_interval: float = 30.0):
+        self.window = window
+        self.check_interval = check_interval
+        self.entries = LRUCache(max_sessions)
+        self._lock = threading.Lock()
+        self._counters = {'expired': 0, 'verified': 0, 'mismatches': 0, 'conflicts': 0}
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._counters[key] += 1
+
+    def get(self, user_id: str) -> Optional[SessionEntry]:
+        """The user's cached active session, unless it is due for a consistency check."""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.verified_at > self.check_interval:
+            self._count('expired')
+            return None
+        return entry
+
+    def verify(self, user_id: str, row: Dict[str, Any], messages: List[Dict]) -> bool:
+        """Compare data just loaded from the database with the user's (expired) entry; False on a mismatch."""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return True
+        self._count('verified')
+        cached_ids = [message['message_id'] for message in entry.messages]
+        loaded_ids = [message['message_id'] for message in messages][-len(cached_ids):] if cached_ids else []
+        if entry.row['session_id'] == row['session_id'] and entry.row['message_count'] == row['message_count'] \
+                and cached_ids == loaded_ids:
+            return True
+        self._count('mismatches')
+        logger.warning(f"Session cache for user {user_id} was out of date; reloaded from the database")
+        return False
+
+    def store(self, user_id: str, row: Dict[str, Any], messages: Iterable[Dict], verified: bool) -> None:
+        """
+        Replace the user's entry after a stored turn. ``verified`` means the data
+        came from the database this turn; otherwise the previous check time is kept.
+        """
+        now = time.monotonic()
+        previous = self.entries.get(user_id)
+        verified_at = now if verified or previous is None else previous.verified_at
+        self.entries.set(user_id, SessionEntry(row, messages, self.window, verified_at))
+
+    def conflict(self, user_id: str) -> None:
+        """A write from the cached row found the session changed elsewhere; forget it."""
+        self._count('conflicts')
+        self.invalidate(user_id)
+
+    def invalidate(self, user_id: str) -> None:
+        self.entries.invalidate(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.entries.stats()
+        with self._lock:
+            stats.update(self._counters)
+        return stats
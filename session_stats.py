@@ -0,0 +1,117 @@
+"""
+Incrementally maintained chat session statistics for M-bot.
+
+Every stored message updates a few columns on its ``ChatSession`` row: message
+count, running sentiment sum and count over the user's messages, the first and
+last user message ids and a bounded keyword sketch. Session cards and the
+end-of-session summary read that one row instead of scanning the messages.
+
+The keyword sketch is a Space-Saving top-k counter: at most ``capacity`` words
+are tracked, and a new word replaces the least frequent one, inheriting its
+count. Frequent words are never lost, and the sketch stays a fixed size however
+long the session runs.
+"""
+
+import re
+import json
+from typing import Dict, Iterable, List, Optional
+
+SKETCH_CAPACITY = 32
+
+# ChatSession columns maintained here
+STAT_FIELDS = (
+    'message_count', 'sentiment_sum', 'sentiment_count', 'first_user_message_id', 'last_user_message_id',
+    'keyword_sketch'
+)
+
+_WORD = re.compile(r"[a-z][a-z']+")
+
+STOPWORDS = frozenset("""
+about above after again against being below between could didn't doesn't don't during every
+having here's itself just maybe might myself other ourselves really right should something
+sometimes still their theirs themselves there these thing things think those through today
+under until very wanted wants what's where which while would yourself yourselves
+""".split())
+
+def message_keywords(text: str) -> List[str]:
+    """Candidate tag words in a message: lowercase words over four letters that are not stopwords."""
+    return [word for word in _WORD.findall(text.lower()) if len(word) > 4 and word not in STOPWORDS]
+
+class KeywordSketch:
+    """Space-Saving top-k word counter, stored as a JSON object."""
+
+    def __init__(self, counts: Optional[Dict[str, int]] = None, capacity: int = SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = dict(counts or {})
+
+    @classmethod
+    def loads(cls, data: Optional[str], capacity: int = SKETCH_CAPACITY) -> 'KeywordSketch':
+        return cls(json.loads(data) if data else None, capacity)
+
+    def dumps(self) -> str:
+        return json.dumps(self.counts)
+
+    def add(self, words: Iterable[str]) -> None:
+        for word in words:
+            if word in self.counts:
+                self.counts[word] += 1
+            elif len(self.counts) < self.capacity:
+                self.counts[word] = 1
+            else:
+                evicted = min(self.counts, key=self.counts.get)
+                self.counts[word] = self.counts.pop(evicted) + 1
+
+    def top(self, n: int = 5) -> List[str]:
+        """The ``n`` most frequent words (first seen first among ties)."""
+        return sorted(self.counts, key=lambda word: -self.counts[word])[:n]
+
+def reset_stats(chat_session) -> None:
+    """Start counting from an empty session."""
+    chat_session.message_count = 0
+    chat_session.sentiment_sum = 0.0
+    chat_session.sentiment_count = 0
+    chat_session.first_user_message_id = None
+    chat_session.last_user_message_id = None
+    chat_session.keyword_sketch = None
+
+def record_message(chat_session, message) -> None:
+    """Fold one new ``ChatMessage`` into its session's statistics."""
+    chat_session.message_count = (chat_session.message_count or 0) + 1
+    if message.sender != 'user':
+        return
+    if message.sentiment_score is not None:
+        chat_session.sentiment_sum = (chat_session.sentiment_sum or 0.0) + message.sentiment_score
+        chat_session.sentiment_count = (chat_session.sentiment_count or 0) + 1
+    if not chat_session.first_user_message_id:
+        chat_session.first_user_message_id = message.message_id
+    chat_session.last_user_message_id = message.message_id
+    sketch = KeywordSketch.loads(chat_session.keyword_sketch)
+    sketch.add(message_keywords(message.message_text))
+    chat_session.keyword_sketch = sketch.dumps()
+
+def rebuild_stats(chat_session, messages: Iterable) -> None:
+    """Recompute a session's statistics from all of its messages, oldest first."""
+    reset_stats(chat_session)
+    for message in messages:
+        record_message(chat_session, message)
+
+def average_sentiment(chat_session) -> float:
+    return chat_session.sentiment_sum / chat_session.sentiment_count if chat_session.sentiment_count else 0.0
+
+def session_mood(chat_session) -> str:
+    """positive / neutral / negative from the average sentiment of the user's messages"""
+    avg_sentiment = average_sentiment(chat_session)
+    if avg_sentiment > 0.3:
+        return 'positive'
+    if avg_sentiment < -0.3:
+        return 'negative'
+    return 'neutral'
+
+def session_card(chat_session) -> Dict:
+    """Live summary fields for a session, from its row alone."""
+    return {
+        'message_count': chat_session.message_count or 0,
+        'average_sentiment': round(average_sentiment(chat_session), 3),
+        'mood': session_mood(chat_session) if chat_session.sentiment_count else None,
+        'tags': KeywordSketch.loads(chat_session.keyword_sketch).top()
+    }
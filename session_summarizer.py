@@ -0,0 +1,158 @@
+"""
+LLM summaries of finished chat sessions for M-bot.
+
+A session that fits the prompt budget is summarized with one GROQ call. Longer
+sessions are summarized map-reduce style: the transcript is split into chunks
+of whole messages, each chunk is condensed into notes, and the notes are
+combined into the final structured summary (condensing again if the notes
+themselves are still over budget).
+"""
+
+import re
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from nlp_module import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+MOODS = ('positive', 'neutral', 'negative')
+ENGAGEMENT_LEVELS = ('high', 'medium', 'low')
+
+SUMMARY_FIELDS = """{
+  "title": "short title for the session (max 8 words)",
+  "summary": "3-5 sentence summary of what was discussed",
+  "mood": "positive | neutral | negative",
+  "topics": ["main topics, 1-3 words each"],
+  "key_insights": "what {name} realized or shared that matters most",
+  "emotional_journey": "how {name}'s feelings changed over the session",
+  "action_items": ["concrete next steps {name} could take"],
+  "breakthrough_moments": ["significant moments, if any"],
+  "user_engagement_level": "high | medium | low",
+  "session_quality_score": 1-10
+}"""
+
+class SessionSummarizer:
+    """Structured end-of-session summaries from GROQ."""
+
+    def __init__(self, groq_client, model: str = "llama-3.3-70b-versatile", chunk_tokens: int = 3000,
+                 notes_max_tokens: int = 300, summary_max_tokens: int = 700):
+        self.groq_client = groq_client
+        self.model = model
+        self.notes_max_tokens = notes_max_tokens
+        # A chunk must hold several sets of notes or the reduce step would never shrink them
+        self.chunk_tokens = max(chunk_tokens, 4 * notes_max_tokens)
+        self.summary_max_tokens = summary_max_tokens
+
+    def summarize(self, messages: List[Dict], name: str) -> Dict[str, Any]:
+        """Summary fields for a session; ``messages`` are message dicts (``sender``, ``message_text``) in order."""
+        lines = [
+            f"{name if message['sender'] == 'user' else 'M'}: {message['message_text']}"
+            for message in messages
+        ]
+        chunks = self._chunk(lines)
+        from_notes = False
+        while len(chunks) > 1:
+            logger.info(f"Condensing {len(chunks)} transcript chunks for {name}'s session summary")
+            notes = [self._condense(chunk, name, from_notes) for chunk in chunks]
+            chunks = self._chunk(notes)
+            from_notes = True
+        return self._final(chunks[0] if chunks else "", name, from_notes)
+
+    def _chunk(self, parts: List[str]) -> List[str]:
+        """Group whole parts into chunks within the token budget (an oversized part is cut)."""
+        chunks, current, used = [], [], 0
+        for part in parts:
+            tokens = estimate_tokens(part)
+            if tokens > self.chunk_tokens:
+                part = part[:self.chunk_tokens * 4]
+                tokens = self.chunk_tokens
+            if current and used + tokens > self.chunk_tokens:
+                chunks.append("\n".join(current))
+                current, used = [], 0
+            current.append(part)
+            used += tokens
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+
+    def _complete(self, prompt: str, max_tokens: int) -> str:
+        completion = self.groq_client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You summarize supportive mentoring conversations accurately and kindly."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=0.3,
+            max_tokens=max_tokens
+        )
+        return completion.choices[0].message.content.strip()
+
+    def _condense(self, chunk: str, name: str, from_notes: bool) -> str:
+        """Map step: notes on one part of the session."""
+        source = "Notes on consecutive parts" if from_notes else "Part"
+        prompt = (
+            f"{source} of a conversation between {name} and M, their identity mentor:\n"
+            f"{chunk}\n\n"
+            f"Write concise notes covering what {name} shared, how their feelings shifted, any realizations "
+            f"and any next steps mentioned, in order. At most {self.notes_max_tokens * 3 // 4} words. "
+            f"Reply with the notes only."
+        )
+        return self._complete(prompt, self.notes_max_tokens)
+
+    def _final(self, text: str, name: str, from_notes: bool) -> Dict[str, Any]:
+        """Reduce step: the structured summary from the transcript or the combined notes."""
+        source = "Notes on a conversation" if from_notes else "A conversation"
+        prompt = (
+            f"{source} between {name} and M, their identity mentor:\n"
+            f"{text}\n\n"
+            f"Summarize the session. Respond only with JSON in this format:\n"
+            f"{SUMMARY_FIELDS.replace('{name}', name)}"
+        )
+        content = self._complete(prompt, self.summary_max_tokens)
+        match = re.search(r'\{.*\}', content, re.DOTALL)
+        if not match:
+            raise ValueError("Session summary response contained no JSON")
+        return normalize_summary(json.loads(match.group(0)))
+
+def _text(value: Any) -> Optional[str]:
+    if isinstance(value, list):
+        value = " ".join(str(item) for item in value)
+    value = str(value).strip() if value is not None else ""
+    return value or None
+
+def _text_list(value: Any, limit: int = 8) -> List[str]:
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    return [str(item).strip() for item in value if str(item).strip()][:limit]
+
+def normalize_summary(data: Dict) -> Dict[str, Any]:
+    """Coerce a model's summary JSON into the ChatSummary field types, dropping invalid values."""
+    try:
+        score = min(10, max(1, int(round(float(data.get('session_quality_score'))))))
+    except (TypeError, ValueError):
+        score = None
+    mood = str(data.get('mood') or '').strip().lower()
+    engagement = str(data.get('user_engagement_level') or '').strip().lower()
+    title = _text(data.get('title'))
+    return {
+        'title': title[:200] if title else None,
+        'summary': _text(data.get('summary')),
+        'mood': mood if mood in MOODS else None,
+        'topics': _text_list(data.get('topics')),
+        'key_insights': _text(data.get('key_insights')),
+        'emotional_journey': _text(data.get('emotional_journey')),
+        'action_items': _text_list(data.get('action_items')),
+        'breakthrough_moments': _text_list(data.get('breakthrough_moments')),
+        'user_engagement_level': engagement if engagement in ENGAGEMENT_LEVELS else None,
+        'session_quality_score': score
+    }
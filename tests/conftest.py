@@ -0,0 +1,50 @@
+import os
+import sys
+import threading
+
+import pytest
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_groq_server import FakeGroqConfig, make_server  # noqa: E402
+
+@pytest.fixture
+def fake_groq():
+    """Start a fake GROQ server with a given FakeGroqConfig; returns its base URL."""
+    servers = []
+
+    def start(config):
+        server = make_server(port=0, config=config)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """The ``app`` module, imported once against a fake GROQ server and a temporary database."""
+    config = FakeGroqConfig(latency_ms=0.0, latency_dist='fixed', tokens_per_second=0)
+    server = make_server(port=0, config=config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    data_dir = tmp_path_factory.mktemp("app")
+    os.environ.update({
+        'GROQ_API_KEY': 'fake',
+        'GROQ_BASE_URL': f"http://127.0.0.1:{server.server_port}",
+        'DATABASE_URL': f"sqlite:///{data_dir / 'mbot.db'}",
+        'EMBEDDING_SNAPSHOT_DIR': str(data_dir),
+        'SESSION_FILE_DIR': str(data_dir / 'flask_session'),
+        # Every intent goes to GROQ; tests run background jobs inline
+        'INTENT_MODEL_PATH': str(data_dir / 'no-intent-model.npz'),
+        'JOB_WORKERS': '0',
+        'TRAINING_RELOAD_INTERVAL': '3600'
+    })
+    import app
+    app.fake_groq_config = config
+    yield app
+    server.shutdown()
+    server.server_close()
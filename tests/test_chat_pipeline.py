@@ -0,0 +1,29 @@
+"""ChatPipeline stage routing and deadlines."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from chat_pipeline import ChatPipeline
+
+def test_llm_stages_on_their_own_pool_do_not_block_the_shared_one():
+    shared = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shared')
+    llm = ThreadPoolExecutor(max_workers=1, thread_name_prefix='llm')
+    release = threading.Event()
+    pipeline = ChatPipeline(shared, budget=5)
+    try:
+        pipeline.submit('intent', release.wait, 5, executor=llm)
+        pipeline.submit('user', lambda: threading.current_thread().name)
+
+        assert pipeline.result('user', timeout=1).startswith('shared')
+        release.set()
+        assert pipeline.result('intent', timeout=1) is True
+        assert set(pipeline.timings) == {'intent', 'user'}
+    finally:
+        release.set()
+        shared.shutdown()
+        llm.shutdown()
+
+def test_remaining_counts_down_from_the_budget():
+    pipeline = ChatPipeline(ThreadPoolExecutor(max_workers=1), budget=10)
+    assert 9 < pipeline.remaining() <= 10
+    assert ChatPipeline(ThreadPoolExecutor(max_workers=1)).remaining() is None
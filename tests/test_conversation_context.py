@@ -0,0 +1,72 @@
+"""Token-budgeted prompt history and rolling summary updates in ResponseGenerator."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from nlp_module import EmotionAnalyzer, ResponseGenerator, estimate_tokens
+
+class RecordingGroq:
+    """Stand-in GROQ client that records requests and answers with a fixed summary."""
+
+    def __init__(self, reply="Sam talked about work stress."):
+        self.requests = []
+        self.reply = reply
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"  {self.reply}\n"))])
+
+@pytest.fixture(scope="module")
+def analyzer():
+    return EmotionAnalyzer()
+
+def exchanges(count, words=20):
+    return [{'user': f"message {i} " + "word " * words, 'bot': f"reply {i} " + "word " * words} for i in range(count)]
+
+def context_tokens(context):
+    body = context.replace("CONVERSATION SO FAR:\n", "").replace("RECENT CONVERSATION:\n", "")
+    return estimate_tokens(body)
+
+def test_history_keeps_the_newest_exchanges_that_fit(analyzer):
+    generator = ResponseGenerator(RecordingGroq(), analyzer, history_token_budget=200)
+    history = exchanges(10)
+
+    context = generator._build_conversation_context("Sam", history)
+    assert context_tokens(context) <= 200
+    assert "message 9 " in context and "reply 9 " in context
+    assert "message 0 " not in context
+    # Oldest kept exchange first
+    assert context.index("message 8 ") < context.index("message 9 ")
+
+def test_summary_takes_at_most_half_the_budget(analyzer):
+    generator = ResponseGenerator(RecordingGroq(), analyzer, history_token_budget=200)
+
+    context = generator._build_conversation_context("Sam", exchanges(10), "summary " * 200)
+    assert context.startswith("CONVERSATION SO FAR:\n")
+    summary = context.split("\nRECENT CONVERSATION:\n")[0]
+    assert estimate_tokens(summary.replace("CONVERSATION SO FAR:\n", "")) <= 100
+    assert context_tokens(context) <= 200
+    assert "message 9 " in context
+
+def test_oversized_latest_exchange_keeps_its_tail(analyzer):
+    generator = ResponseGenerator(RecordingGroq(), analyzer, history_token_budget=50)
+
+    context = generator._build_conversation_context("Sam", [{'user': "start " + "x" * 1000, 'bot': "the end"}])
+    assert "RECENT CONVERSATION:\n..." in context
+    assert context.rstrip().endswith("M: the end")
+    assert "start" not in context
+
+def test_summary_update_folds_in_new_exchanges_within_its_token_cap(analyzer):
+    groq = RecordingGroq()
+    generator = ResponseGenerator(groq, analyzer, summary_max_tokens=120)
+
+    summary = generator.update_conversation_summary("Sam is anxious about work.", exchanges(2, words=3), "Sam")
+    assert summary == "Sam talked about work stress."
+    request, = groq.requests
+    assert request['max_tokens'] == 120
+    prompt = request['messages'][-1]['content']
+    assert "Sam is anxious about work." in prompt
+    assert "Sam: message 1 " in prompt and "M: reply 1 " in prompt
+    assert "at most 90 words" in prompt
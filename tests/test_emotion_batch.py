@@ -0,0 +1,64 @@
+"""analyze_batch must give exactly what detect_emotion gives, message by message."""
+
+import random
+
+import pytest
+
+from nlp_module import EmotionAnalyzer
+
+@pytest.fixture(scope="module")
+def analyzer():
+    return EmotionAnalyzer()
+
+def lexicon_terms(analyzer):
+    knowledge = analyzer.knowledge
+    terms = set()
+    for table in (knowledge.emotion_keywords, knowledge.subtle_emotion_keywords):
+        for keywords in table.values():
+            terms.update(keywords)
+    return sorted(terms)
+
+def random_messages(analyzer, count=2000, seed=7):
+    rng = random.Random(seed)
+    terms = lexicon_terms(analyzer)
+    filler = ["i", "feel", "today", "and", "my", "friend", "was", "so", "the", "really", "about", "work"]
+    punctuation = ["", ".", ",", "!", "?", "...", " -", "'"]
+    messages = []
+    for _ in range(count):
+        words = []
+        for _ in range(rng.randint(0, 14)):
+            word = rng.choice(terms) if rng.random() < 0.35 else rng.choice(filler)
+            casing = rng.random()
+            if casing < 0.2:
+                word = word.upper()
+            elif casing < 0.4:
+                word = word.title()
+            words.append(word + rng.choice(punctuation))
+        messages.append(" ".join(words))
+    return messages
+
+def assert_same(batch, single):
+    # Key order matters too: callers break ties on it
+    assert list(batch) == list(single)
+    assert list(batch.values()) == pytest.approx(list(single.values()))
+
+def test_random_lexicon_messages_match_detect_emotion(analyzer):
+    messages = random_messages(analyzer)
+    for message, result in zip(messages, analyzer.analyze_batch(messages)):
+        assert_same(result, analyzer.detect_emotion(message))
+
+@pytest.mark.parametrize("message", [
+    "",
+    "   ",
+    "?!...",
+    "I'M SO HAPPY!!!",
+    "happy, happy, HAPPY.",
+    "Anxious? Worried... overwhelmed!",
+    "nothing to see here",
+    "\tsad\n",
+])
+def test_edge_cases_match_detect_emotion(analyzer, message):
+    assert_same(analyzer.analyze_batch([message])[0], analyzer.detect_emotion(message))
+
+def test_empty_batch(analyzer):
+    assert analyzer.analyze_batch([]) == []
@@ -0,0 +1,118 @@
+"""The Flask app driven end to end through ``app.test_client()`` against the fake GROQ server."""
+
+import json
+
+from fake_groq_server import REPLY_WORDS
+
+def sse_events(body):
+    """(event, data) pairs of a Server-Sent Events body"""
+    events = []
+    for frame in body.strip().split("\n\n"):
+        event, data = None, None
+        for line in frame.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        events.append((event, data))
+    return events
+
+def test_signup_chat_stream_and_end_session(app_module):
+    from nlp_module import normalize_message
+
+    client = app_module.app.test_client()
+    response = client.post('/api/signup', json={'email': 'e2e@example.com', 'password': 'secret1', 'name': 'Sam'})
+    assert response.status_code in (200, 201)
+    headers = {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+    message = "I have been feeling anxious about work lately"
+    response = client.post('/api/chat', json={'message': message}, headers=headers)
+    assert response.status_code == 200
+    body = response.get_json()
+    session_id = body['sessionId']
+    # The reply came from the fake server, not the local fallback
+    assert body['response'].startswith(" ".join(REPLY_WORDS[:3]))
+    # ... and the intent prompt got the fake server's canned intent JSON
+    intent, confidence = app_module.emotion_analyzer.intent_cache.get(normalize_message(message))
+    assert confidence == 0.85
+
+    response = client.post('/api/chat/stream', json={'message': "Thanks, that helps a bit"}, headers=headers)
+    assert response.status_code == 200
+    events = sse_events(response.get_data(as_text=True))
+    assert events[0] == ('meta', {'sessionId': session_id, 'sentiment': events[0][1]['sentiment']})
+    tokens = "".join(data['token'] for event, data in events if event is None)
+    done = [data for event, data in events if event == 'done']
+    assert len(done) == 1 and done[0]['response'] == tokens.strip()
+    assert tokens.startswith(" ".join(REPLY_WORDS[:3]))
+
+    response = client.post('/api/end_session', json={'sessionId': session_id}, headers=headers)
+    assert response.status_code == 200
+
+    # The queued summary job asks the fake server for the structured summary
+    while app_module.job_queue.run_next():
+        pass
+    with app_module.app.app_context():
+        summary = app_module.ChatSummary.query.filter_by(session_id=session_id).one()
+        assert summary.analysis_data
+        assert summary.summary == "The user talked through how they have been feeling."
+        assert json.loads(summary.action_items) == ["Check in tomorrow"]
+        messages = app_module.ChatMessage.query.filter_by(session_id=session_id).count()
+    assert messages == 4
+    assert app_module.fake_groq_config.counters['streamed'] == 1
+
+def signed_up(app_module, email):
+    client = app_module.app.test_client()
+    response = client.post('/api/signup', json={'email': email, 'password': 'secret1', 'name': 'Sam'})
+    return client, {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+def stored_turn(app_module, session_id):
+    """(senders, bot message texts, enrich_turn jobs) of a session"""
+    from models import BackgroundJob
+
+    with app_module.app.app_context():
+        messages = app_module.ChatMessage.query.filter_by(session_id=session_id).order_by(
+            app_module.ChatMessage.timestamp).all()
+        jobs = BackgroundJob.query.filter_by(kind='enrich_turn').filter(
+            BackgroundJob.payload.contains(session_id)).count()
+        return [m.sender for m in messages], [m.message_text for m in messages if m.sender == 'M'], jobs
+
+def test_stream_disconnect_stores_the_partial_reply_once(app_module):
+    client, headers = signed_up(app_module, 'disconnect@example.com')
+    response = client.post('/api/chat/stream', json={'message': "Hello there"}, headers=headers, buffered=False)
+    frames = iter(response.response)
+    meta = json.loads(next(frames).decode().split("data: ", 1)[1])
+    first_token = json.loads(next(frames).decode().split("data: ", 1)[1])['token']
+    response.close()
+
+    senders, replies, jobs = stored_turn(app_module, meta['sessionId'])
+    assert senders == ['user', 'M']
+    assert replies == [first_token.strip()]
+    assert jobs == 1
+
+def test_stream_error_after_storing_does_not_store_again(app_module, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("executor is shut down")
+    monkeypatch.setattr(app_module, 'schedule_rolling_summary', broken)
+    client, headers = signed_up(app_module, 'late-error@example.com')
+
+    events = sse_events(client.post('/api/chat/stream', json={'message': "Hello"}, headers=headers).get_data(as_text=True))
+
+    done = [data for event, data in events if event == 'done']
+    assert len(done) == 1
+    senders, replies, jobs = stored_turn(app_module, done[0]['sessionId'])
+    assert senders == ['user', 'M'] and replies == [done[0]['response']]
+    assert jobs == 1
+
+def test_stream_fallback_failure_stores_one_apology(app_module, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("fallback failed")
+    monkeypatch.setattr(app_module, 'client', None)
+    monkeypatch.setattr(app_module, 'generate_enhanced_fallback_response', broken)
+    client, headers = signed_up(app_module, 'fallback-error@example.com')
+
+    events = sse_events(client.post('/api/chat/stream', json={'message': "Hello"}, headers=headers).get_data(as_text=True))
+
+    assert [event for event, data in events] == ['meta', 'error']
+    senders, replies, jobs = stored_turn(app_module, events[0][1]['sessionId'])
+    assert senders == ['user', 'M'] and replies == [events[1][1]['response']]
+    assert jobs == 1
@@ -0,0 +1,92 @@
+"""Concurrent enrichment batches must share theme and analytics rows, not duplicate them."""
+
+import json
+import uuid
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from enrichment import enrich_turns
+from models import ConversationTheme, UserAnalytics
+
+def payload(user_id):
+    return {'user_id': user_id, 'session_id': str(uuid.uuid4()), 'user_message_id': None, 'bot_message_id': None,
+            'emotions': None, 'intent': 'Well-Being', 'new_session': True, 'at': datetime.utcnow().isoformat()}
+
+def test_unique_rows_per_user_theme_and_week(app_module):
+    user_id = str(uuid.uuid4())
+    db = app_module.db
+    with app_module.app.app_context():
+        enrich_turns(db.session, [payload(user_id)])
+        db.session.commit()
+        db.session.add(ConversationTheme(user_id=user_id, theme_name='Well-Being', occurrence_count=1))
+        with pytest.raises(IntegrityError):
+            db.session.flush()
+        db.session.rollback()
+        week = UserAnalytics.query.filter_by(user_id=user_id).one().week_of
+        db.session.add(UserAnalytics(user_id=user_id, week_of=week))
+        with pytest.raises(IntegrityError):
+            db.session.flush()
+        db.session.rollback()
+
+def test_concurrent_first_batches_update_one_row(app_module):
+    user_id = str(uuid.uuid4())
+    db = app_module.db
+    first_flushed, release_first = threading.Event(), threading.Event()
+    errors = []
+
+    def first_batch():
+        # Inserts the rows and holds its transaction open until the second batch is under way
+        with app_module.app.app_context():
+            try:
+                enrich_turns(db.session, [payload(user_id)])
+                first_flushed.set()
+                release_first.wait(10)
+                db.session.commit()
+            except Exception as e:
+                errors.append(e)
+                first_flushed.set()
+
+    def second_batch():
+        with app_module.app.app_context():
+            try:
+                app_module.enrich_turns_job([payload(user_id)])
+                db.session.commit()
+            except Exception as e:
+                errors.append(e)
+
+    first = threading.Thread(target=first_batch)
+    first.start()
+    assert first_flushed.wait(10)
+    second = threading.Thread(target=second_batch)
+    second.start()
+    # The second batch does not see the uncommitted rows, and its insert waits on the first transaction
+    second.join(0.3)
+    release_first.set()
+    first.join(10)
+    second.join(10)
+
+    assert errors == []
+    with app_module.app.app_context():
+        theme = ConversationTheme.query.filter_by(user_id=user_id).one()
+        week = UserAnalytics.query.filter_by(user_id=user_id).one()
+    assert theme.occurrence_count == 2 and len(theme.related_sessions.split(',')) == 2
+    assert week.total_sessions == 2
+
+def test_batch_folds_repeated_turns_into_one_row_each(app_module):
+    user_id = str(uuid.uuid4())
+    db = app_module.db
+    first, second = payload(user_id), payload(user_id)
+    # A second turn in the first session, then one in another session
+    repeat = dict(first, new_session=False)
+    with app_module.app.app_context():
+        enrich_turns(db.session, [first, repeat, second])
+        db.session.commit()
+        theme = ConversationTheme.query.filter_by(user_id=user_id).one()
+        week = UserAnalytics.query.filter_by(user_id=user_id).one()
+
+    assert theme.occurrence_count == 3
+    assert json.loads(theme.related_sessions) == [first['session_id'], second['session_id']]
+    assert week.total_sessions == 2
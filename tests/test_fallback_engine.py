@@ -0,0 +1,40 @@
+"""Local fallback replies: topic priority, per-profile rendering and pronoun substitution."""
+
+import pytest
+
+from fallback_engine import (GENERAL_TEMPLATES, FallbackEngine, apply_pronoun_replacements,
+                             pronoun_replacements)
+from training_store import TrainingStore
+
+PROFILE = {'screen_name': 'Sam', 'pronouns': 'she/her', 'focus_area': 'career'}
+
+@pytest.fixture(scope="module")
+def engine():
+    lexicon = TrainingStore().snapshot.lexicon
+    return FallbackEngine(lexicon.match)
+
+def test_first_topic_in_priority_order_wins(engine):
+    assert engine.topic("hi, I feel so anxious") == 'greeting'
+    assert engine.topic("this is what I think") == 'general'
+
+def test_replies_are_rendered_for_the_profile(engine):
+    reply = engine.respond("this is what I think", PROFILE)
+
+    general = [template.format(name='Sam', focus_given="Given your focus on career, ") for template in GENERAL_TEMPLATES]
+    assert reply in general
+    assert "{" not in reply
+    assert engine.intent_response("Well-Being", PROFILE).startswith("I understand, Sam.")
+    assert engine.intent_response("Not An Intent", PROFILE) == engine.intent_response("Daily Support", PROFILE)
+
+def test_rendered_profiles_are_bounded():
+    engine = FallbackEngine(lambda text: None, cache_size=2)
+    for name in ("a", "b", "c"):
+        engine.intent_response("Well-Being", {'screen_name': name})
+    assert engine.stats() == {'profiles': 2, 'max_profiles': 2}
+
+def test_pronouns_are_replaced_as_whole_words_in_one_pass():
+    mapping = pronoun_replacements("He/Him")
+
+    text = apply_pronoun_replacements("so they said THEIR theory was theirs, not them or theory's", mapping)
+    assert text == "so he said his theory was his, not him or theory's"
+    assert apply_pronoun_replacements("they", pronoun_replacements("they/them")) == "they"
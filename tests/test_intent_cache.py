@@ -0,0 +1,119 @@
+"""LRU + TTL caching of LLM intent classifications."""
+
+import json
+import time
+import threading
+from types import SimpleNamespace
+
+import caching
+from caching import LRUCache
+from nlp_module import EmotionAnalyzer
+
+class CountingGroq:
+    """Stand-in GROQ client that answers every intent prompt with the same JSON and counts calls."""
+
+    def __init__(self, intent="Well-Being", confidence=0.9):
+        self.calls = 0
+        self.reply = json.dumps({"intent": intent, "confidence": confidence, "reasoning": "test"})
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.reply))])
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'b' is now least recently used
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(caching.time, 'monotonic', clock)
+    cache = LRUCache(max_size=10, ttl=60)
+    cache.set('a', 1)
+
+    clock.now += 59
+    assert cache.get('a') == 1
+    clock.now += 2
+    assert cache.get('a') is None
+    stats = cache.stats()
+    assert stats['expirations'] == 1 and stats['hits'] == 1 and stats['misses'] == 1 and stats['size'] == 0
+
+def test_repeated_message_skips_the_llm_until_expiry(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(caching.time, 'monotonic', clock)
+    groq = CountingGroq()
+    analyzer = EmotionAnalyzer(groq_client=groq, intent_cache_ttl=3600)
+
+    assert analyzer.classify_intent("I feel lost today") == ("Well-Being", 0.9)
+    # Normalized key: case, spacing and trailing punctuation do not matter
+    assert analyzer.classify_intent("  i FEEL lost   today!! ") == ("Well-Being", 0.9)
+    assert groq.calls == 1
+
+    clock.now += 3601
+    analyzer.classify_intent("I feel lost today")
+    assert groq.calls == 2
+
+def test_unusable_llm_answers_are_not_cached():
+    groq = CountingGroq(intent="Not A Category")
+    analyzer = EmotionAnalyzer(groq_client=groq)
+
+    analyzer.classify_intent("I feel lost today")
+    analyzer.classify_intent("I feel lost today")
+    assert groq.calls == 2
+    assert len(analyzer.intent_cache) == 0
+
+class SlowGroq(CountingGroq):
+    """Answers after ``delay`` seconds and records the timeout each call was given."""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.timeouts = []
+
+    def create(self, **kwargs):
+        self.timeouts.append(kwargs.get('timeout'))
+        time.sleep(self.delay)
+        return super().create(**kwargs)
+
+def test_intent_timeout_reaches_the_llm_call():
+    groq = SlowGroq(delay=0)
+    analyzer = EmotionAnalyzer(groq_client=groq)
+
+    analyzer.classify_intent("I feel lost today", timeout=2.5)
+    analyzer.classify_intent("something else entirely")
+    assert groq.timeouts == [2.5, None]
+
+def test_follower_falls_back_to_keywords_at_its_timeout():
+    groq = SlowGroq(delay=0.6)
+    analyzer = EmotionAnalyzer(groq_client=groq)
+    leader = threading.Thread(target=analyzer.classify_intent, args=("I feel so anxious",))
+    leader.start()
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    intent, _ = analyzer.classify_intent("I feel so anxious", timeout=0.1)
+    assert time.monotonic() - started < 0.4
+    assert intent in analyzer.knowledge.intent_categories
+    leader.join()
+    assert groq.calls == 1
+
+def test_no_time_left_skips_the_llm():
+    groq = CountingGroq()
+    analyzer = EmotionAnalyzer(groq_client=groq)
+
+    analyzer.classify_intent("I feel lost today", timeout=0)
+    assert groq.calls == 0
@@ -0,0 +1,45 @@
+"""The shipped local intent model must answer confident in-distribution messages itself."""
+
+import pytest
+
+from intent_model import IntentClassifier, DEFAULT_MODEL_PATH, MIN_CALIBRATION_EXAMPLES, builtin_examples
+from nlp_module import EmotionAnalyzer
+
+IN_DISTRIBUTION = [
+    ("I'm struggling with my anxiety again", "Well-Being"),
+    ("my relationship with my family is strained", "Relationships"),
+    ("can you help me get through today", "Daily Support"),
+    ("I'm not sure who I really am", "Identity Affirmation"),
+]
+
+class RefusingGroq:
+    """GROQ client that fails the test if the analyzer ever asks it."""
+
+    @property
+    def chat(self):
+        pytest.fail("intent went to the LLM instead of the local model")
+
+@pytest.fixture(scope="module")
+def shipped_model():
+    return IntentClassifier.load(DEFAULT_MODEL_PATH)
+
+def test_small_corpus_keeps_unit_temperature():
+    examples = builtin_examples()
+    assert len(examples) * 0.2 < MIN_CALIBRATION_EXAMPLES
+    texts, labels = zip(*examples)
+    assert IntentClassifier.train(list(texts), list(labels)).temperature == 1.0
+
+def test_shipped_model_clears_the_threshold_on_training_examples(shipped_model):
+    examples = [(text, label) for text, label in builtin_examples() if len(text.split()) > 2]
+    predictions = [shipped_model.predict(text) for text, _ in examples]
+    served = [intent == label and confidence >= 0.6
+              for (intent, confidence), (_, label) in zip(predictions, examples)]
+    assert sum(served) / len(examples) >= 0.5
+
+def test_confident_messages_are_served_locally(shipped_model):
+    analyzer = EmotionAnalyzer(groq_client=RefusingGroq(), intent_model=shipped_model, intent_model_threshold=0.6)
+
+    for text, expected in IN_DISTRIBUTION:
+        intent, confidence = analyzer.classify_intent(text)
+        assert intent == expected
+        assert confidence >= 0.6
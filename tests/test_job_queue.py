@@ -0,0 +1,98 @@
+"""JobQueue leases and dedupe keys on a database of its own."""
+
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from job_queue import JobQueue
+from models import BackgroundJob, db
+
+@pytest.fixture
+def queue_app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'jobs.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+def test_running_job_keeps_its_lease_past_lease_seconds(queue_app):
+    queue = JobQueue(queue_app, db, workers=0, lease_seconds=0.6)
+    # Another process's sweeper, checking on every call
+    sweeper = JobQueue(queue_app, db, workers=0, lease_seconds=0.6)
+    runs = []
+    queue.register('slow', lambda payload: (runs.append(payload), time.sleep(1.5)))
+    with queue_app.app_context():
+        job_id = queue.enqueue('slow', {'n': 1}).id
+
+    stop = threading.Event()
+    def sweep():
+        while not stop.is_set():
+            sweeper._last_requeue = 0.0
+            with queue_app.app_context():
+                sweeper._requeue_stale()
+            time.sleep(0.1)
+
+    thread = threading.Thread(target=sweep)
+    thread.start()
+    try:
+        assert queue.run_next('worker-a') is True
+    finally:
+        stop.set()
+        thread.join()
+
+    with queue_app.app_context():
+        job = db.session.get(BackgroundJob, job_id)
+        assert (job.status, job.attempts, job.last_error) == ('done', 1, None)
+    assert runs == [{'n': 1}]
+    assert sweeper.stats()['requeued'] == 0
+
+def test_abandoned_job_is_requeued_after_its_lease(queue_app):
+    queue = JobQueue(queue_app, db, workers=0, lease_seconds=0.2)
+    queue.register('noop', lambda payload: None)
+    with queue_app.app_context():
+        job_id = queue.enqueue('noop', {}).id
+        # Claimed by a worker that then died
+        assert queue._claim('dead-worker') == [job_id]
+    time.sleep(0.3)
+
+    assert queue.run_next('worker-b') is True
+    with queue_app.app_context():
+        job = db.session.get(BackgroundJob, job_id)
+        assert (job.status, job.attempts) == ('done', 2)
+
+def test_duplicate_dedupe_key_is_skipped_without_failing_the_transaction(queue_app):
+    queue = JobQueue(queue_app, db, workers=0)
+    with queue_app.app_context():
+        first = queue.enqueue('noop', {'n': 1}, dedupe_key='session:1', commit=False)
+        assert first is not None
+        assert queue.enqueue('noop', {'n': 2}, dedupe_key='session:1', commit=False) is None
+        db.session.commit()
+        assert queue.enqueue('noop', {'n': 3}, dedupe_key='session:1') is None
+        assert BackgroundJob.query.filter_by(dedupe_key='session:1').count() == 1
+
+def test_concurrent_enqueues_with_one_dedupe_key_create_one_job(queue_app):
+    queue = JobQueue(queue_app, db, workers=0)
+    barrier = threading.Barrier(8)
+    results, errors = [], []
+
+    def enqueue():
+        with queue_app.app_context():
+            barrier.wait()
+            try:
+                results.append(queue.enqueue('noop', {}, dedupe_key='session:2') is not None)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=enqueue) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(results) == [False] * 7 + [True]
+    with queue_app.app_context():
+        assert BackgroundJob.query.filter_by(dedupe_key='session:2').count() == 1
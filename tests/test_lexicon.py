@@ -0,0 +1,44 @@
+"""Whole-word keyword matching in LexiconMatcher and BatchTermMatcher."""
+
+from lexicon import BatchTermMatcher, LexiconMatcher
+
+GROUPS = {
+    "topic": {"greeting": ["hello", "hi", "hey"]},
+    "emotion": {"anger": ["mad", "fed up"], "sadness": ["down"]},
+}
+
+def test_terms_do_not_match_inside_other_words():
+    matcher = LexiconMatcher(GROUPS)
+
+    match = matcher.match("This is what I made; the download stalled")
+    assert match.hits == {}
+    assert not matcher.match("Hithere, he's shy").has("topic", "greeting")
+
+def test_whole_words_and_phrases_match_once():
+    matcher = LexiconMatcher(GROUPS)
+
+    match = matcher.match("Hi! I'm so MAD, mad and fed up.")
+    assert match.terms("topic", "greeting") == ["hi"]
+    assert match.terms("emotion", "anger") == ["mad", "fed up"]
+
+def test_batch_matcher_agrees_with_lexicon_matcher():
+    terms = [term for labels in GROUPS.values() for words in labels.values() for term in words]
+    texts = ["this", "hi there", "made it", "I am fed up", "", "hey hey mad"]
+
+    rows, term_ids = BatchTermMatcher(terms).match(texts)
+    found = {(int(row), terms[int(term)]) for row, term in zip(rows, term_ids)}
+
+    matcher = LexiconMatcher(GROUPS)
+    expected = set()
+    for row, text in enumerate(texts):
+        for labels in matcher.match(text).hits.values():
+            expected.update((row, term) for words in labels.values() for term in words)
+    assert found == expected
+    assert (0, "hi") not in found
+
+def test_training_data_greeting_needs_the_whole_word():
+    from training_store import TrainingStore
+
+    lexicon = TrainingStore().snapshot.lexicon
+    assert lexicon.match("this is what I think").group("fallback") == {}
+    assert lexicon.match("hi, this is me").terms("fallback", "greeting") == ["hi"]
@@ -0,0 +1,124 @@
+"""ResilientGroq against the local fake GROQ server."""
+
+import time
+import threading
+
+import groq
+import pytest
+
+from fake_groq_server import FakeGroqConfig
+from llm_client import CircuitBreaker, CircuitOpenError, ResilientGroq, classify_error
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+class ScriptedConfig(FakeGroqConfig):
+    """Fake server behaviour with a fixed sequence of outcomes, then 'ok'; records arrival times."""
+
+    def __init__(self, outcomes, **kwargs):
+        kwargs.setdefault('latency_ms', 0.0)
+        super().__init__(latency_dist='fixed', tokens_per_second=0, **kwargs)
+        self.script = list(outcomes)
+        self.arrivals = []
+
+    def outcome(self):
+        with self.lock:
+            self.arrivals.append(time.monotonic())
+            return self.script.pop(0) if self.script else 'ok'
+
+def make_client(base_url, **kwargs):
+    kwargs.setdefault('backoff_base', 0.01)
+    return ResilientGroq(api_key="fake", base_url=base_url, **kwargs)
+
+def create(client):
+    return client.chat.completions.create(model="fake-model", messages=MESSAGES, temperature=0.7, max_tokens=20)
+
+def test_rate_limit_is_retried_after_retry_after(fake_groq):
+    config = ScriptedConfig(['rate_limited'], retry_after=0.5)
+    client = make_client(fake_groq(config), max_retries=2)
+
+    result = create(client)
+
+    assert result.choices[0].message.content
+    assert len(config.arrivals) == 2
+    assert config.arrivals[1] - config.arrivals[0] >= 0.5
+    stats = client.stats()
+    assert stats['retries'] == 1 and stats['successes'] == 1 and stats['failures'] == 0
+
+def test_bad_request_is_not_retried_and_spares_the_breaker(fake_groq):
+    config = ScriptedConfig(['bad_request'] * 3)
+    client = make_client(fake_groq(config), max_retries=2, failure_threshold=2)
+
+    for _ in range(3):
+        with pytest.raises(groq.BadRequestError):
+            create(client)
+
+    assert len(config.arrivals) == 3
+    stats = client.stats()
+    assert stats['retries'] == 0 and stats['failures'] == 0
+    assert stats['circuit']['state'] == CircuitBreaker.CLOSED
+    assert stats['circuit']['consecutive_failures'] == 0
+
+def test_breaker_opens_short_circuits_and_closes_after_probe(fake_groq):
+    config = ScriptedConfig(['error'] * 3)
+    client = make_client(fake_groq(config), max_retries=0, failure_threshold=3, reset_timeout=0.3)
+
+    for _ in range(3):
+        with pytest.raises(groq.InternalServerError):
+            create(client)
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        create(client)
+    assert len(config.arrivals) == 3
+    assert client.stats()['short_circuited'] == 1
+
+    time.sleep(0.35)
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+    assert create(client).choices[0].message.content
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    assert client.stats()['circuit']['opened_count'] == 1
+
+def test_read_timeout_is_retryable(fake_groq):
+    config = ScriptedConfig([], latency_ms=1000.0)
+    client = make_client(fake_groq(config), read_timeout=0.2, max_retries=1)
+
+    with pytest.raises(groq.APITimeoutError) as error:
+        create(client)
+
+    assert classify_error(error.value) == (True, None)
+    # Retried once before giving up
+    assert len(config.arrivals) == 2
+    assert client.stats()['retries'] == 1 and client.stats()['failures'] == 1
+
+def test_caller_deadline_timeouts_spare_the_breaker(fake_groq):
+    config = ScriptedConfig([], latency_ms=1000.0)
+    client = make_client(fake_groq(config), read_timeout=5.0, max_retries=2, failure_threshold=2)
+
+    for _ in range(3):
+        with pytest.raises(groq.APITimeoutError):
+            client.chat.completions.create(model="fake-model", messages=MESSAGES, temperature=0.7, timeout=0.2)
+
+    stats = client.stats()
+    assert stats['deadline_exceeded'] == 3 and stats['failures'] == 0
+    assert stats['circuit']['state'] == CircuitBreaker.CLOSED
+
+def test_coalesced_follower_gives_up_at_its_own_timeout(fake_groq):
+    config = ScriptedConfig([], latency_ms=800)
+    client = make_client(fake_groq(config))
+    request = dict(model="fake-model", messages=MESSAGES, temperature=0.0, max_tokens=20)
+    results = []
+    leader = threading.Thread(target=lambda: results.append(client.chat.completions.create(**request)))
+    leader.start()
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        client.chat.completions.create(timeout=0.2, **request)
+    assert time.monotonic() - started < 0.5
+
+    leader.join()
+    assert results[0].choices[0].message.content
+    assert len(config.arrivals) == 1
+    stats = client.stats()
+    assert stats['deadline_exceeded'] == 1 and stats['failures'] == 0
+    assert client.flight.stats()['follower_timeouts'] == 1
@@ -0,0 +1,39 @@
+"""Data migrations on a throwaway SQLite database."""
+
+import json
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+from migrations import migrate_training_embeddings
+from models import db
+from retrieval import EMBEDDING_DIM, unpack_embedding
+
+def test_training_embeddings_are_validated_before_the_json_is_dropped(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'mbot.db'}")
+    db.metadata.create_all(engine)
+    good = np.linspace(-1, 1, EMBEDDING_DIM).astype(np.float32)
+    legacy = {
+        'good': json.dumps(good.tolist()),
+        'short': json.dumps([0.5] * (EMBEDDING_DIM - 1)),
+        'nested': json.dumps([[0.5] * EMBEDDING_DIM]),
+        'broken': "[0.1, 0.2",
+        'nan': json.dumps([0.0] * (EMBEDDING_DIM - 1) + ["NaN"]),
+    }
+    with engine.begin() as connection:
+        for name, embedding in legacy.items():
+            connection.execute(text(
+                "INSERT INTO training_data (intent_category, user_input, response_text, emotional_tone, embedding) "
+                "VALUES ('Daily Support', :name, 'ok', 'calm', :embedding)"
+            ), {'name': name, 'embedding': embedding})
+
+    assert migrate_training_embeddings(engine, batch_size=2) == 1
+    assert migrate_training_embeddings(engine) == 0
+
+    with engine.connect() as connection:
+        rows = {row[0]: row[1:] for row in connection.execute(
+            text("SELECT user_input, embedding, embedding_vector FROM training_data"))}
+    assert rows['good'][0] is None
+    assert np.array_equal(unpack_embedding(rows['good'][1]), good)
+    for name in ('short', 'nested', 'broken', 'nan'):
+        assert rows[name] == (legacy[name], None)
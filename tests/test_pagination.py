@@ -0,0 +1,121 @@
+"""Keyset cursors and the paged and delta listings built on them."""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from pagination import decode_cursor, decode_sync_cursor, encode_cursor, sync_cursor
+
+NOW = datetime(2026, 3, 1, 12, 0, 0)
+
+def test_cursor_round_trip_and_rejection():
+    key = (datetime(2026, 3, 1, 11, 59, 58, 123456), 'row-1')
+    assert decode_cursor(encode_cursor('messages', *key), 'messages') == key
+    assert decode_sync_cursor(encode_cursor('messages', *key, horizon=NOW), 'messages') == (key, NOW)
+
+    with pytest.raises(ValueError, match="not 'sessions'"):
+        decode_cursor(encode_cursor('messages', *key), 'sessions')
+    for garbage in ("not-a-cursor", "", encode_cursor('messages', *key)[:-3]):
+        with pytest.raises(ValueError):
+            decode_cursor(garbage, 'messages')
+
+def test_sync_cursor_stays_behind_writes_that_may_not_have_committed():
+    # Newest row is older than the overlap window: resume right after it
+    old = (NOW - timedelta(minutes=5), 'b')
+    assert decode_sync_cursor(sync_cursor('k', old, NOW, 60), 'k') == (old, None)
+
+    # Newest row is inside the window: resume from the window's start
+    recent = (NOW - timedelta(seconds=10), 'b')
+    assert decode_sync_cursor(sync_cursor('k', recent, NOW, 60), 'k') == ((NOW - timedelta(seconds=60), ''), None)
+
+    # Pages of an unfinished delta resume after their last row and keep the first page's horizon
+    first = sync_cursor('k', recent, NOW, 60, has_more=True)
+    assert decode_sync_cursor(first, 'k') == (recent, NOW - timedelta(seconds=60))
+    later = NOW + timedelta(seconds=30)
+    last = sync_cursor('k', (NOW - timedelta(seconds=70), 'c'), later, 60, horizon=NOW - timedelta(seconds=60))
+    assert decode_sync_cursor(last, 'k') == ((NOW - timedelta(seconds=70), 'c'), None)
+    assert decode_sync_cursor(sync_cursor('k', (later, 'd'), later, 60, horizon=NOW - timedelta(seconds=60)),
+                              'k') == ((NOW - timedelta(seconds=60), ''), None)
+    assert sync_cursor('k', None, NOW, 60) is None
+
+# ----------------------------------------------------------------------
+# Against the app
+# ----------------------------------------------------------------------
+
+def signed_up(app_module, email):
+    client = app_module.app.test_client()
+    response = client.post('/api/signup', json={'email': email, 'password': 'secret1', 'name': 'Sam'})
+    headers = {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+    session_id = client.post('/api/chat', json={'message': "hello there"}, headers=headers).get_json()['sessionId']
+    with app_module.app.app_context():
+        user_id = app_module.db.session.get(app_module.ChatSession, session_id).user_id
+    return client, headers, user_id, session_id
+
+def test_rows_with_equal_timestamps_split_across_pages(app_module):
+    client, headers, user_id, session_id = signed_up(app_module, 'paging-ties@example.com')
+    stamp = datetime.utcnow() - timedelta(hours=1)
+    with app_module.app.app_context():
+        for i in range(5):
+            app_module.db.session.add(app_module.ChatMessage(
+                message_id=str(uuid.uuid4()), session_id=session_id, user_id=user_id, sender='user',
+                message_text=f"tied {i}", timestamp=stamp, sentiment_score=0.0
+            ))
+        app_module.db.session.commit()
+        expected = [m.message_id for m in app_module.ChatMessage.query.filter_by(session_id=session_id).order_by(
+            app_module.ChatMessage.timestamp, app_module.ChatMessage.message_id)]
+
+    url = f'/api/session/{session_id}/messages'
+    seen, args = [], {'limit': 2}
+    while True:
+        body = client.get(url, query_string=args, headers=headers).get_json()
+        seen = [m['message_id'] for m in body['messages']] + seen
+        if not body['has_more']:
+            break
+        args = {'limit': 2, 'before': body['next_cursor']}
+    assert seen == expected
+
+    tied = expected[:5]
+    cursor = encode_cursor(app_module.MESSAGE_CURSOR, stamp, tied[0])
+    delta, args = [], {'limit': 2, 'since': cursor}
+    while True:
+        body = client.get(url, query_string=args, headers=headers).get_json()
+        delta += [m['message_id'] for m in body['messages']]
+        if not body['has_more']:
+            break
+        args = {'limit': 2, 'since': body['sync_cursor']}
+    assert delta == expected[1:]
+
+def test_invalid_cursor_is_a_bad_request(app_module):
+    client, headers, user_id, session_id = signed_up(app_module, 'paging-bad@example.com')
+    session_cursor = encode_cursor(app_module.SESSION_CURSOR, datetime.utcnow(), session_id)
+
+    assert client.get(f'/api/sessions/{user_id}', query_string={'since': 'garbage'}, headers=headers).status_code == 400
+    assert client.get(f'/api/session/{session_id}/messages', query_string={'before': session_cursor},
+                      headers=headers).status_code == 400
+
+def test_session_committed_behind_the_cursor_is_in_the_next_delta(app_module):
+    client, headers, user_id, session_id = signed_up(app_module, 'paging-late@example.com')
+    url = f'/api/sessions/{user_id}'
+    cursor = client.get(url, query_string={'limit': 10}, headers=headers).get_json()['sync_cursor']
+
+    # Stamped before the session above, committed after the listing was read
+    late_id = str(uuid.uuid4())
+    with app_module.app.app_context():
+        latest = app_module.db.session.get(app_module.ChatSession, session_id).updated_at
+        app_module.db.session.add(app_module.ChatSession(
+            session_id=late_id, user_id=user_id, status='completed', updated_at=latest - timedelta(seconds=1)
+        ))
+        app_module.db.session.commit()
+
+    body = client.get(url, query_string={'since': cursor}, headers=headers).get_json()
+    assert late_id in [s['session_id'] for s in body['sessions']]
+
+    # Once every change is older than the overlap window, a delta sends nothing again
+    with app_module.app.app_context():
+        app_module.ChatSession.query.filter_by(user_id=user_id).update(
+            {'updated_at': datetime.utcnow() - timedelta(hours=1)}, synchronize_session=False
+        )
+        app_module.db.session.commit()
+    cursor = client.get(url, query_string={'since': body['sync_cursor']}, headers=headers).get_json()['sync_cursor']
+    assert client.get(url, query_string={'since': cursor}, headers=headers).get_json()['sessions'] == []
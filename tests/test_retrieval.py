@@ -0,0 +1,72 @@
+"""VectorIndex top-k search and MinHash LSH neighbours against brute-force answers."""
+
+import random
+
+import numpy as np
+
+from retrieval import (MinHashLSH, VectorIndex, embed_text, jaccard, pack_embedding,
+                       unpack_embedding, word_set)
+
+def random_unit_vectors(count, dim=32, seed=3):
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def test_search_matches_brute_force_with_and_without_partitions():
+    vectors = random_unit_vectors(200)
+    # Interleaved keys, so partitions are not contiguous blocks
+    partitions = ["a" if row % 3 else "b" for row in range(200)]
+    index = VectorIndex(vectors, partitions)
+    query = random_unit_vectors(1, seed=9)[0]
+    scores = vectors @ query
+
+    expected = [int(row) for row in np.argsort(-scores)[:5]]
+    assert [row for row, _ in index.search(query, top_k=5)] == expected
+
+    b_rows = [row for row in np.argsort(-scores) if partitions[row] == "b"][:5]
+    results = index.search(query, top_k=5, partition="b")
+    assert [row for row, _ in results] == [int(row) for row in b_rows]
+    assert np.allclose([score for _, score in results], scores[b_rows])
+
+    assert index.search(query, partition="missing") == []
+    assert len(index.search(query, top_k=500)) == 200
+
+def test_nearest_example_is_the_paraphrase():
+    examples = ["I'm struggling with anxiety", "My partner and I keep arguing", "I want a new job"]
+    index = VectorIndex(np.stack([embed_text(text) for text in examples]))
+
+    (row, score), = index.search(embed_text("struggling with my anxiety lately"), top_k=1)
+    assert row == 0 and score > 0.5
+
+def test_packed_embeddings_round_trip():
+    vector = embed_text("who am I really")
+    assert np.array_equal(unpack_embedding(pack_embedding(vector)), vector)
+    assert unpack_embedding(pack_embedding(vector[:10])) is None
+
+def test_minhash_finds_near_duplicates_within_a_partition():
+    rng = random.Random(5)
+    vocabulary = [f"w{i}" for i in range(300)]
+    sets = [frozenset(rng.sample(vocabulary, 12)) for _ in range(400)]
+    lsh = MinHashLSH(num_perm=64, bands=16, brute_force_limit=0)
+    for row, tokens in enumerate(sets):
+        lsh.add(tokens, partition="even" if row % 2 == 0 else "odd")
+
+    found = 0
+    for row in range(0, 400, 8):
+        # Swap one word: Jaccard 11/13 with the original
+        query = frozenset(sorted(sets[row])[1:]) | {"fresh"}
+        results = lsh.query(query, top_k=3, partition="even")
+        assert all(other % 2 == 0 for other, _ in results)
+        assert results == sorted(results, key=lambda item: (-item[1], item[0]))
+        found += bool(results) and results[0][0] == row
+    assert found >= 48
+
+def test_small_partitions_fall_back_to_exact_search():
+    lsh = MinHashLSH()
+    texts = ["i feel sad today", "work is hard", "my friend called"]
+    for text in texts:
+        lsh.add(word_set(text))
+
+    query = word_set("today i feel hopeful")
+    exact = sorted(((row, jaccard(query, word_set(text))) for row, text in enumerate(texts)),
+                   key=lambda item: (-item[1], item[0]))
+    assert lsh.query(query, top_k=3) == exact
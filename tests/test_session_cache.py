@@ -0,0 +1,146 @@
+"""SessionCache entries and the guarded writes made from a cached session row."""
+
+import uuid
+from datetime import datetime
+
+import pytest
+
+import session_cache as session_cache_module
+from session_cache import SessionCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def row(message_count, session_id='s1'):
+    return {'session_id': session_id, 'message_count': message_count}
+
+def messages(*ids):
+    return [{'message_id': message_id} for message_id in ids]
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(session_cache_module.time, 'monotonic', clock)
+    return clock
+
+def test_entry_is_served_until_its_check_interval(clock):
+    cache = SessionCache(window=3, check_interval=30)
+    cache.store('u1', row(4), messages('a', 'b', 'c', 'd'), verified=True)
+
+    entry = cache.get('u1')
+    assert [m['message_id'] for m in entry.messages] == ['b', 'c', 'd']
+    # Storing a turn from the cached row keeps the old check time
+    clock.now += 20
+    cache.store('u1', row(6), messages('c', 'd', 'e', 'f'), verified=False)
+    clock.now += 11
+    assert cache.get('u1') is None
+    assert cache.stats()['expired'] == 1
+
+def test_verify_compares_count_and_latest_ids(clock):
+    cache = SessionCache(window=2)
+    cache.store('u1', row(4), messages('c', 'd'), verified=True)
+
+    assert cache.verify('u1', row(4), messages('a', 'b', 'c', 'd')) is True
+    assert cache.verify('u1', row(5), messages('a', 'b', 'c', 'd', 'e')) is False
+    assert cache.verify('u1', row(4, session_id='s2'), messages('c', 'd')) is False
+    assert cache.verify('nobody', row(0), []) is True
+    stats = cache.stats()
+    assert stats['verified'] == 3 and stats['mismatches'] == 2
+
+def test_conflict_drops_the_entry(clock):
+    cache = SessionCache()
+    cache.store('u1', row(2), messages('a', 'b'), verified=True)
+    cache.conflict('u1')
+    assert cache.get('u1') is None
+    assert cache.stats()['conflicts'] == 1
+
+# ----------------------------------------------------------------------
+# Against the app
+# ----------------------------------------------------------------------
+
+def signed_up(app_module, email):
+    client = app_module.app.test_client()
+    response = client.post('/api/signup', json={'email': email, 'password': 'secret1', 'name': 'Sam'})
+    return client, {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+def chat(client, headers, message):
+    response = client.post('/api/chat', json={'message': message}, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()['sessionId']
+
+def cached_copy(app_module, session_id):
+    """A detached ChatSession rebuilt from the row, as a cached turn builds it."""
+    from session_cache import session_row
+
+    chat_session = app_module.db.session.get(app_module.ChatSession, session_id)
+    copy = app_module.ChatSession(**session_row(chat_session))
+    app_module.db.session.expunge_all()
+    return copy
+
+def new_message(copy, sender='user'):
+    from models import ChatMessage
+
+    return ChatMessage(message_id=str(uuid.uuid4()), session_id=copy.session_id, user_id=copy.user_id, sender=sender,
+                       message_text="racing turn", timestamp=datetime.utcnow(), sentiment_score=0.2)
+
+def test_two_writers_from_one_cached_row_one_conflicts(app_module):
+    client, headers = signed_up(app_module, 'cache-race@example.com')
+    session_id = chat(client, headers, "hello there")
+
+    with app_module.app.app_context():
+        first, second = cached_copy(app_module, session_id), cached_copy(app_module, session_id)
+        assert app_module.persist_cached_session(first, [new_message(first), new_message(first, 'M')]) is True
+        app_module.db.session.commit()
+        assert app_module.persist_cached_session(second, [new_message(second)]) is False
+        app_module.db.session.rollback()
+        assert app_module.db.session.get(app_module.ChatSession, session_id).message_count == 4
+
+def test_cached_turn_does_not_revert_a_rename(app_module):
+    client, headers = signed_up(app_module, 'cache-rename@example.com')
+    session_id = chat(client, headers, "hello there")
+
+    with app_module.app.app_context():
+        copy = cached_copy(app_module, session_id)
+        assert client.post(f'/api/session/{session_id}/rename', json={'title': 'Renamed'},
+                           headers=headers).status_code == 200
+        assert app_module.persist_cached_session(copy, [new_message(copy)]) is True
+        app_module.db.session.commit()
+        assert app_module.db.session.get(app_module.ChatSession, session_id).title == 'Renamed'
+
+        # An auto-title from a cached untitled row only lands on a still-untitled row
+        untitled = cached_copy(app_module, session_id)
+        untitled.title = "auto title"
+        assert app_module.persist_cached_session(untitled, [new_message(untitled)], titled=True) is False
+        app_module.db.session.rollback()
+
+def test_write_from_elsewhere_makes_the_next_cached_turn_rebuild(app_module):
+    client, headers = signed_up(app_module, 'cache-rebuild@example.com')
+    cache = app_module.session_cache
+    session_id = chat(client, headers, "I feel anxious today")
+    with app_module.app.app_context():
+        user_id = app_module.db.session.get(app_module.ChatSession, session_id).user_id
+
+    # Served from the cache: the user message carries the same vector enrichment stores
+    chat(client, headers, "still anxious")
+    entry = cache.get(user_id)
+    assert entry is not None
+    assert all(m['emotion_vector'] for m in entry.messages if m['sender'] == 'user')
+    assert all(m['emotion_vector'] is None for m in entry.messages if m['sender'] == 'M')
+
+    # Another process stores a message: the cached row's message_count is now stale
+    conflicts = cache.stats()['conflicts']
+    app_module.store_message({'message_id': str(uuid.uuid4()), 'session_id': session_id, 'user_id': user_id,
+                              'sender': 'user', 'message_text': "from elsewhere", 'timestamp': datetime.utcnow(),
+                              'sentiment_score': 0.0})
+    # ... whose invalidation never reaches this process
+    cache.store(user_id, entry.row, entry.messages, verified=True)
+    assert chat(client, headers, "and again") == session_id
+    assert cache.stats()['conflicts'] == conflicts + 1
+
+    with app_module.app.app_context():
+        stored = app_module.ChatMessage.query.filter_by(session_id=session_id).count()
+        assert app_module.db.session.get(app_module.ChatSession, session_id).message_count == stored == 7
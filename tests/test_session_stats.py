@@ -0,0 +1,60 @@
+"""Running session statistics under concurrent message inserts."""
+
+import threading
+import uuid
+from datetime import datetime
+
+from session_stats import KeywordSketch
+
+def started_session(app_module, email):
+    """Session id of a fresh user's first /api/chat turn (two stored messages)."""
+    client = app_module.app.test_client()
+    response = client.post('/api/signup', json={'email': email, 'password': 'secret1', 'name': 'Sam'})
+    headers = {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+    response = client.post('/api/chat', json={'message': "Hello there"}, headers=headers)
+    body = response.get_json()
+    return body['sessionId']
+
+def user_message(app_module, session_id, text, sentiment=0.5):
+    with app_module.app.app_context():
+        user_id = app_module.db.session.get(app_module.ChatSession, session_id).user_id
+    return {'message_id': str(uuid.uuid4()), 'session_id': session_id, 'user_id': user_id, 'sender': 'user',
+            'message_text': text, 'timestamp': datetime.utcnow(), 'sentiment_score': sentiment}
+
+def session_stats(app_module, session_id):
+    with app_module.app.app_context():
+        chat_session = app_module.db.session.get(app_module.ChatSession, session_id)
+        stored = app_module.ChatMessage.query.filter_by(session_id=session_id).count()
+        return chat_session.message_count, chat_session.sentiment_count, chat_session.keyword_sketch, stored
+
+def test_concurrent_inserts_are_all_counted(app_module):
+    session_id = started_session(app_module, 'stats-race@example.com')
+    before, sentiment_before, _, _ = session_stats(app_module, session_id)
+    payloads = [user_message(app_module, session_id, f"feeling grateful number{i}") for i in range(20)]
+    barrier = threading.Barrier(len(payloads))
+
+    def store(payload):
+        barrier.wait()
+        app_module.store_message(payload)
+
+    threads = [threading.Thread(target=store, args=(payload,)) for payload in payloads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    count, sentiment_count, sketch, stored = session_stats(app_module, session_id)
+    assert count == before + 20 == stored
+    assert sentiment_count == sentiment_before + 20
+    assert KeywordSketch.loads(sketch).counts['grateful'] == 20
+
+def test_session_without_statistics_is_rebuilt_once(app_module):
+    session_id = started_session(app_module, 'stats-legacy@example.com')
+    with app_module.app.app_context():
+        app_module.ChatSession.query.filter_by(session_id=session_id).update({'message_count': None})
+        app_module.db.session.commit()
+
+    app_module.store_message(user_message(app_module, session_id, "another message"))
+
+    count, _, _, stored = session_stats(app_module, session_id)
+    assert count == stored == 3
@@ -0,0 +1,90 @@
+"""TrainingStore hot reload: new snapshots are swapped in whole, broken sources keep the old one."""
+
+import json
+import os
+import threading
+
+from training_store import DEFAULT_DATA_PATH, TrainingStore
+
+def write_data(path, marker):
+    """The shipped training data plus one intent keyword ``marker`` for Daily Support."""
+    with open(DEFAULT_DATA_PATH, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    records = [json.loads(line) for line in lines if line.strip()]
+    for record in records:
+        if record["kind"] == "intent" and record["label"] == "Daily Support":
+            record["keywords"] = [keyword for keyword in record["keywords"] if not keyword.startswith("marker")]
+            record["keywords"].append(marker)
+    path.write_text("\n".join(json.dumps(record) for record in records) + "\n", encoding='utf-8')
+
+def test_reload_swaps_in_a_new_snapshot_and_leaves_the_old_one_intact(tmp_path):
+    path = tmp_path / "training_data.jsonl"
+    write_data(path, "markerone")
+    store = TrainingStore(str(path))
+    old = store.snapshot
+
+    assert store.reload() is False  # unchanged sources
+    write_data(path, "markertwotwo")
+    assert store.reload() is True
+
+    new = store.snapshot
+    assert new is not old and store.reloads == 2
+    assert old.lexicon.match("markerone").terms("intent", "Daily Support") == ["markerone"]
+    assert old.lexicon.match("markertwotwo").group("intent") == {}
+    assert new.lexicon.match("markertwotwo").terms("intent", "Daily Support") == ["markertwotwo"]
+    assert "markerone" not in new.intent_keywords["Daily Support"]
+
+def test_broken_sources_keep_the_previous_snapshot(tmp_path):
+    path = tmp_path / "training_data.jsonl"
+    write_data(path, "markerone")
+    store = TrainingStore(str(path))
+    good = store.snapshot
+
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("{not json\n")
+    assert store.reload() is False
+    assert store.snapshot is good and store.last_error
+
+    write_data(path, "markerthree")
+    assert store.reload() is True and store.last_error is None
+
+def test_table_version_change_triggers_reload(tmp_path):
+    path = tmp_path / "training_data.jsonl"
+    write_data(path, "markerone")
+    version = [1]
+    store = TrainingStore(str(path), load_rows=lambda: (), rows_version=lambda: version[0])
+
+    assert store.reload() is False
+    version[0] = 2
+    assert store.reload() is True
+
+def test_readers_never_see_a_mixed_snapshot(tmp_path):
+    path = tmp_path / "training_data.jsonl"
+    write_data(path, "marker0")
+    store = TrainingStore(str(path))
+    stop = threading.Event()
+    mixed = []
+
+    def read():
+        while not stop.is_set():
+            snapshot = store.snapshot
+            marker = snapshot.intent_keywords["Daily Support"][-1]
+            # The lexicon must come from the same version as the keyword table
+            if snapshot.lexicon.match(marker).terms("intent", "Daily Support") != [marker]:
+                mixed.append(marker)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        for i in range(1, 30):
+            write_data(path, "marker" + "x" * i)
+            os.utime(path, ns=(i * 10**9, i * 10**9))
+            assert store.reload() is True
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+
+    assert mixed == []
+    assert store.snapshot.intent_keywords["Daily Support"][-1] == "marker" + "x" * 29
@@ -0,0 +1,392 @@
+"""
+Training data and keyword lexicon store for M-bot.
+
+Emotion/intent/topic keywords, response tones and RAG examples live in a JSONL file
+(``training_data.jsonl``) and, optionally, the ``training_data`` table. They are
+compiled once into an immutable ``KnowledgeBase`` snapshot: the keyword lexicon,
+the emotion term matrix and the example retrieval indexes are all built at load
+time. ``TrainingStore`` holds the current snapshot and swaps in a freshly built one
+when the sources change, so readers always see one consistent version.
+
+JSONL records carry a ``kind``:
+    {"kind": "emotion" | "subtle_emotion" | "intent" | "topic" | "fallback_topic", "label": ..., "keywords": [...]}
+    {"kind": "tone", "label": ...}
+    {"kind": "example", "intent_category": ..., "user_input": ..., "response_variations": [...], "context_tags": [...]}
+"""
+
+import os
+import json
+import zlib
+import hashlib
+import time
+import logging
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from lexicon import LexiconMatcher, BatchTermMatcher
+from retrieval import VectorIndex, MinHashLSH, EMBEDDING_DIM, embed_text, unpack_embedding, word_set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'training_data.jsonl')
+
+_KEYWORD_KINDS = {
+    "emotion": "emotion_keywords",
+    "subtle_emotion": "subtle_emotion_keywords",
+    "intent": "intent_keywords",
+    "topic": "topic_keywords",
+    "fallback_topic": "fallback_topic_keywords"
+}
+
+def read_records(path: str) -> Dict[str, Any]:
+    """Parse a training data JSONL file into keyword tables, tones and examples."""
+    data = {field: {} for field in _KEYWORD_KINDS.values()}
+    data.update(intent_categories=[], response_tones=[], training_data=[])
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON ({e})")
+
+            kind = record.get("kind")
+            if kind in _KEYWORD_KINDS:
+                data[_KEYWORD_KINDS[kind]][record["label"]] = list(record.get("keywords", []))
+                if kind == "intent":
+                    data["intent_categories"].append(record["label"])
+            elif kind == "tone":
+                data["response_tones"].append(record["label"])
+            elif kind == "example":
+                data["training_data"].append({key: value for key, value in record.items() if key != "kind"})
+            else:
+                raise ValueError(f"{path}:{line_number}: unknown record kind {kind!r}")
+
+    # Intents without keyword hints are categories only
+    data["intent_keywords"] = {intent: keywords for intent, keywords in data["intent_keywords"].items() if keywords}
+    return data
+
+def _freeze(table: Mapping[str, Sequence[str]]) -> Mapping[str, Tuple[str, ...]]:
+    return MappingProxyType({label: tuple(terms) for label, terms in table.items()})
+
+class KnowledgeBase:
+    """
+    Immutable, fully compiled snapshot of the keyword tables and RAG examples.
+
+    Everything derived from the data (lexicon, emotion term matrix, retrieval
+    indexes) is built in the constructor, so a snapshot is ready to serve as soon
+    as it exists and never changes afterwards.
+    """
+
+    def __init__(self, data: Dict[str, Any], rows: Sequence[Any] = (), version: Any = None,
+                 retrieval_backend: str = "vector", minhash_permutations: int = 64, minhash_bands: int = 16,
+                 embedding_snapshot_dir: Optional[str] = None):
+        """
+        Args:
+            data: Output of ``read_records``.
+            rows: ``TrainingData``-like rows added to the example library; rows sharing
+                an intent and user input become one example with several variations.
+            version: Opaque marker of the sources this snapshot was built from.
+            embedding_snapshot_dir: Where the example embedding matrix is exported as a
+                memory-mappable ``.npy`` (None keeps it in process memory).
+        """
+        self.version = version
+        self.loaded_at = time.time()
+        self.retrieval_backend = retrieval_backend
+
+        self.emotion_keywords = _freeze(data["emotion_keywords"])
+        self.subtle_emotion_keywords = _freeze(data["subtle_emotion_keywords"])
+        self.intent_keywords = _freeze(data["intent_keywords"])
+        self.topic_keywords = _freeze(data["topic_keywords"])
+        self.fallback_topic_keywords = _freeze(data["fallback_topic_keywords"])
+        self.intent_categories = tuple(data["intent_categories"])
+        self.response_tones = tuple(data["response_tones"])
+        self.training_data = tuple(data["training_data"])
+
+        self.lexicon = LexiconMatcher({
+            "emotion": self.emotion_keywords,
+            "subtle": self.subtle_emotion_keywords,
+            "intent": self.intent_keywords,
+            "topic": self.topic_keywords,
+            "fallback": self.fallback_topic_keywords
+        })
+        self._build_emotion_term_matrix()
+
+        examples, sources = self._process_examples(rows)
+        vectors, self.computed_embeddings = self._load_embeddings(examples, sources, embedding_snapshot_dir)
+        self.processed_examples = tuple(examples)
+        partitions = [example["intent"] for example in examples]
+        self.example_index = VectorIndex(vectors, partitions)
+        self.example_minhash = None
+        if retrieval_backend == "minhash":
+            self.example_minhash = MinHashLSH(num_perm=minhash_permutations, bands=minhash_bands)
+            for example in examples:
+                self.example_minhash.add(word_set(example["user_input"]), example["intent"])
+
+    def _build_emotion_term_matrix(self) -> None:
+        """Precompute the lexicon-term x emotion weight matrices used for batch scoring."""
+        self.emotion_labels = tuple(self.emotion_keywords) + ("neutral",)
+        # Identifies the label order of stored emotion vectors
+        self.emotion_labels_checksum = zlib.crc32(",".join(self.emotion_labels).encode('utf-8'))
+        terms, term_index = [], {}
+        for keywords in list(self.emotion_keywords.values()) + list(self.subtle_emotion_keywords.values()):
+            for keyword in keywords:
+                if keyword not in term_index:
+                    term_index[keyword] = len(terms)
+                    terms.append(keyword)
+        self.emotion_terms = tuple(terms)
+        self.emotion_term_matcher = BatchTermMatcher(terms)
+
+        n_terms, n_labels = len(terms), len(self.emotion_labels)
+        self.emotion_weights = np.zeros((n_terms, n_labels))
+        self.subtle_weights = np.zeros((n_terms, n_labels))
+        for column, emotion in enumerate(self.emotion_labels[:-1]):
+            for keyword in self.emotion_keywords[emotion]:
+                # Same weighting as detect_emotion: multi-word keywords count more
+                weight = len(keyword.split()) * 1.2 if len(keyword.split()) > 1 else 1.0
+                self.emotion_weights[term_index[keyword], column] = weight
+            for keyword in self.subtle_emotion_keywords.get(emotion, ()):
+                self.subtle_weights[term_index[keyword], column] = 1.0
+        self.emotion_weights.flags.writeable = False
+        self.subtle_weights.flags.writeable = False
+
+    def _process_examples(self, rows: Sequence[Any]) -> Tuple[List[Dict], List[Optional[List[Any]]]]:
+        """Flatten file examples and table rows into RAG examples, grouped by intent."""
+        examples, sources = [], []
+
+        for example in self.training_data:
+            examples.append({
+                "intent": example["intent_category"],
+                "user_input": example["user_input"],
+                "responses": [v["text"] for v in example["response_variations"]],
+                "tones": [v["emotional_tone"] for v in example["response_variations"]],
+                "user_variables": [v.get("user_variables", []) for v in example["response_variations"]],
+                "tags": example.get("context_tags", [])
+            })
+            sources.append(None)
+
+        groups: Dict[Tuple[str, str], List[Any]] = {}
+        for row in rows:
+            groups.setdefault((row.intent_category, row.user_input), []).append(row)
+
+        for (intent, user_input), group in groups.items():
+            try:
+                tags = json.loads(group[0].context_tags) if group[0].context_tags else []
+            except (ValueError, TypeError):
+                tags = []
+            examples.append({
+                "intent": intent,
+                "user_input": user_input,
+                "responses": [row.response_text for row in group],
+                "tones": [row.emotional_tone for row in group],
+                "user_variables": [[] for _ in group],
+                "tags": tags
+            })
+            sources.append(group)
+
+        # Keep each intent's examples adjacent so index partitions are views, not copies
+        order = sorted(range(len(examples)), key=lambda i: examples[i]["intent"])
+        return [examples[i] for i in order], [sources[i] for i in order]
+
+    @staticmethod
+    def _stored_vector(group: List[Any]) -> Optional[np.ndarray]:
+        """Embedding stored on a group of rows: packed blob first, then legacy JSON."""
+        for row in group:
+            vector = unpack_embedding(getattr(row, 'embedding_vector', None))
+            if vector is not None:
+                return vector
+        for row in group:
+            if row.embedding:
+                try:
+                    vector = np.asarray(json.loads(row.embedding), dtype=np.float32)
+                except (ValueError, TypeError):
+                    continue
+                if vector.shape == (EMBEDDING_DIM,):
+                    return vector
+        return None
+
+    def _load_embeddings(self, examples: List[Dict], sources: List[Optional[List[Any]]],
+                         snapshot_dir: Optional[str]) -> Tuple[np.ndarray, List[Tuple[Any, np.ndarray]]]:
+        """
+        Embedding matrix for ``examples`` plus (row, vector) pairs for rows missing a stored one.
+
+        With ``snapshot_dir`` the matrix is exported once as ``embeddings-<key>.npy``
+        (the key hashes the example texts) and memory-mapped read-only, so every
+        worker process shares one page-cache copy instead of parsing its own.
+        """
+        snapshot_path = None
+        if snapshot_dir:
+            digest = hashlib.sha1(f"{EMBEDDING_DIM}".encode('utf-8'))
+            for example in examples:
+                digest.update(f"\x00{example['intent']}\x00{example['user_input']}".encode('utf-8'))
+            snapshot_path = os.path.join(snapshot_dir, f"embeddings-{digest.hexdigest()[:16]}.npy")
+
+        matrix = None
+        if snapshot_path and os.path.exists(snapshot_path):
+            try:
+                matrix = np.load(snapshot_path, mmap_mode='r')
+                if matrix.shape != (len(examples), EMBEDDING_DIM) or matrix.dtype != np.float32:
+                    matrix = None
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable embedding snapshot {snapshot_path}: {str(e)}")
+                matrix = None
+
+        computed = []
+        if matrix is None:
+            matrix = np.zeros((len(examples), EMBEDDING_DIM), dtype=np.float32)
+            for i, (example, group) in enumerate(zip(examples, sources)):
+                vector = self._stored_vector(group) if group else None
+                if vector is None:
+                    vector = embed_text(example["user_input"])
+                    if group:
+                        computed.extend((row, vector) for row in group)
+                matrix[i] = vector
+            if snapshot_path:
+                matrix = self._export_snapshot(matrix, snapshot_path)
+        else:
+            for i, group in enumerate(sources):
+                if group:
+                    computed.extend((row, matrix[i]) for row in group if getattr(row, 'embedding_vector', None) is None)
+
+        return matrix, computed
+
+    @staticmethod
+    def _export_snapshot(matrix: np.ndarray, snapshot_path: str) -> np.ndarray:
+        """Atomically write ``matrix`` as ``.npy``, drop stale snapshots and return a read-only memory map."""
+        try:
+            directory = os.path.dirname(snapshot_path)
+            os.makedirs(directory, exist_ok=True)
+            temporary = f"{snapshot_path}.{os.getpid()}.tmp"
+            with open(temporary, 'wb') as f:
+                np.save(f, matrix)
+            os.replace(temporary, snapshot_path)
+            for name in os.listdir(directory):
+                if name.startswith('embeddings-') and name.endswith('.npy') and name != os.path.basename(snapshot_path):
+                    os.remove(os.path.join(directory, name))
+            return np.load(snapshot_path, mmap_mode='r')
+        except OSError as e:
+            logger.warning(f"Could not export embedding snapshot: {str(e)}")
+            return matrix
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'examples': len(self.processed_examples),
+            'intents': len(self.intent_categories),
+            'emotions': len(self.emotion_keywords),
+            'retrieval_backend': self.retrieval_backend,
+            'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.loaded_at))
+        }
+
+class TrainingStore:
+    """
+    Holds the current ``KnowledgeBase`` and rebuilds it when its sources change.
+
+    The file source is versioned by its mtime and size; the optional table source by
+    whatever ``rows_version`` returns (e.g. row count, max id and last update). A
+    reload builds the new snapshot completely before publishing it with a single
+    reference swap, so concurrent readers see either the old or the new snapshot,
+    never a mix. If the new data fails to load, the previous snapshot stays in place.
+    """
+
+    def __init__(self, path: str = DEFAULT_DATA_PATH,
+                 load_rows: Optional[Callable[[], Sequence[Any]]] = None,
+                 rows_version: Optional[Callable[[], Any]] = None,
+                 save_embeddings: Optional[Callable[[List[Tuple[Any, np.ndarray]]], None]] = None,
+                 retrieval_backend: str = "vector", minhash_permutations: int = 64, minhash_bands: int = 16,
+                 embedding_snapshot_dir: Optional[str] = None):
+        """
+        Args:
+            path: JSONL file with the keyword tables and built-in examples.
+            load_rows: Returns ``TrainingData`` rows to add to the example library.
+            rows_version: Cheap fingerprint of the table; a change triggers a reload.
+            save_embeddings: Persists (row, embedding) pairs for rows without a stored
+                packed embedding.
+            embedding_snapshot_dir: Directory for the shared memory-mapped embedding matrix.
+        """
+        self.path = path
+        self.load_rows = load_rows
+        self.rows_version = rows_version
+        self.save_embeddings = save_embeddings
+        self.index_options = dict(retrieval_backend=retrieval_backend, minhash_permutations=minhash_permutations,
+                                  minhash_bands=minhash_bands, embedding_snapshot_dir=embedding_snapshot_dir)
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self._failed_version = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._snapshot: Optional[KnowledgeBase] = None
+        self.reload(force=True)
+        if self._snapshot is None:
+            raise RuntimeError(f"Could not load training data: {self.last_error}")
+
+    @property
+    def snapshot(self) -> KnowledgeBase:
+        """The current snapshot; hold on to it for the duration of one unit of work."""
+        return self._snapshot
+
+    def _source_version(self) -> Tuple:
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size), self.rows_version() if self.rows_version else None
+
+    def reload(self, force: bool = False) -> bool:
+        """Rebuild the snapshot if the sources changed (or ``force``); returns True if swapped."""
+        with self._reload_lock:
+            version = None
+            try:
+                version = self._source_version()
+                if not force and self._snapshot is not None and version in (self._snapshot.version, self._failed_version):
+                    return False
+
+                start = time.perf_counter()
+                data = read_records(self.path)
+                rows = self.load_rows() if self.load_rows else ()
+                snapshot = KnowledgeBase(data, rows, version=version, **self.index_options)
+            except Exception as e:
+                self.last_error = str(e)
+                # Don't retry (and re-log) the same broken sources on every check
+                self._failed_version = version
+                logger.error(f"Failed to reload training data: {str(e)}")
+                return False
+
+            self._snapshot = snapshot
+            self.reloads += 1
+            self.last_error = None
+            self._failed_version = None
+            logger.info(f"Loaded training data: {len(snapshot.processed_examples)} examples "
+                        f"({len(rows)} table rows, {len(snapshot.computed_embeddings)} embeddings computed) "
+                        f"in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+            if snapshot.computed_embeddings and self.save_embeddings:
+                try:
+                    self.save_embeddings(snapshot.computed_embeddings)
+                except Exception as e:
+                    logger.error(f"Failed to save training embeddings: {str(e)}")
+            return True
+
+    def start_watching(self, interval: float = 30.0) -> None:
+        """Check the sources every ``interval`` seconds in a daemon thread and reload on change."""
+        if self._watcher or interval <= 0:
+            return
+
+        def watch():
+            while not self._stop.wait(interval):
+                self.reload()
+
+        self._watcher = threading.Thread(target=watch, name='training-store-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot summary for health endpoints."""
+        stats = self.snapshot.stats()
+        stats.update(reloads=self.reloads, last_error=self.last_error)
+        return stats